@@ -1,31 +1,106 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask, Request, render_template, redirect, url_for, flash, request, jsonify, Response, \
+    stream_with_context, abort, g, current_app
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
-from models.database import db, Usuario, Produto, MovimentacaoEstoque, Categoria
-from forms import LoginForm, RegisterForm, ProdutoForm, MovimentacaoForm
+from models.database import db, Usuario, Produto, MovimentacaoEstoque, Tarefa
+from forms import LoginForm, RegisterForm, ProdutoForm, MovimentacaoForm, ImportacaoProdutosForm
+from services.movimentacoes import registrar_movimentacao, registrar_lote, verificar_concorrencia, \
+    MovimentacaoError
+from services.importacao import importar_produtos, ImportacaoError
+from services.tarefas import enfileirar, salvar_arquivo, cancelar_tarefa, tarefa_para_dict, listar_tarefas, \
+    fila_parada, iniciar_trabalhadores, descricao_tarefa, MANUTENCOES, ENCERRADAS
+from services.exportacao import exportar_movimentacoes, exportar_produtos, FORMATOS
+from services.filtros import filtros_movimentacao, condicoes_movimentacao, filtros_produto, condicoes_produto
+from services.listagens import pagina_produtos, pagina_movimentacoes, listar_alertas, linha_produto
+from services.categorias import indice_categorias, nome_categoria, obter_categoria_id, mapear_categorias
+from services.busca import sugerir_produtos, opcao_produto, sugestoes_cache, SUGESTOES_PADRAO
+from services.paginacao import CursorInvalidoError
+from services.sincronizacao import alteracoes_desde, CursorSincronizacaoError, LIMITE_PADRAO as SYNC_LIMITE
+from services.cache import cache, versao_atual
+from services.cache_http import condicional
+from services.eventos import hub, publicar, evento_alerta, eventos_desde, fluxo_eventos
+from services.resumo import painel_dashboard, reconstruir_resumo, divergencias_resumo
+from services.alertas import contar_alertas, divergencias_alerta, corrigir_alertas
+from services.historico import gerar_snapshots, reconstruir_snapshots, estoque_em, \
+    serie_produto, serie_geral, periodo_consulta, ultimo_fechamento, HistoricoError
+from services.analise import recalcular_analises, consultar_analises, resumo_abc, versao_analises, \
+    AnaliseError, JANELA_PADRAO, ORDENACOES
+from services.desempenho import desempenho, instalar as instalar_desempenho, LIMITE_N1
+from services.sessao import usuarios_cache, TTL_PADRAO as USUARIOS_CACHE_TTL
+from services.tokens import tokens_cache, token_da_requisicao, digest_token, escopo_exigido, criar_token, \
+    revogar_token, listar_tokens, TokenError, ESCOPOS
+from services.reposicao import recalcular_reposicao, recomendacoes_pendentes, contar_pendentes, \
+    aplicar_recomendacoes, ReposicaoError, PRAZO_PADRAO, NIVEL_SERVICO_PADRAO
+from services.arquivo import arquivar_movimentacoes, particoes, ArquivoError, MESES_QUENTES_PADRAO
+from models.esquema import atualizar_esquema, reindexar_busca
+from models.conexao import iniciar_banco, verificar_banco
 import os
+import click
 from datetime import datetime
 from functools import wraps
+from sqlalchemy import func
 
-def create_app():
-    """Factory function para criar a aplicação Flask"""
+# Rotas de upload de catálogo: aceitam arquivos até IMPORTACAO_MAX_MB em vez de MAX_CONTENT_LENGTH
+ROTAS_IMPORTACAO = {'/produtos/importar'}
+IMPORTACAO_MAX_MB = 1024
+
+class Requisicao(Request):
+    """Request com limite de tamanho próprio para o upload do catálogo (gravado em disco, não em memória)"""
+    @property
+    def max_content_length(self):
+        if self.url_rule is not None and self.url_rule.rule in ROTAS_IMPORTACAO:
+            return current_app.config['IMPORTACAO_MAX_BYTES']
+        return super().max_content_length
+
+def create_app(config=None):
+    """Factory function para criar a aplicação Flask
+
+    `config` sobrepõe a configuração lida do ambiente (ex.: o banco temporário
+    do teste de estresse).
+    """
     app = Flask(__name__)
+    app.request_class = Requisicao
     
     # Configurações básicas
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///estoque.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
     app.config['UPLOAD_FOLDER'] = 'static/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['IMPORTACAO_MAX_BYTES'] = int(os.environ.get('IMPORTACAO_MAX_MB', IMPORTACAO_MAX_MB)) * 1024 * 1024
+    app.config.update(config or {})
+    
+    # Medição de consultas e tempos por request (/admin/desempenho e /api/metricas)
+    app.config['DESEMPENHO_ATIVO'] = os.environ.get('DESEMPENHO_ATIVO', '1') != '0'
     
-    # Inicializa extensões
-    db.init_app(app)
+    # Segundos em que os dados do usuário logado ficam em cache em cada processo
+    app.config['USUARIOS_CACHE_TTL'] = int(os.environ.get('USUARIOS_CACHE_TTL', USUARIOS_CACHE_TTL))
     
-    # Configuração do CSRF Protection
+    # Cálculo do estoque mínimo recomendado (ponto de pedido)
+    app.config['REPOSICAO_PRAZO_DIAS'] = int(os.environ.get('REPOSICAO_PRAZO_DIAS', PRAZO_PADRAO))
+    app.config['REPOSICAO_NIVEL_SERVICO'] = float(os.environ.get('REPOSICAO_NIVEL_SERVICO', NIVEL_SERVICO_PADRAO))
+    
+    # Meses completos de movimentações mantidos na tabela quente antes do arquivamento
+    app.config['ARQUIVO_MESES_QUENTES'] = int(os.environ.get('ARQUIVO_MESES_QUENTES', MESES_QUENTES_PADRAO))
+    
+    # Inicializa extensões; URI, pool e pragmas do banco vêm do ambiente (models/conexao.py)
+    iniciar_banco(app)
+    with app.app_context():
+        try:
+            app.logger.info('Banco de dados: %s', verificar_banco())
+        except Exception as e:
+            app.logger.error('Banco de dados indisponível na inicialização: %s', e)
+    
+    # Registrada antes dos demais hooks para medir o request inteiro
+    if app.config['DESEMPENHO_ATIVO']:
+        instalar_desempenho(app)
+    
+    # Configuração do CSRF Protection; a verificação é feita em autenticar_api, que
+    # dispensa os requests autenticados por token (sem cookie, não há o que forjar)
     csrf = CSRFProtect(app)
+    app.config['WTF_CSRF_CHECK_DEFAULT'] = False
     
     # Configuração do Flask-Login
     login_manager = LoginManager()
@@ -34,9 +109,34 @@ def create_app():
     login_manager.login_message = 'Por favor, faça login para acessar esta página.'
     login_manager.login_message_category = 'info'
     
+    # Identidade do usuário em cache (TTL curto): requests autenticados não consultam a tabela usuarios
+    usuarios_cache.ttl = tokens_cache.ttl = app.config['USUARIOS_CACHE_TTL']
+    
     @login_manager.user_loader
     def load_user(user_id):
-        return Usuario.query.get(int(user_id))
+        return g.get('cliente_api') or usuarios_cache.obter(int(user_id))
+    
+    @login_manager.request_loader
+    def load_user_from_request(request):
+        return g.get('cliente_api')
+    
+    @app.before_request
+    def autenticar_api():
+        """Token Bearer nas rotas /api (sem sessão nem CSRF); demais requests passam pelo CSRF"""
+        token = token_da_requisicao(request)
+        if token is None:
+            if app.config['WTF_CSRF_ENABLED'] and request.endpoint and \
+                    request.method in app.config['WTF_CSRF_METHODS']:
+                csrf.protect()
+            return None
+        
+        cliente = tokens_cache.obter(digest_token(token))
+        if cliente is None:
+            return jsonify({'erro': 'Token inválido ou revogado.'}), 401
+        if not cliente.permite(escopo_exigido(request)):
+            return jsonify({'erro': 'O token não tem permissão para esta operação.'}), 403
+        g.cliente_api = cliente
+        return None
     
     # Decorator para verificar se usuário é admin
     def admin_required(f):
@@ -48,6 +148,42 @@ def create_app():
             return f(*args, **kwargs)
         return decorated_function
     
+    def admin_ou_escopo(escopo):
+        """True para administradores e para tokens de API que tenham o `escopo`"""
+        cliente = g.get('cliente_api')
+        return current_user.is_admin() or (cliente is not None and cliente.permite(escopo))
+    
+    # Filtros preenchidos, para montar links de paginação e exportação
+    def filtros_ativos(filtros):
+        return {chave: valor for chave, valor in filtros.items() if valor}
+    
+    # Validadores das respostas condicionais (ETag): versão global do estoque para
+    # coleções e versão da linha para um produto, ambos lidos por chave primária
+    def versao_colecao(**kwargs):
+        return (request.full_path, versao_atual())
+    
+    def versao_produto(id):
+        versao = db.session.query(Produto.versao).filter(Produto.id == id).scalar()
+        return None if versao is None else ('produto', id, versao)
+    
+    # Séries históricas: o período padrão termina hoje, então a data também entra na versão
+    def versao_historico(**kwargs):
+        return versao_colecao() + (datetime.utcnow().date(),)
+    
+    # Relatórios também mudam quando as análises são recalculadas
+    def versao_relatorios(**kwargs):
+        return versao_colecao() + (versao_analises(),)
+    
+    def modificacao_produto(id):
+        return db.session.query(func.coalesce(Produto.atualizado_em, Produto.data_cadastro))\
+            .filter(Produto.id == id).scalar()
+    
+    # Evento de entrada/saída do alerta após editar ou excluir um produto;
+    # o flush atualiza o resumo antes de ler o total de alertas
+    def publicar_alerta(produto):
+        db.session.flush()
+        publicar([evento_alerta(produto.id, produto.em_alerta, produto.quantidade)])
+    
     # Função helper para arquivos permitidos
     def allowed_file(filename):
         return '.' in filename and \
@@ -64,32 +200,12 @@ def create_app():
     
     @app.route('/dashboard')
     @login_required
+    @condicional(versao_colecao, html=True)
     def dashboard():
         """Dashboard principal do sistema"""
-        # Estatísticas gerais
-        total_produtos = Produto.query.filter_by(ativo=True).count()
-        produtos_estoque_baixo = Produto.query.filter(
-            Produto.quantidade <= Produto.estoque_minimo,
-            Produto.ativo == True
-        ).count()
-        
-        # Movimentações recentes
-        movimentacoes_recentes = MovimentacaoEstoque.query\
-            .join(Produto)\
-            .order_by(MovimentacaoEstoque.data_movimentacao.desc())\
-            .limit(5).all()
-        
-        # Produtos com estoque baixo
-        produtos_alerta = Produto.query.filter(
-            Produto.quantidade <= Produto.estoque_minimo,
-            Produto.ativo == True
-        ).limit(5).all()
-        
-        return render_template('dashboard.html',
-                             total_produtos=total_produtos,
-                             produtos_estoque_baixo=produtos_estoque_baixo,
-                             movimentacoes_recentes=movimentacoes_recentes,
-                             produtos_alerta=produtos_alerta)
+        # Totais pré-calculados (resumo_estoque) + listas curtas, em cache até a próxima escrita
+        painel = cache.obter('dashboard', painel_dashboard)
+        return render_template('dashboard.html', **painel)
     
     # ==================== ROTAS DE AUTENTICAÇÃO ====================
     
@@ -156,38 +272,24 @@ def create_app():
     
     @app.route('/produtos')
     @login_required
+    @condicional(versao_colecao, html=True)
     def produtos():
         """Listagem de produtos"""
-        page = request.args.get('page', 1, type=int)
-        busca = request.args.get('busca', '', type=str)
-        categoria = request.args.get('categoria', '', type=str)
-        
-        query = Produto.query.filter_by(ativo=True)
-        
-        # Filtros de busca
-        if busca:
-            query = query.filter(
-                (Produto.nome.contains(busca)) |
-                (Produto.codigo.contains(busca)) |
-                (Produto.descricao.contains(busca))
-            )
-        
-        if categoria:
-            query = query.filter_by(categoria=categoria)
+        filtros = filtros_produto(request.args)
+        busca = filtros['busca']
+        categoria = filtros['categoria']
         
-        produtos = query.order_by(Produto.nome).paginate(
-            page=page, per_page=10, error_out=False
-        )
-        
-        # Buscar categorias para o filtro
-        categorias = db.session.query(Produto.categoria)\
-            .filter(Produto.categoria.isnot(None))\
-            .filter(Produto.categoria != '')\
-            .distinct().all()
+        # Paginação por cursor: qualquer página custa o mesmo que a primeira
+        try:
+            produtos = pagina_produtos(filtros, request.args.get('cursor'))
+        except CursorInvalidoError:
+            return redirect(url_for('main.produtos', **filtros_ativos(filtros)))
         
         return render_template('produtos/lista.html',
                              produtos=produtos,
-                             categorias=[c[0] for c in categorias],
+                             categorias=indice_categorias(),
+                             filtros=filtros,
+                             filtros_ativos=filtros_ativos(filtros),
                              busca=busca,
                              categoria_selecionada=categoria)
     
@@ -201,7 +303,8 @@ def create_app():
             # Verifica se código já existe
             if Produto.query.filter_by(codigo=form.codigo.data).first():
                 flash('Este código de produto já existe.', 'error')
-                return render_template('produtos/form.html', form=form, titulo='Novo Produto')
+                return render_template('produtos/form.html', form=form, titulo='Novo Produto',
+                                     categorias=indice_categorias())
             
             produto = Produto(
                 codigo=form.codigo.data,
@@ -209,8 +312,9 @@ def create_app():
                 descricao=form.descricao.data,
                 estoque_minimo=form.estoque_minimo.data,
                 preco=form.preco.data,
-                categoria=form.categoria.data
+                categoria_id=obter_categoria_id(form.categoria.data)
             )
+            produto.atualizar_alerta()
             
             try:
                 db.session.add(produto)
@@ -221,7 +325,8 @@ def create_app():
                 db.session.rollback()
                 flash('Erro ao cadastrar produto. Tente novamente.', 'error')
         
-        return render_template('produtos/form.html', form=form, titulo='Novo Produto')
+        return render_template('produtos/form.html', form=form, titulo='Novo Produto',
+                             categorias=indice_categorias())
     
     @app.route('/produto/<int:id>/editar', methods=['GET', 'POST'])
     @login_required
@@ -229,7 +334,7 @@ def create_app():
     def produto_editar(id):
         """Edição de produto existente"""
         produto = Produto.query.get_or_404(id)
-        form = ProdutoForm(obj=produto)
+        form = ProdutoForm(obj=produto, categoria=nome_categoria(produto.categoria_id))
         
         # Define o código original e o ID para validação
         form.original_codigo = produto.codigo
@@ -240,11 +345,16 @@ def create_app():
             produto_existente = Produto.query.filter_by(codigo=form.codigo.data).first()
             if produto_existente and produto_existente.id != id:
                 flash('Este código de produto já existe.', 'error')
-                return render_template('produtos/form.html', form=form, titulo='Editar Produto')
+                return render_template('produtos/form.html', form=form, titulo='Editar Produto',
+                                     categorias=indice_categorias())
             
             form.populate_obj(produto)
+            produto.categoria_id = obter_categoria_id(form.categoria.data)
+            mudou_alerta = produto.atualizar_alerta()
             
             try:
+                if mudou_alerta:
+                    publicar_alerta(produto)
                 db.session.commit()
                 flash(f'Produto {produto.nome} atualizado com sucesso!', 'success')
                 return redirect(url_for('main.produtos'))
@@ -252,7 +362,8 @@ def create_app():
                 db.session.rollback()
                 flash('Erro ao atualizar produto. Tente novamente.', 'error')
         
-        return render_template('produtos/form.html', form=form, titulo='Editar Produto')
+        return render_template('produtos/form.html', form=form, titulo='Editar Produto',
+                             categorias=indice_categorias())
     
     @app.route('/produto/<int:id>/excluir', methods=['POST'])
     @login_required
@@ -261,8 +372,11 @@ def create_app():
         """Exclusão lógica de produto"""
         produto = Produto.query.get_or_404(id)
         produto.ativo = False
+        mudou_alerta = produto.atualizar_alerta()
         
         try:
+            if mudou_alerta:
+                publicar_alerta(produto)
             db.session.commit()
             flash(f'Produto {produto.nome} excluído com sucesso!', 'success')
         except Exception as e:
@@ -271,35 +385,48 @@ def create_app():
         
         return redirect(url_for('main.produtos'))
     
+    @app.route('/produtos/importar', methods=['GET', 'POST'])
+    @login_required
+    @admin_required
+    def produtos_importar():
+        """Importação do catálogo de produtos via CSV/XLSX (executada em segundo plano)"""
+        form = ImportacaoProdutosForm()
+        
+        if form.validate_on_submit():
+            arquivo = form.arquivo.data
+            try:
+                nova = enfileirar('importar_produtos', current_user.id, arquivo=salvar_arquivo(arquivo),
+                                  nome_arquivo=secure_filename(arquivo.filename))
+                flash('Importação enviada para processamento. Acompanhe o andamento abaixo.', 'info')
+                return redirect(url_for('main.tarefa', id=nova.id))
+            except Exception as e:
+                db.session.rollback()
+                flash('Erro ao enviar o catálogo para importação. Tente novamente.', 'error')
+        
+        return render_template('produtos/importar.html', form=form)
+    
     # ==================== ROTAS DE MOVIMENTAÇÃO ====================
     
     @app.route('/movimentacoes')
     @login_required
+    @condicional(versao_colecao, html=True)
     def movimentacoes():
         """Listagem de movimentações"""
-        page = request.args.get('page', 1, type=int)
-        tipo = request.args.get('tipo', '', type=str)
-        produto_id = request.args.get('produto', '', type=int)
+        filtros = filtros_movimentacao(request.args)
         
-        query = MovimentacaoEstoque.query.join(Produto)
-        
-        if tipo:
-            query = query.filter(MovimentacaoEstoque.tipo == tipo)
-        
-        if produto_id:
-            query = query.filter(MovimentacaoEstoque.produto_id == produto_id)
-        
-        movimentacoes = query.order_by(MovimentacaoEstoque.data_movimentacao.desc())\
-            .paginate(page=page, per_page=15, error_out=False)
-        
-        # Produtos para filtro
-        produtos = Produto.query.filter_by(ativo=True).order_by(Produto.nome).all()
+        try:
+            movimentacoes = pagina_movimentacoes(filtros, request.args.get('cursor'))
+        except CursorInvalidoError:
+            return redirect(url_for('main.movimentacoes', **filtros_ativos(filtros)))
         
+        # Produto do filtro (o campo usa o autocompletar; só o escolhido é lido)
         return render_template('movimentacoes/lista.html',
                              movimentacoes=movimentacoes,
-                             produtos=produtos,
-                             tipo_selecionado=tipo,
-                             produto_selecionado=produto_id)
+                             produto_filtro=opcao_produto(filtros['produto']),
+                             filtros=filtros,
+                             filtros_ativos=filtros_ativos(filtros),
+                             tipo_selecionado=filtros['tipo'],
+                             produto_selecionado=filtros['produto'])
     
     @app.route('/movimentacao/nova', methods=['GET', 'POST'])
     @login_required
@@ -307,66 +434,102 @@ def create_app():
         """Nova movimentação de estoque"""
         form = MovimentacaoForm()
         
-        # Popular produtos ativos
-        form.produto_id.choices = [(p.id, f'{p.codigo} - {p.nome}') 
-                                   for p in Produto.query.filter_by(ativo=True).order_by(Produto.nome)]
+        # Links dos alertas chegam com ?produto=<id>&tipo=entrada
+        if request.method == 'GET':
+            form.produto_id.data = request.args.get('produto', type=int)
+            if request.args.get('tipo') in ('entrada', 'saida'):
+                form.tipo.data = request.args['tipo']
         
         if form.validate_on_submit():
-            produto = Produto.query.get(form.produto_id.data)
-            
-            # Validação para saída
-            if form.tipo.data == 'saida' and produto.quantidade < form.quantidade.data:
-                flash(f'Quantidade insuficiente em estoque. Disponível: {produto.quantidade}', 'error')
-                return render_template('movimentacoes/form.html', form=form, titulo='Nova Movimentação')
-            
-            # Cria movimentação
-            movimentacao = MovimentacaoEstoque(
-                produto_id=form.produto_id.data,
-                usuario_id=current_user.id,
-                tipo=form.tipo.data,
-                quantidade=form.quantidade.data,
-                observacao=form.observacao.data
-            )
-            
-            # Atualiza estoque do produto
-            if form.tipo.data == 'entrada':
-                produto.adicionar_estoque(form.quantidade.data)
-            else:
-                produto.remover_estoque(form.quantidade.data)
-            
+            # Saldo aplicado com UPDATE condicional no banco, seguro com terminais concorrentes
             try:
-                db.session.add(movimentacao)
-                db.session.commit()
+                registrar_movimentacao(
+                    produto_id=form.produto_id.data,
+                    usuario_id=current_user.id,
+                    tipo=form.tipo.data,
+                    quantidade=form.quantidade.data,
+                    observacao=form.observacao.data
+                )
                 flash(f'Movimentação de {form.tipo.data} registrada com sucesso!', 'success')
                 return redirect(url_for('main.movimentacoes'))
+            except MovimentacaoError as e:
+                flash(str(e), 'error')
             except Exception as e:
                 db.session.rollback()
                 flash('Erro ao registrar movimentação. Tente novamente.', 'error')
         
-        return render_template('movimentacoes/form.html', form=form, titulo='Nova Movimentação')
+        return render_template('movimentacoes/form.html', form=form, titulo='Nova Movimentação',
+                             produto_escolhido=opcao_produto(form.produto_id.data))
+    
+    @app.route('/api/movimentacoes/lote', methods=['POST'])
+    @login_required
+    def api_movimentacoes_lote():
+        """API para registrar um lote de movimentações em uma única transação"""
+        dados = request.get_json(silent=True)
+        if isinstance(dados, dict):
+            linhas = dados.get('movimentacoes')
+            atomico = bool(dados.get('atomico', False))
+        else:
+            linhas, atomico = dados, False
+        
+        if not isinstance(linhas, list) or not linhas:
+            return jsonify({'erro': 'Envie uma lista não vazia em "movimentacoes".'}), 400
+        
+        try:
+            registradas, erros, repetidas = registrar_lote(linhas, current_user.id, atomico=atomico)
+        except MovimentacaoError as e:
+            return jsonify({'erro': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'erro': 'Erro ao registrar movimentações. Tente novamente.'}), 500
+        
+        return jsonify({
+            'total': len(linhas),
+            'registradas': registradas,
+            'repetidas': repetidas,
+            'erros': erros
+        }), 200 if registradas or repetidas or not erros else 422
+    
+    # ==================== ROTAS DE EXPORTAÇÃO ====================
+    
+    @app.route('/export/movimentacoes.<formato>')
+    @login_required
+    def export_movimentacoes(formato):
+        """Exportação em streaming das movimentações (CSV ou NDJSON)"""
+        if formato not in FORMATOS:
+            abort(404)
+        conteudo = exportar_movimentacoes(filtros_movimentacao(request.args), formato)
+        return Response(stream_with_context(conteudo), mimetype=FORMATOS[formato],
+                        headers={'Content-Disposition': f'attachment; filename=movimentacoes.{formato}'})
+    
+    @app.route('/export/produtos.<formato>')
+    @login_required
+    def export_produtos(formato):
+        """Exportação em streaming dos produtos (CSV ou NDJSON)"""
+        if formato not in FORMATOS:
+            abort(404)
+        conteudo = exportar_produtos(filtros_produto(request.args), formato)
+        return Response(stream_with_context(conteudo), mimetype=FORMATOS[formato],
+                        headers={'Content-Disposition': f'attachment; filename=produtos.{formato}'})
     
     # ==================== ROTAS DE RELATÓRIOS E ALERTAS ====================
     
     @app.route('/alertas')
     @login_required
     @admin_required
+    @condicional(versao_colecao, html=True)
     def alertas():
         """Página de alertas de estoque baixo"""
-        produtos_estoque_baixo = Produto.query.filter(
-            Produto.quantidade <= Produto.estoque_minimo,
-            Produto.ativo == True
-        ).order_by(Produto.nome).all()
+        produtos_estoque_baixo = listar_alertas()
         
         return render_template('alertas.html', produtos=produtos_estoque_baixo)
     
     @app.route('/api/alertas')
     @login_required
+    @condicional(versao_colecao, cache_control='private, max-age=60')
     def api_alertas():
         """API para alertas de estoque baixo"""
-        produtos_estoque_baixo = Produto.query.filter(
-            Produto.quantidade <= Produto.estoque_minimo,
-            Produto.ativo == True
-        ).all()
+        produtos_estoque_baixo = listar_alertas()
         
         alertas = []
         for produto in produtos_estoque_baixo:
@@ -375,7 +538,8 @@ def create_app():
                 'codigo': produto.codigo,
                 'nome': produto.nome,
                 'quantidade': produto.quantidade,
-                'estoque_minimo': produto.estoque_minimo
+                'estoque_minimo': produto.estoque_minimo,
+                'alerta_desde': produto.alerta_desde.isoformat() if produto.alerta_desde else None
             })
         
         return jsonify({
@@ -383,30 +547,401 @@ def create_app():
             'produtos': alertas
         })
     
-    @app.route('/api/produto/<int:id>')
+    @app.route('/relatorios')
     @login_required
-    def api_produto(id):
-        """API para obter informações de um produto"""
-        produto = Produto.query.get_or_404(id)
-        return jsonify({
+    @condicional(versao_relatorios, html=True)
+    def relatorios():
+        """Curva ABC, giro e previsão de ruptura (lidos da tabela de análises)"""
+        classe = request.args.get('classe') if request.args.get('classe') in ('A', 'B', 'C') else None
+        return render_template('relatorios.html',
+                             resumo=resumo_abc(),
+                             ruptura=consultar_analises(classe, 'ruptura', 20),
+                             analises=consultar_analises(classe, 'valor', 100),
+                             classe_selecionada=classe)
+    
+    @app.route('/relatorios/recalcular', methods=['POST'])
+    @login_required
+    @admin_required
+    def relatorios_recalcular():
+        """Enfileira o recálculo das análises do catálogo inteiro"""
+        try:
+            nova = enfileirar('recalcular_analises', current_user.id,
+                              janela=request.form.get('janela', JANELA_PADRAO, type=int) or JANELA_PADRAO)
+        except Exception as e:
+            db.session.rollback()
+            flash('Erro ao agendar o recálculo das análises. Tente novamente.', 'error')
+            return redirect(url_for('main.relatorios'))
+        flash('Recálculo das análises agendado.', 'info')
+        return redirect(url_for('main.tarefa', id=nova.id))
+    
+    @app.route('/api/relatorios')
+    @login_required
+    @condicional(versao_relatorios)
+    def api_relatorios():
+        """API das análises por produto (?classe=A|B|C, ?ordem=valor|ruptura|giro, ?limite=)"""
+        classe = request.args.get('classe')
+        ordem = request.args.get('ordem', 'valor')
+        if classe not in (None, 'A', 'B', 'C') or ordem not in ORDENACOES:
+            return jsonify({'erro': 'Use classe A, B ou C e ordem valor, ruptura ou giro.'}), 400
+        
+        linhas = consultar_analises(classe, ordem, min(request.args.get('limite', 100, type=int), 1000))
+        for linha in linhas:
+            linha['calculado_em'] = linha['calculado_em'].isoformat()
+            linha['data_ruptura'] = linha['data_ruptura'].isoformat() if linha['data_ruptura'] else None
+        resumo = resumo_abc()
+        resumo['calculado_em'] = resumo['calculado_em'].isoformat() if resumo['calculado_em'] else None
+        return jsonify({'resumo': resumo, 'produtos': linhas})
+    
+    @app.route('/reposicao')
+    @login_required
+    @admin_required
+    def reposicao():
+        """Estoque mínimo recomendado x atual, com aplicação em massa"""
+        return render_template('reposicao.html',
+                             recomendacoes=recomendacoes_pendentes(),
+                             total_pendentes=contar_pendentes(),
+                             prazo=app.config['REPOSICAO_PRAZO_DIAS'],
+                             nivel_servico=app.config['REPOSICAO_NIVEL_SERVICO'])
+    
+    @app.route('/reposicao/recalcular', methods=['POST'])
+    @login_required
+    @admin_required
+    def reposicao_recalcular():
+        """Enfileira o recálculo das recomendações de todo o catálogo"""
+        try:
+            nova = enfileirar('recalcular_reposicao', current_user.id, prazo=app.config['REPOSICAO_PRAZO_DIAS'],
+                              nivel_servico=app.config['REPOSICAO_NIVEL_SERVICO'])
+        except Exception as e:
+            db.session.rollback()
+            flash('Erro ao agendar o recálculo do estoque mínimo. Tente novamente.', 'error')
+            return redirect(url_for('main.reposicao'))
+        flash('Recálculo do estoque mínimo agendado.', 'info')
+        return redirect(url_for('main.tarefa', id=nova.id))
+    
+    @app.route('/reposicao/aplicar', methods=['POST'])
+    @login_required
+    @admin_required
+    def reposicao_aplicar():
+        """Aplica as recomendações selecionadas (ou todas as pendentes)"""
+        ids = None if request.form.get('todas') else request.form.getlist('produto_id', type=int)
+        if ids == []:
+            flash('Selecione ao menos um produto.', 'warning')
+            return redirect(url_for('main.reposicao'))
+        try:
+            aplicadas = aplicar_recomendacoes(ids)
+            flash(f'Estoque mínimo atualizado em {aplicadas} produto(s).', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash('Erro ao aplicar as recomendações. Tente novamente.', 'error')
+        return redirect(url_for('main.reposicao'))
+    
+    def produto_para_dict(produto):
+        return {
             'id': produto.id,
             'codigo': produto.codigo,
             'nome': produto.nome,
             'descricao': produto.descricao,
+            'categoria_id': produto.categoria_id,
+            'categoria': produto.categoria,
             'quantidade': produto.quantidade,
             'estoque_minimo': produto.estoque_minimo,
             'preco': produto.preco,
             'status': produto.status,
             'ativo': produto.ativo
+        }
+    
+    def movimentacao_para_dict(mov):
+        return {
+            'id': mov.id,
+            'data_movimentacao': mov.data_movimentacao.isoformat() if mov.data_movimentacao else None,
+            'tipo': mov.tipo,
+            'quantidade': mov.quantidade,
+            'produto_id': mov.produto_id,
+            'produto_codigo': mov.produto_codigo,
+            'produto_nome': mov.produto_nome,
+            'usuario': mov.usuario_nome,
+            'observacao': mov.observacao
+        }
+    
+    @app.route('/api/produto/<int:id>')
+    @login_required
+    @condicional(versao_produto, ultima_modificacao=modificacao_produto)
+    def api_produto(id):
+        """API para obter informações de um produto"""
+        produto = linha_produto(id)
+        if produto is None:
+            abort(404)
+        return jsonify(produto_para_dict(produto))
+    
+    @app.route('/api/produtos/sugestoes')
+    @login_required
+    @condicional(versao_colecao, cache_control='private, max-age=60')
+    def api_produtos_sugestoes():
+        """API de autocompletar: produtos ativos cujo código ou nome começa com ?q="""
+        limite = request.args.get('limite', SUGESTOES_PADRAO, type=int)
+        return jsonify({'produtos': sugerir_produtos(request.args.get('q', ''), limite)})
+    
+    @app.route('/api/produtos')
+    @login_required
+    @condicional(versao_colecao)
+    def api_produtos():
+        """API de listagem de produtos paginada por cursor"""
+        try:
+            pagina = pagina_produtos(filtros_produto(request.args), request.args.get('cursor'),
+                                     por_pagina=min(request.args.get('limite', 50, type=int), 500))
+        except CursorInvalidoError as e:
+            return jsonify({'erro': str(e)}), 400
+        
+        return jsonify({
+            'produtos': [produto_para_dict(p) for p in pagina.items],
+            'total': pagina.total,
+            'proximo': pagina.next_cursor,
+            'anterior': pagina.prev_cursor
+        })
+    
+    @app.route('/api/movimentacoes')
+    @login_required
+    @condicional(versao_colecao)
+    def api_movimentacoes():
+        """API de listagem de movimentações paginada por cursor"""
+        try:
+            pagina = pagina_movimentacoes(filtros_movimentacao(request.args), request.args.get('cursor'),
+                                          por_pagina=min(request.args.get('limite', 50, type=int), 500))
+        except CursorInvalidoError as e:
+            return jsonify({'erro': str(e)}), 400
+        
+        return jsonify({
+            'movimentacoes': [movimentacao_para_dict(m) for m in pagina.items],
+            'total': pagina.total,
+            'proximo': pagina.next_cursor,
+            'anterior': pagina.prev_cursor
         })
     
+    @app.route('/api/sync')
+    @login_required
+    @condicional(versao_colecao)
+    def api_sync():
+        """API de sincronização incremental: alterações depois de ?since= (0 na primeira carga)"""
+        since = request.args.get('since', '0')
+        if not since.isdigit():
+            return jsonify({'erro': 'Cursor inválido; sincronize a partir de 0.'}), 400
+        try:
+            alteracoes = alteracoes_desde(int(since), request.args.get('limite', SYNC_LIMITE, type=int),
+                                          movimentacoes=request.args.get('movimentacoes') == '1')
+        except CursorSincronizacaoError as e:
+            return jsonify({'erro': str(e)}), 409
+        return jsonify(alteracoes)
+    
+    @app.route('/api/produto/<int:id>/estoque')
+    @login_required
+    @condicional(versao_historico)
+    def api_produto_estoque(id):
+        """API com o saldo de um produto no fim de uma data (?data=AAAA-MM-DD)"""
+        try:
+            dia = datetime.strptime(request.args.get('data', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'erro': 'Informe a data no formato AAAA-MM-DD.'}), 400
+        
+        quantidade = estoque_em(id, dia)
+        if quantidade is None:
+            abort(404)
+        return jsonify({'produto_id': id, 'data': dia.isoformat(), 'quantidade': quantidade})
+    
+    @app.route('/api/produto/<int:id>/historico')
+    @login_required
+    @condicional(versao_historico)
+    def api_produto_historico(id):
+        """API com a série do saldo e das movimentações de um produto, reduzida para gráficos"""
+        try:
+            inicio, fim, pontos = periodo_consulta(request.args)
+        except HistoricoError as e:
+            return jsonify({'erro': str(e)}), 400
+        
+        serie = serie_produto(id, inicio, fim, pontos)
+        if serie is None:
+            abort(404)
+        return jsonify(serie)
+    
+    @app.route('/api/historico')
+    @login_required
+    @condicional(versao_historico)
+    def api_historico():
+        """API com a série das unidades em estoque e das movimentações de todos os produtos"""
+        try:
+            inicio, fim, pontos = periodo_consulta(request.args)
+        except HistoricoError as e:
+            return jsonify({'erro': str(e)}), 400
+        
+        return jsonify(serie_geral(inicio, fim, pontos))
+    
+    @app.route('/api/dashboard')
+    @login_required
+    def api_dashboard():
+        """API com os números do dashboard"""
+        painel = dict(cache.obter('dashboard', painel_dashboard))
+        painel['movimentacoes_recentes'] = [
+            dict(m, data_movimentacao=m['data_movimentacao'].isoformat())
+            for m in painel['movimentacoes_recentes']
+        ]
+        return jsonify(painel)
+    
+    @app.route('/api/stream')
+    @login_required
+    def api_stream():
+        """Canal Server-Sent Events com movimentações, saldos e alertas em tempo real"""
+        fila = hub.assinar(app)
+        # Reconexão do EventSource: reenvia o que foi perdido desde o último id recebido
+        ultimo_id = request.headers.get('Last-Event-ID', type=int)
+        pendentes = eventos_desde(ultimo_id) if ultimo_id is not None else []
+        
+        resposta = Response(fluxo_eventos(fila, pendentes), mimetype='text/event-stream')
+        resposta.headers['Cache-Control'] = 'no-cache'
+        resposta.headers['X-Accel-Buffering'] = 'no'
+        return resposta
+    
+    @app.route('/api/cache')
+    @login_required
+    @admin_required
+    def api_cache():
+        """Estatísticas dos caches deste processo (valores globais, sessão, tokens e sugestões)"""
+        return jsonify(dict(cache.estatisticas(), usuarios=usuarios_cache.estatisticas(),
+                            tokens=tokens_cache.estatisticas(), sugestoes=sugestoes_cache.estatisticas()))
+    
+    @app.route('/admin/desempenho')
+    @login_required
+    @admin_required
+    def desempenho_painel():
+        """Consultas, tempos e suspeitas de N+1 por endpoint (requests recentes deste processo)"""
+        return render_template('desempenho.html', agregados=desempenho.agregados(),
+                             total_registros=len(desempenho.registros),
+                             capacidade=desempenho.registros.maxlen, limite_n1=LIMITE_N1,
+                             ativo=app.config['DESEMPENHO_ATIVO'])
+    
+    @app.route('/admin/desempenho/limpar', methods=['POST'])
+    @login_required
+    @admin_required
+    def desempenho_limpar():
+        """Descarta as medições acumuladas"""
+        desempenho.limpar()
+        flash('Medições de desempenho descartadas.', 'success')
+        return redirect(url_for('main.desempenho'))
+    
+    @app.route('/api/metricas')
+    @login_required
+    def api_metricas():
+        """Métricas no formato texto do Prometheus (admin ou token com escopo `metricas`)"""
+        if not admin_ou_escopo('metricas'):
+            return jsonify({'erro': 'Acesso restrito a administradores e tokens com escopo metricas.'}), 403
+        return Response(desempenho.prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    
+    # ==================== TAREFAS EM SEGUNDO PLANO ====================
+    
+    @app.route('/tarefas')
+    @login_required
+    @admin_required
+    def tarefas():
+        """Tarefas recentes (importações, recálculos, reconstruções) e manutenções sob demanda"""
+        return render_template('tarefas.html', tarefas=listar_tarefas(), parada=fila_parada(),
+                             manutencoes=[(tipo, descricao_tarefa(tipo)) for tipo in MANUTENCOES])
+    
+    @app.route('/tarefas/nova', methods=['POST'])
+    @login_required
+    @admin_required
+    def tarefa_nova():
+        """Enfileira uma manutenção (reconstrução de resumo, alertas, snapshots ou busca)"""
+        tipo = request.form.get('tipo')
+        if tipo not in MANUTENCOES:
+            flash('Tarefa inválida.', 'error')
+            return redirect(url_for('main.tarefas'))
+        nova = enfileirar(tipo, current_user.id)
+        flash(f'{nova.descricao} agendada.', 'info')
+        return redirect(url_for('main.tarefa', id=nova.id))
+    
+    @app.route('/tarefas/<int:id>')
+    @login_required
+    @admin_required
+    def tarefa(id):
+        """Andamento e resultado de uma tarefa"""
+        registro = Tarefa.query.get_or_404(id)
+        return render_template('tarefa.html', tarefa=registro, dados=tarefa_para_dict(registro),
+                             encerrada=registro.estado in ENCERRADAS)
+    
+    @app.route('/tarefas/<int:id>/cancelar', methods=['POST'])
+    @login_required
+    @admin_required
+    def tarefa_cancelar(id):
+        """Cancela uma tarefa pendente ou pede a interrupção de uma em execução"""
+        situacao = cancelar_tarefa(id)
+        if situacao == 'cancelada':
+            flash('Tarefa cancelada.', 'success')
+        elif situacao == 'solicitado':
+            flash('Cancelamento solicitado; a tarefa para no próximo ponto de verificação.', 'info')
+        else:
+            flash('A tarefa já foi encerrada.', 'warning')
+        return redirect(url_for('main.tarefa', id=id))
+    
+    @app.route('/api/tarefas')
+    @login_required
+    def api_tarefas():
+        """Tarefas recentes, sem os resultados (admin ou token com escopo `tarefas`)"""
+        if not admin_ou_escopo('tarefas'):
+            return jsonify({'erro': 'Acesso restrito a administradores e tokens com escopo tarefas.'}), 403
+        limite = min(max(request.args.get('limite', 50, type=int), 1), 500)
+        return jsonify({'tarefas': [tarefa_para_dict(t, resultado=False) for t in listar_tarefas(limite)]})
+    
+    @app.route('/api/tarefas/<int:id>')
+    @login_required
+    def api_tarefa(id):
+        """Estado, progresso e resultado de uma tarefa (consultado pela página da tarefa)"""
+        if not admin_ou_escopo('tarefas'):
+            return jsonify({'erro': 'Acesso restrito a administradores e tokens com escopo tarefas.'}), 403
+        registro = db.session.get(Tarefa, id)
+        if registro is None:
+            return jsonify({'erro': 'Tarefa não encontrada.'}), 404
+        return jsonify(tarefa_para_dict(registro))
+    
     @app.route('/usuarios')
     @login_required
     @admin_required
     def usuarios():
         """Listagem de usuários (apenas admin)"""
+        return pagina_usuarios()
+    
+    def pagina_usuarios(token_gerado=None):
         usuarios = Usuario.query.filter_by(ativo=True).order_by(Usuario.nome).all()
-        return render_template('usuarios.html', usuarios=usuarios)
+        return render_template('usuarios.html', usuarios=usuarios, tokens=listar_tokens(),
+                             escopos=ESCOPOS, token_gerado=token_gerado)
+    
+    @app.route('/usuarios/tokens', methods=['POST'])
+    @login_required
+    @admin_required
+    def usuarios_token_criar():
+        """Cria um token de API; o valor é exibido apenas nesta resposta"""
+        try:
+            registro, token = criar_token(request.form.get('nome'), request.form.get('usuario_id', type=int),
+                                          request.form.getlist('escopos'))
+        except TokenError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.usuarios'))
+        except Exception as e:
+            db.session.rollback()
+            flash('Erro ao criar o token. Tente novamente.', 'error')
+            return redirect(url_for('main.usuarios'))
+        
+        flash(f'Token "{registro.nome}" criado. Copie-o agora: ele não será exibido novamente.', 'success')
+        return pagina_usuarios(token_gerado=token)
+    
+    @app.route('/usuarios/tokens/<int:id>/revogar', methods=['POST'])
+    @login_required
+    @admin_required
+    def usuarios_token_revogar(id):
+        """Revoga um token de API"""
+        try:
+            revogar_token(id)
+            flash('Token revogado.', 'success')
+        except TokenError as e:
+            flash(str(e), 'error')
+        return redirect(url_for('main.usuarios'))
     
     # ==================== FILTROS DE TEMPLATE ====================
     
@@ -430,10 +965,7 @@ def create_app():
     def inject_alertas():
         """Injeta alertas globais nos templates"""
         if current_user.is_authenticated and current_user.is_admin():
-            count_alertas = Produto.query.filter(
-                Produto.quantidade <= Produto.estoque_minimo,
-                Produto.ativo == True
-            ).count()
+            count_alertas = cache.obter('alertas:total', contar_alertas)
             return dict(alertas_count=count_alertas)
         return dict(alertas_count=0)
     
@@ -471,18 +1003,197 @@ def create_app():
     app.add_url_rule('/produto/novo', 'main.produto_novo', produto_novo, methods=['GET', 'POST'])
     app.add_url_rule('/produto/<int:id>/editar', 'main.produto_editar', produto_editar, methods=['GET', 'POST'])
     app.add_url_rule('/produto/<int:id>/excluir', 'main.produto_excluir', produto_excluir, methods=['POST'])
+    app.add_url_rule('/produtos/importar', 'main.produtos_importar', produtos_importar, methods=['GET', 'POST'])
     app.add_url_rule('/movimentacoes', 'main.movimentacoes', movimentacoes)
     app.add_url_rule('/movimentacao/nova', 'main.movimentacao_nova', movimentacao_nova, methods=['GET', 'POST'])
+    app.add_url_rule('/export/movimentacoes.<formato>', 'main.export_movimentacoes', export_movimentacoes)
+    app.add_url_rule('/export/produtos.<formato>', 'main.export_produtos', export_produtos)
     app.add_url_rule('/alertas', 'main.alertas', alertas)
+    app.add_url_rule('/relatorios', 'main.relatorios', relatorios)
+    app.add_url_rule('/relatorios/recalcular', 'main.relatorios_recalcular', relatorios_recalcular, methods=['POST'])
+    app.add_url_rule('/reposicao', 'main.reposicao', reposicao)
+    app.add_url_rule('/reposicao/recalcular', 'main.reposicao_recalcular', reposicao_recalcular, methods=['POST'])
+    app.add_url_rule('/reposicao/aplicar', 'main.reposicao_aplicar', reposicao_aplicar, methods=['POST'])
     app.add_url_rule('/api/alertas', 'api.alertas', api_alertas)
+    app.add_url_rule('/api/relatorios', 'api.relatorios', api_relatorios)
     app.add_url_rule('/api/produto/<int:id>', 'api.produto', api_produto)
+    app.add_url_rule('/api/produtos', 'api.produtos', api_produtos)
+    app.add_url_rule('/api/produtos/sugestoes', 'api.produtos_sugestoes', api_produtos_sugestoes)
+    app.add_url_rule('/api/movimentacoes', 'api.movimentacoes', api_movimentacoes)
+    app.add_url_rule('/api/sync', 'api.sync', api_sync)
+    app.add_url_rule('/api/produto/<int:id>/estoque', 'api.produto_estoque', api_produto_estoque)
+    app.add_url_rule('/api/produto/<int:id>/historico', 'api.produto_historico', api_produto_historico)
+    app.add_url_rule('/api/historico', 'api.historico', api_historico)
+    app.add_url_rule('/api/dashboard', 'api.dashboard', api_dashboard)
+    app.add_url_rule('/api/stream', 'api.stream', api_stream)
+    app.add_url_rule('/api/cache', 'api.cache', api_cache)
+    app.add_url_rule('/api/movimentacoes/lote', 'api.movimentacoes_lote', api_movimentacoes_lote, methods=['POST'])
     app.add_url_rule('/usuarios', 'main.usuarios', usuarios)
+    app.add_url_rule('/admin/desempenho', 'main.desempenho', desempenho_painel)
+    app.add_url_rule('/admin/desempenho/limpar', 'main.desempenho_limpar', desempenho_limpar, methods=['POST'])
+    app.add_url_rule('/api/metricas', 'api.metricas', api_metricas)
+    app.add_url_rule('/tarefas', 'main.tarefas', tarefas)
+    app.add_url_rule('/tarefas/nova', 'main.tarefa_nova', tarefa_nova, methods=['POST'])
+    app.add_url_rule('/tarefas/<int:id>', 'main.tarefa', tarefa)
+    app.add_url_rule('/tarefas/<int:id>/cancelar', 'main.tarefa_cancelar', tarefa_cancelar, methods=['POST'])
+    app.add_url_rule('/api/tarefas', 'api.tarefas', api_tarefas)
+    app.add_url_rule('/api/tarefas/<int:id>', 'api.tarefa', api_tarefa)
+    app.add_url_rule('/usuarios/tokens', 'main.usuarios_token_criar', usuarios_token_criar, methods=['POST'])
+    app.add_url_rule('/usuarios/tokens/<int:id>/revogar', 'main.usuarios_token_revogar', usuarios_token_revogar,
+                     methods=['POST'])
+    
+    # ==================== COMANDOS CLI ====================
+    
+    @app.cli.command('estresse-movimentacoes')
+    @click.option('--escritores', default=8, help='Quantidade de escritores paralelos')
+    @click.option('--operacoes', default=50, help='Movimentações por escritor')
+    def estresse_movimentacoes(escritores, operacoes):
+        """Teste de concorrência das movimentações em um banco temporário (o configurado não é tocado)"""
+        resultado = verificar_concorrencia(create_app, escritores, operacoes)
+        click.echo(f"{resultado['operacoes']} operações em {resultado['duracao']:.2f}s "
+                   f"({resultado['operacoes'] / resultado['duracao']:.0f} op/s)")
+        click.echo(f"Entradas: {resultado['entradas']}  Saídas: {resultado['saidas']}  "
+                   f"Recusadas: {resultado['recusadas']}")
+        click.echo(f"Saldo final: {resultado['quantidade_final']} "
+                   f"(esperado: {resultado['quantidade_esperada']})")
+        for erro in resultado['erros'][:10]:
+            click.echo(f'Erro: {erro}', err=True)
+        if not resultado['ok']:
+            raise click.ClickException('Inconsistência detectada: atualizações perdidas ou estoque negativo.')
+        click.echo('OK: nenhuma atualização perdida.')
+    
+    @app.cli.command('verificar-banco')
+    def verificar_banco_cli():
+        """Conecta ao banco e mostra as configurações efetivas (pool e pragmas)"""
+        for nome, info in verificar_banco().items():
+            click.echo(f'[{nome}]')
+            for chave, valor in info.items():
+                click.echo(f'  {chave}: {valor}')
+    
+    @app.cli.command('reindexar-busca')
+    def reindexar_busca_cli():
+        """Reconstrói o índice de busca textual (FTS5) dos produtos"""
+        reindexar_busca()
+        click.echo('Índice de busca reconstruído.')
+    
+    @app.cli.command('reconstruir-alertas')
+    def reconstruir_alertas_cli():
+        """Recalcula o indicador de estoque baixo dos produtos divergentes"""
+        corrigidos = corrigir_alertas()
+        click.echo(f'{corrigidos} produto(s) corrigido(s). Em alerta: {contar_alertas()}.')
+    
+    @app.cli.command('verificar-alertas')
+    def verificar_alertas_cli():
+        """Compara o indicador materializado com o predicado quantidade <= estoque_minimo"""
+        divergentes = divergencias_alerta()
+        if divergentes:
+            raise click.ClickException(f'{divergentes} produto(s) com alerta divergente. '
+                                       'Execute reconstruir-alertas.')
+        click.echo(f'OK: {contar_alertas()} produto(s) em alerta, nenhuma divergência.')
+    
+    @app.cli.command('reconstruir-resumo')
+    def reconstruir_resumo_cli():
+        """Recalcula o resumo do dashboard a partir de produtos e movimentações"""
+        reconstruir_resumo()
+        click.echo('Resumo do dashboard reconstruído.')
+    
+    @app.cli.command('verificar-resumo')
+    def verificar_resumo_cli():
+        """Compara o resumo incremental do dashboard com um recálculo completo"""
+        divergentes = divergencias_resumo()
+        for item in divergentes[:20]:
+            click.echo(f"{item['chave']}: esperado {item['esperado']}, gravado {item['gravado']}", err=True)
+        if divergentes:
+            raise click.ClickException(f'{len(divergentes)} linha(s) divergente(s). Execute reconstruir-resumo.')
+        click.echo('OK: resumo do dashboard consistente.')
+    
+    @app.cli.command('gerar-snapshots')
+    def gerar_snapshots_cli():
+        """Fecha os dias pendentes do histórico (agende diariamente; a primeira execução faz o backfill)"""
+        dias = gerar_snapshots()
+        fechado = ultimo_fechamento()
+        click.echo(f"{dias} dia(s) fechado(s). Último fechamento: {fechado.isoformat() if fechado else '-'}.")
+    
+    @app.cli.command('reconstruir-snapshots')
+    def reconstruir_snapshots_cli():
+        """Apaga os snapshots e refaz o backfill a partir de todas as movimentações"""
+        dias = reconstruir_snapshots()
+        click.echo(f'Snapshots reconstruídos: {dias} dia(s).')
+    
+    @app.cli.command('recalcular-analises')
+    @click.option('--janela', default=JANELA_PADRAO, help='Dias de movimentação considerados')
+    def recalcular_analises_cli(janela):
+        """Recalcula curva ABC, giro e previsão de ruptura de todos os produtos"""
+        inicio = datetime.utcnow()
+        try:
+            total = recalcular_analises(janela)
+        except AnaliseError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'{total} produto(s) analisado(s) em {(datetime.utcnow() - inicio).total_seconds():.2f}s.')
+    
+    @app.cli.command('recalcular-reposicao')
+    @click.option('--prazo', type=int, default=None, help='Prazo de reposição em dias (padrão: REPOSICAO_PRAZO_DIAS)')
+    @click.option('--nivel-servico', type=float, default=None,
+                  help='Probabilidade de não faltar durante o prazo (padrão: REPOSICAO_NIVEL_SERVICO)')
+    @click.option('--janela', default=JANELA_PADRAO, help='Dias de saídas considerados')
+    @click.option('--completo', is_flag=True, help='Recalcula todos os produtos, não só os movimentados')
+    @click.option('--aplicar', is_flag=True, help='Aplica as recomendações pendentes ao final')
+    def recalcular_reposicao_cli(prazo, nivel_servico, janela, completo, aplicar):
+        """Recalcula o estoque mínimo recomendado dos produtos movimentados desde a última execução"""
+        try:
+            analisados, com_diferenca = recalcular_reposicao(
+                prazo or app.config['REPOSICAO_PRAZO_DIAS'],
+                nivel_servico or app.config['REPOSICAO_NIVEL_SERVICO'],
+                janela, completo)
+        except (ReposicaoError, AnaliseError) as e:
+            raise click.ClickException(str(e))
+        click.echo(f'{analisados} produto(s) analisado(s); {com_diferenca} com diferença.')
+        if aplicar:
+            click.echo(f'{aplicar_recomendacoes()} recomendação(ões) aplicada(s).')
+    
+    @app.cli.command('importar-produtos')
+    @click.argument('caminho', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--lote', default=900, help='Linhas processadas por bloco')
+    def importar_produtos_cli(caminho, lote):
+        """Importa um catálogo CSV/XLSX criando ou atualizando produtos por código"""
+        def progresso(parcial):
+            click.echo(f"\r{parcial['linhas']} linhas | {parcial['inseridos']} criados | "
+                       f"{parcial['atualizados']} atualizados | {parcial['total_erros']} erros", nl=False)
+        
+        with open(caminho, 'rb') as arquivo:
+            try:
+                resultado = importar_produtos(arquivo, caminho, tamanho_lote=lote, progresso=progresso)
+            except ImportacaoError as e:
+                raise click.ClickException(str(e))
+        click.echo()
+        for erro in resultado['erros'][:50]:
+            click.echo(f"Linha {erro['linha']}: {erro['erro']}", err=True)
+    
+    @app.cli.command('arquivar-movimentacoes')
+    @click.option('--manter-meses', type=int, default=None,
+                  help='Meses completos mantidos na tabela quente (padrão: ARQUIVO_MESES_QUENTES)')
+    def arquivar_movimentacoes_cli(manter_meses):
+        """Move os meses antigos de movimentações para o banco de arquivo (pode rodar com o sistema no ar)"""
+        meses = app.config['ARQUIVO_MESES_QUENTES'] if manter_meses is None else manter_meses
+        try:
+            arquivados = arquivar_movimentacoes(
+                meses, aviso=lambda periodo, linhas: click.echo(f'{periodo}: {linhas} movimentação(ões) arquivada(s).'))
+        except ArquivoError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'{len(arquivados)} mês(es) arquivado(s); {len(particoes())} no arquivo.')
+    
+    @app.cli.command('tarefas-trabalhador')
+    @click.option('--processos', type=int, default=None, help='Processos trabalhadores (padrão: um por núcleo)')
+    @click.option('--intervalo', default=1.0, help='Segundos entre consultas à fila quando ela está vazia')
+    def tarefas_trabalhador_cli(processos, intervalo):
+        """Executa as tarefas em segundo plano (importações, recálculos) até Ctrl+C"""
+        iniciar_trabalhadores(processos or os.cpu_count() or 1, intervalo, aviso=click.echo)
     
     return app
 
 def init_db():
     """Inicializa o banco de dados com dados de exemplo"""
-    db.create_all()
+    atualizar_esquema()
     
     # Criar usuário admin padrão se não existir
     admin = Usuario.query.filter_by(email='admin@estoque.com').first()
@@ -507,12 +1218,7 @@ def init_db():
         db.session.add(user_comum)
     
     # Criar categorias de exemplo
-    categorias = ['Eletrônicos', 'Escritório', 'Limpeza', 'Informática', 'Móveis']
-    for cat_nome in categorias:
-        categoria_existente = Categoria.query.filter_by(nome=cat_nome).first()
-        if not categoria_existente:
-            categoria = Categoria(nome=cat_nome)
-            db.session.add(categoria)
+    categorias = mapear_categorias(['Eletrônicos', 'Escritório', 'Limpeza', 'Informática', 'Móveis'])
     
     # Criar produtos de exemplo
     produtos_exemplo = [
@@ -535,10 +1241,11 @@ def init_db():
                 descricao=desc,
                 estoque_minimo=estoque_min,
                 preco=preco,
-                categoria=cat
+                categoria_id=categorias[cat]
             )
             # Adicionar estoque inicial
             produto.quantidade = estoque_min * 2
+            produto.atualizar_alerta()
             db.session.add(produto)
     
     try:
@@ -0,0 +1,351 @@
+"""Benchmark de carga e de regressão das rotas mais usadas
+
+Monta a aplicação com create_app sobre um banco SQLite gerado (produtos e
+movimentações sintéticos, em vários tamanhos), faz login e exercita as rotas
+pelo test client: primeiro em sequência (latência e número de consultas SQL
+por request), depois com vários clientes em paralelo (vazão). O resultado é
+gravado em JSON e, com --baseline, comparado a uma execução anterior: a
+execução falha (código 1) se alguma rota piorar além do limite.
+
+Uso, a partir da raiz do projeto:
+
+    python -m benchmarks.rotas --tamanho 1k
+    python -m benchmarks.rotas --tamanho 100k --salvar-baseline benchmarks/baseline-100k.json
+    python -m benchmarks.rotas --tamanho 100k --baseline benchmarks/baseline-100k.json
+
+Os bancos gerados ficam em --dados (padrão: pasta temporária do sistema) e
+são reaproveitados entre execuções; a geração de 1m (10M movimentações) leva
+vários minutos. Compare apenas resultados da mesma máquina.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, text
+
+TAMANHOS = {  # produtos, movimentações
+    '1k': (1_000, 20_000),
+    '100k': (100_000, 1_000_000),
+    '1m': (1_000_000, 10_000_000),
+}
+LIMITE_REGRESSAO = 0.25  # piora tolerada na latência (p50/p95)
+TAMANHO_BLOCO = 50_000  # linhas por INSERT na geração
+SEMENTE = 42
+
+PALAVRAS = ('Notebook', 'Mouse', 'Teclado', 'Monitor', 'Cabo', 'Papel', 'Caneta', 'Cadeira', 'Mesa',
+            'Detergente', 'Impressora', 'Toner', 'Grampeador', 'Pasta', 'Lâmpada', 'Fita', 'Copo')
+MARCAS = ('Dell', 'Logitech', 'HP', 'Samsung', 'BIC', 'Tilibra', 'Ypê', 'Philips', 'Multilaser', '3M')
+
+_local = threading.local()
+
+# ==================== DADOS ====================
+
+def criar_app(caminho_banco):
+    """Aplicação apontando para o banco do benchmark, sem CSRF (clientes de teste)"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(caminho_banco)}'
+    from app import create_app
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=False)
+    return app
+
+def gerar_dados(app, produtos, movimentacoes, semente=SEMENTE):
+    """Popula o banco com o catálogo e o histórico sintéticos e reconstrói os derivados"""
+    from app import init_db
+    from models.database import db, Categoria, Produto, MovimentacaoEstoque, Usuario
+    from services.alertas import reconstruir_alertas
+    from services.resumo import reconstruir_resumo
+
+    rnd = random.Random(semente)
+    with app.app_context():
+        init_db()
+        categorias = [categoria_id for (categoria_id,) in db.session.query(Categoria.id)]
+        admin_id = db.session.query(Usuario.id).filter_by(email='admin@estoque.com').scalar()
+        inicio_ids = (db.session.query(db.func.max(Produto.id)).scalar() or 0) + 1
+
+        for inicio in range(0, produtos, TAMANHO_BLOCO):
+            db.session.execute(insert(Produto.__table__), [{
+                'codigo': f'B{i:07d}',
+                'nome': f'{rnd.choice(PALAVRAS)} {rnd.choice(MARCAS)} {i}',
+                'descricao': f'{rnd.choice(PALAVRAS)} de teste {i}',
+                'categoria_id': rnd.choice(categorias),
+                'quantidade': rnd.randint(0, 500),
+                'estoque_minimo': rnd.randint(5, 50),
+                'preco': round(rnd.uniform(1, 3000), 2),
+                'ativo': True,
+            } for i in range(inicio, min(inicio + TAMANHO_BLOCO, produtos))])
+            db.session.commit()
+
+        agora = datetime.utcnow()
+        fim_ids = inicio_ids + produtos - 1
+        for inicio in range(0, movimentacoes, TAMANHO_BLOCO):
+            db.session.execute(insert(MovimentacaoEstoque.__table__), [{
+                'produto_id': rnd.randint(inicio_ids, fim_ids),
+                'usuario_id': admin_id,
+                'tipo': rnd.choice(('entrada', 'saida')),
+                'quantidade': rnd.randint(1, 20),
+                'data_movimentacao': agora - timedelta(seconds=rnd.randint(0, 365 * 86400)),
+                'observacao': '',
+            } for _ in range(min(TAMANHO_BLOCO, movimentacoes - inicio))])
+            db.session.commit()
+            print(f'  movimentações: {min(inicio + TAMANHO_BLOCO, movimentacoes)}/{movimentacoes}', end='\r')
+
+        reconstruir_alertas()
+        reconstruir_resumo()
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+def preparar_banco(pasta, tamanho):
+    """Caminho do banco do tamanho pedido, gerando-o se ainda não existir"""
+    produtos, movimentacoes = TAMANHOS[tamanho]
+    caminho = os.path.join(pasta, f'benchmark-{tamanho}.db')
+    marcador = caminho + '.ok'
+    if not os.path.exists(marcador):
+        for arquivo in (caminho, caminho + '-wal', caminho + '-shm'):
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+        print(f'Gerando banco {tamanho}: {produtos} produtos, {movimentacoes} movimentações...')
+        inicio = time.perf_counter()
+        gerar_dados(criar_app(caminho), produtos, movimentacoes)
+        with open(marcador, 'w') as arquivo:
+            json.dump({'produtos': produtos, 'movimentacoes': movimentacoes}, arquivo)
+        print(f'\nBanco gerado em {time.perf_counter() - inicio:.1f}s')
+    return caminho
+
+# ==================== CENÁRIOS ====================
+
+def cenarios(produto_ids, categoria_ids):
+    """Rotas exercitadas: nome -> função(rnd) que devolve (método, url, dados do formulário)"""
+    return {
+        'produtos_busca': lambda rnd: ('GET', f'/produtos?busca={rnd.choice(PALAVRAS + MARCAS)}', None),
+        'produtos': lambda rnd: ('GET', '/produtos', None),
+        'produtos_categoria': lambda rnd: ('GET', f'/produtos?categoria={rnd.choice(categoria_ids)}', None),
+        'produtos_sugestoes': lambda rnd: ('GET', f'/api/produtos/sugestoes?q={rnd.choice(PALAVRAS)[:3]}', None),
+        'movimentacoes': lambda rnd: ('GET', '/movimentacoes', None),
+        'movimentacoes_produto': lambda rnd: ('GET', f'/movimentacoes?produto={rnd.choice(produto_ids)}', None),
+        'dashboard': lambda rnd: ('GET', '/dashboard', None),
+        'sync': lambda rnd: ('GET', f'/api/sync?since={rnd.randint(0, 100_000)}&limite=500', None),
+        'movimentacao_nova_form': lambda rnd: ('GET', '/movimentacao/nova', None),
+        'movimentacao_nova': lambda rnd: ('POST', '/movimentacao/nova', {
+            'produto_id': rnd.choice(produto_ids), 'tipo': 'entrada', 'quantidade': 1, 'observacao': 'benchmark',
+        }),
+    }
+
+def contar_consultas(app):
+    """Conta as consultas SQL por thread em todos os engines da aplicação"""
+    from models.database import db
+
+    def _contar(*args):
+        _local.consultas = getattr(_local, 'consultas', 0) + 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _contar)
+
+def cliente_logado(app):
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'email': 'admin@estoque.com', 'senha': 'admin123'})
+    if resposta.status_code != 302:
+        raise RuntimeError('Falha no login do benchmark (admin@estoque.com).')
+    return cliente
+
+def requisitar(cliente, cenario, rnd):
+    """Executa um request; retorna (segundos, consultas SQL, sucesso)"""
+    metodo, url, dados = cenario(rnd)
+    _local.consultas = 0
+    inicio = time.perf_counter()
+    resposta = cliente.open(url, method=metodo, data=dados)
+    resposta.get_data()
+    duracao = time.perf_counter() - inicio
+    return duracao, _local.consultas, resposta.status_code < 400
+
+def _estatisticas(duracoes, consultas, erros, total_segundos):
+    ordenadas = sorted(duracoes)
+
+    def percentil(p):
+        return round(ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000, 3)
+
+    return {
+        'requisicoes': len(duracoes),
+        'erros': erros,
+        'media_ms': round(statistics.fmean(duracoes) * 1000, 3),
+        'p50_ms': percentil(0.50),
+        'p90_ms': percentil(0.90),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'max_ms': round(ordenadas[-1] * 1000, 3),
+        'vazao_rps': round(len(duracoes) / total_segundos, 2) if total_segundos else None,
+        'consultas_sql': round(statistics.fmean(consultas), 2),
+        'consultas_sql_max': max(consultas),
+    }
+
+def medir_sequencial(app, cenario, requisicoes, aquecimento, tempo_max):
+    cliente = cliente_logado(app)
+    rnd = random.Random(SEMENTE)
+    inicio = time.perf_counter()
+    for _ in range(aquecimento):
+        if time.perf_counter() - inicio > tempo_max / 4:
+            break
+        requisitar(cliente, cenario, rnd)
+
+    duracoes, consultas, erros = [], [], 0
+    inicio = time.perf_counter()
+    while len(duracoes) < requisicoes and time.perf_counter() - inicio < tempo_max:
+        duracao, n, ok = requisitar(cliente, cenario, rnd)
+        duracoes.append(duracao)
+        consultas.append(n)
+        erros += not ok
+    return _estatisticas(duracoes, consultas, erros, time.perf_counter() - inicio)
+
+def medir_concorrente(app, cenario, requisicoes, concorrencia, tempo_max):
+    clientes = [cliente_logado(app) for _ in range(concorrencia)]
+    resultados = []
+    trava = threading.Lock()
+    inicio = time.perf_counter()
+
+    def trabalhador(indice):
+        rnd = random.Random(SEMENTE + indice)
+        cliente = clientes[indice]
+        while time.perf_counter() - inicio < tempo_max:
+            with trava:
+                if len(resultados) >= requisicoes:
+                    return
+                resultados.append(None)  # reserva a vaga
+                posicao = len(resultados) - 1
+            resultado = requisitar(cliente, cenario, rnd)
+            with trava:
+                resultados[posicao] = resultado
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(trabalhador, range(concorrencia)))
+    total = time.perf_counter() - inicio
+
+    concluidos = [r for r in resultados if r is not None]
+    estatisticas = _estatisticas([r[0] for r in concluidos], [r[1] for r in concluidos],
+                                 sum(1 for r in concluidos if not r[2]), total)
+    estatisticas['concorrencia'] = concorrencia
+    return estatisticas
+
+# ==================== COMPARAÇÃO ====================
+
+def comparar(resultado, baseline, limite=LIMITE_REGRESSAO):
+    """Lista de regressões (rota, fase, métrica, antes, depois) em relação ao baseline"""
+    regressoes = []
+    for rota, fases in resultado['rotas'].items():
+        for fase, atual in fases.items():
+            anterior = baseline.get('rotas', {}).get(rota, {}).get(fase)
+            if not anterior:
+                continue
+            for metrica in ('p50_ms', 'p95_ms'):
+                if atual[metrica] > anterior[metrica] * (1 + limite):
+                    regressoes.append((rota, fase, metrica, anterior[metrica], atual[metrica]))
+            # O número de consultas é determinístico: qualquer aumento é regressão (ex.: N+1)
+            if atual['consultas_sql'] > anterior['consultas_sql'] + 0.5:
+                regressoes.append((rota, fase, 'consultas_sql', anterior['consultas_sql'], atual['consultas_sql']))
+            if atual['erros'] > anterior['erros']:
+                regressoes.append((rota, fase, 'erros', anterior['erros'], atual['erros']))
+    return regressoes
+
+def imprimir(resultado):
+    print(f"\n{'rota':<24} {'fase':<12} {'req':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'SQL':>6} {'erros':>5}")
+    for rota, fases in resultado['rotas'].items():
+        for fase, e in fases.items():
+            print(f"{rota:<24} {fase:<12} {e['requisicoes']:>5} {e['p50_ms']:>9.2f} {e['p95_ms']:>9.2f} "
+                  f"{e['p99_ms']:>9.2f} {e['vazao_rps'] or 0:>8.1f} {e['consultas_sql']:>6.1f} {e['erros']:>5}")
+
+# ==================== EXECUÇÃO ====================
+
+def executar(args):
+    caminho = preparar_banco(args.dados, args.tamanho)
+    app = criar_app(caminho)
+    contar_consultas(app)
+
+    from models.database import db, Categoria, Produto
+    from models.esquema import atualizar_esquema
+    with app.app_context():
+        atualizar_esquema()  # bancos reaproveitados de versões anteriores do esquema
+        produto_ids = [i for (i,) in db.session.query(Produto.id).filter(Produto.ativo == True)
+                       .order_by(db.func.random()).limit(10_000)]
+        categoria_ids = [i for (i,) in db.session.query(Categoria.id)]
+
+    selecionadas = cenarios(produto_ids, categoria_ids)
+    if args.rotas:
+        desconhecidas = set(args.rotas) - set(selecionadas)
+        if desconhecidas:
+            raise SystemExit(f"Rotas desconhecidas: {', '.join(sorted(desconhecidas))}")
+        selecionadas = {nome: selecionadas[nome] for nome in args.rotas}
+
+    produtos, movimentacoes = TAMANHOS[args.tamanho]
+    resultado = {
+        'meta': {
+            'tamanho': args.tamanho,
+            'produtos': produtos,
+            'movimentacoes': movimentacoes,
+            'requisicoes': args.requisicoes,
+            'concorrencia': args.concorrencia,
+            'data': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+        },
+        'rotas': {},
+    }
+    for nome, cenario in selecionadas.items():
+        print(f'{nome}...', flush=True)
+        fases = {'sequencial': medir_sequencial(app, cenario, args.requisicoes, args.aquecimento, args.tempo_max)}
+        if args.concorrencia > 1:
+            fases['concorrente'] = medir_concorrente(app, cenario, args.requisicoes, args.concorrencia,
+                                                     args.tempo_max)
+        resultado['rotas'][nome] = fases
+
+    imprimir(resultado)
+    saida = args.saida or os.path.join(args.dados, f"resultado-{args.tamanho}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    for caminho_json in filter(None, (saida, args.salvar_baseline)):
+        with open(caminho_json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f'\nResultado gravado em {saida}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as arquivo:
+            baseline = json.load(arquivo)
+        if baseline.get('meta', {}).get('tamanho') != args.tamanho:
+            print(f"Aviso: baseline gerado com tamanho {baseline.get('meta', {}).get('tamanho')}.")
+        regressoes = comparar(resultado, baseline, args.limite)
+        if regressoes:
+            print(f'\n{len(regressoes)} regressão(ões) acima de {args.limite:.0%}:')
+            for rota, fase, metrica, antes, depois in regressoes:
+                print(f'  {rota} [{fase}] {metrica}: {antes} -> {depois}')
+            return 1
+        print(f'\nSem regressões em relação a {args.baseline}.')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark das rotas principais do controle de estoque')
+    parser.add_argument('--tamanho', choices=TAMANHOS, default='1k', help='Tamanho do banco gerado')
+    parser.add_argument('--dados', default=os.path.join(tempfile.gettempdir(), 'estoque-benchmark'),
+                        help='Pasta dos bancos gerados e dos resultados')
+    parser.add_argument('--rotas', nargs='*', help='Cenários a executar (padrão: todos)')
+    parser.add_argument('--requisicoes', type=int, default=200, help='Requests por rota em cada fase')
+    parser.add_argument('--aquecimento', type=int, default=10, help='Requests descartados antes de medir')
+    parser.add_argument('--concorrencia', type=int, default=8, help='Clientes paralelos (1 = só sequencial)')
+    parser.add_argument('--tempo-max', type=float, default=60, help='Limite de segundos por rota e fase')
+    parser.add_argument('--saida', help='Arquivo JSON do resultado')
+    parser.add_argument('--baseline', help='Resultado anterior para comparação')
+    parser.add_argument('--salvar-baseline', help='Grava também o resultado neste arquivo')
+    parser.add_argument('--limite', type=float, default=LIMITE_REGRESSAO,
+                        help='Piora tolerada na latência (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+    os.makedirs(args.dados, exist_ok=True)
+    return executar(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
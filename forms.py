@@ -1,6 +1,8 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, TextAreaField, IntegerField, FloatField, SelectField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, NumberRange, ValidationError
+from wtforms.widgets import HiddenInput
 from models.database import Usuario, Produto
 
 class LoginForm(FlaskForm):
@@ -102,9 +104,10 @@ class ProdutoForm(FlaskForm):
 
 class MovimentacaoForm(FlaskForm):
     """Formulário para movimentação de estoque"""
-    produto_id = SelectField('Produto', validators=[
+    # Escolhido pelo autocompletar (/api/produtos/sugestoes); só o id enviado é validado
+    produto_id = IntegerField('Produto', validators=[
         DataRequired(message='Produto é obrigatório')
-    ], coerce=int, choices=[])
+    ], widget=HiddenInput())
     
     tipo = SelectField('Tipo de Movimentação', validators=[
         DataRequired(message='Tipo de movimentação é obrigatório')
@@ -118,4 +121,18 @@ class MovimentacaoForm(FlaskForm):
     observacao = TextAreaField('Observação', 
                               render_kw={'placeholder': 'Observações sobre a movimentação (opcional)', 'rows': 3})
     
-    submit = SubmitField('Registrar Movimentação')
\ No newline at end of file
+    submit = SubmitField('Registrar Movimentação')
+    
+    def validate_produto_id(self, field):
+        """Validação customizada para produto existente e ativo"""
+        if not Produto.query.filter_by(id=field.data, ativo=True).with_entities(Produto.id).first():
+            raise ValidationError('Selecione um produto ativo.')
+
+class ImportacaoProdutosForm(FlaskForm):
+    """Formulário para importação do catálogo de produtos"""
+    arquivo = FileField('Arquivo do Catálogo', validators=[
+        FileRequired(message='Selecione um arquivo'),
+        FileAllowed(['csv', 'xlsx'], message='Use arquivos .csv ou .xlsx')
+    ])
+    
+    submit = SubmitField('Importar Catálogo')
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""Configuração do gunicorn para produção: `gunicorn -c gunicorn.conf.py`
+
+Os workers são gevent: cada request é uma greenlet, e o worker aplica o
+monkey-patching (threading, queue, time, socket) antes de importar a
+aplicação. Assim as conexões abertas do canal /api/stream ficam esperando na
+sua fila sem ocupar uma thread cada, e um worker atende milhares delas. Por
+isso preload_app fica desligado: com ele a aplicação seria importada antes do
+patch, com threads e filas bloqueantes de verdade.
+
+Variáveis de ambiente: GUNICORN_BIND, GUNICORN_WORKERS, GUNICORN_CONEXOES.
+"""
+import os
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 1))
+worker_connections = int(os.environ.get('GUNICORN_CONEXOES', 2000))  # conexões simultâneas por worker
+preload_app = False
+timeout = 30
+graceful_timeout = 30
@@ -0,0 +1,176 @@
+"""Configuração do banco: URI, pool, timeouts e pragmas do SQLite
+
+Tudo vem de variáveis de ambiente (com padrões adequados ao SQLite local):
+
+- DATABASE_URL: URI do banco (padrão sqlite:///estoque.db, na pasta instance/);
+- DATABASE_URL_LEITURA: URI do pool somente leitura (padrão: a mesma, ex.: uma réplica);
+- DATABASE_ARQUIVO: arquivo SQLite com as movimentações arquivadas (padrão: <banco>-arquivo.db
+  ao lado do principal; vazio desativa);
+- DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE: pool de conexões;
+- DB_STATEMENT_CACHE: consultas compiladas mantidas em cache por engine;
+- DB_BUSY_TIMEOUT (ms), DB_CACHE_SIZE (KiB), DB_MMAP_SIZE (bytes), DB_SYNCHRONOUS: SQLite.
+
+No SQLite, cada conexão nova recebe journal_mode=WAL (leitores não bloqueiam
+o escritor e vice-versa), synchronous=NORMAL (seguro com WAL), busy_timeout
+(espera o lock em vez de falhar com "database is locked"), mmap_size e
+cache_size. O pool de leitura (bind 'leitura') usa conexões próprias com
+query_only, para rotas que só consultam não disputarem o pool principal.
+O banco de arquivo é anexado (ATTACH, somente leitura) como `arquivo` em todas
+as conexões; veja services/arquivo.py.
+"""
+import os
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from models.database import db
+
+URI_PADRAO = 'sqlite:///estoque.db'
+BIND_LEITURA = 'leitura'
+ESQUEMA_ARQUIVO = 'arquivo'
+
+PADROES = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,  # segundos esperando uma conexão livre
+    'DB_POOL_RECYCLE': 1800,  # segundos; evita conexões derrubadas pelo servidor
+    'DB_STATEMENT_CACHE': 500,
+    'DB_BUSY_TIMEOUT': 5000,  # ms
+    'DB_CACHE_SIZE': 65536,  # KiB (64 MiB por conexão)
+    'DB_MMAP_SIZE': 268435456,  # 256 MiB
+    'DB_SYNCHRONOUS': 'NORMAL',
+}
+
+SINCRONIZACAO = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+def _em_memoria(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def _opcoes_engine(uri, config):
+    url = make_url(uri)
+    opcoes = {
+        'query_cache_size': config['DB_STATEMENT_CACHE'],
+        'pool_pre_ping': url.get_backend_name() != 'sqlite',
+    }
+    if url.get_backend_name() == 'sqlite':
+        opcoes['connect_args'] = {
+            'timeout': config['DB_BUSY_TIMEOUT'] / 1000,
+            'cached_statements': config['DB_STATEMENT_CACHE'],
+        }
+        if _em_memoria(url):
+            return opcoes  # banco em memória: uma conexão só (StaticPool/SingletonThreadPool)
+    opcoes.update(pool_size=config['DB_POOL_SIZE'], max_overflow=config['DB_MAX_OVERFLOW'],
+                  pool_timeout=config['DB_POOL_TIMEOUT'], pool_recycle=config['DB_POOL_RECYCLE'])
+    return opcoes
+
+def configurar_banco(app):
+    """Preenche a configuração do Flask-SQLAlchemy a partir do ambiente (antes de db.init_app)"""
+    for chave, padrao in PADROES.items():
+        app.config.setdefault(chave, type(padrao)(os.environ.get(chave, padrao)))
+    app.config['DB_SYNCHRONOUS'] = app.config['DB_SYNCHRONOUS'].upper()
+    if app.config['DB_SYNCHRONOUS'] not in SINCRONIZACAO:
+        raise ValueError(f"DB_SYNCHRONOUS deve ser um de: {', '.join(sorted(SINCRONIZACAO))}")
+
+    uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', URI_PADRAO))
+    uri_leitura = app.config.setdefault('DATABASE_URL_LEITURA', os.environ.get('DATABASE_URL_LEITURA', uri))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _opcoes_engine(uri, app.config))
+    # Um banco em memória existe só na sua conexão: as leituras usam o engine principal
+    if not _em_memoria(make_url(uri_leitura)):
+        app.config.setdefault('SQLALCHEMY_BINDS', {}).setdefault(
+            BIND_LEITURA, dict(_opcoes_engine(uri_leitura, app.config), url=uri_leitura)
+        )
+
+def _caminho_arquivo(engine):
+    """Caminho do banco de arquivo, ou None (banco em memória, outro SGBD ou desativado)"""
+    if engine.dialect.name != 'sqlite' or _em_memoria(engine.url):
+        return None
+    caminho = os.environ.get('DATABASE_ARQUIVO')
+    if caminho is None:
+        base, extensao = os.path.splitext(engine.url.database)
+        caminho = f'{base}-arquivo{extensao or ".db"}'
+    return os.path.abspath(caminho) if caminho else None
+
+def _instalar_pragmas(engine, config, somente_leitura=False):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['DB_BUSY_TIMEOUT'])}",
+        f"PRAGMA cache_size = -{int(config['DB_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(config['DB_MMAP_SIZE'])}",
+        f"PRAGMA synchronous = {config['DB_SYNCHRONOUS']}",
+    ]
+    # O modo WAL fica gravado no arquivo; o pool de leitura só o utiliza
+    pragmas.insert(0, 'PRAGMA query_only = ON' if somente_leitura else 'PRAGMA main.journal_mode = WAL')
+
+    arquivo = config.get('DB_ARQUIVO')
+    if arquivo:
+        pragmas += [
+            f"PRAGMA {ESQUEMA_ARQUIVO}.cache_size = -{int(config['DB_CACHE_SIZE'])}",
+            f"PRAGMA {ESQUEMA_ARQUIVO}.mmap_size = {int(config['DB_MMAP_SIZE'])}",
+        ]
+
+    @event.listens_for(engine, 'connect')
+    def _ao_conectar(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        if arquivo:
+            # Somente leitura em todas as conexões: só o arquivamento (conexão própria) grava nele
+            cursor.execute(f'ATTACH DATABASE ? AS {ESQUEMA_ARQUIVO}', (f'file:{quote(arquivo)}?mode=ro',))
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+def iniciar_banco(app):
+    """Inicializa o Flask-SQLAlchemy e instala os pragmas em cada engine"""
+    configurar_banco(app)
+    db.init_app(app)
+    with app.app_context():
+        app.config.setdefault('DB_ARQUIVO', _caminho_arquivo(db.engine))
+        if app.config['DB_ARQUIVO'] and not os.path.exists(app.config['DB_ARQUIVO']):
+            open(app.config['DB_ARQUIVO'], 'ab').close()  # arquivo vazio é um banco SQLite vazio
+        for chave, engine in db.engines.items():
+            _instalar_pragmas(engine, app.config, somente_leitura=chave == BIND_LEITURA)
+
+@contextmanager
+def sessao_leitura():
+    """Sessão no pool somente leitura, para rotas que apenas consultam"""
+    sessao = Session(bind=db.engines.get(BIND_LEITURA, db.engine))
+    try:
+        yield sessao
+    finally:
+        sessao.close()
+
+# ==================== VERIFICAÇÃO ====================
+
+def _descrever_engine(engine):
+    pool = engine.pool
+    info = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'dialeto': engine.dialect.name,
+        'pool': type(pool).__name__,
+    }
+    if hasattr(pool, 'size'):
+        info.update(pool_size=pool.size(), max_overflow=getattr(pool, '_max_overflow', None),
+                    pool_timeout=getattr(pool, '_timeout', None))
+
+    with engine.connect() as conexao:
+        conexao.execute(text('SELECT 1'))
+        if engine.dialect.name == 'sqlite':
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size',
+                           'query_only'):
+                info[pragma] = conexao.execute(text(f'PRAGMA {pragma}')).scalar()
+            info['synchronous'] = ('OFF', 'NORMAL', 'FULL', 'EXTRA')[info['synchronous']]
+            bancos = {nome: caminho for _, nome, caminho in conexao.execute(text('PRAGMA database_list'))}
+            info['arquivo'] = bancos.get(ESQUEMA_ARQUIVO)
+    return info
+
+def verificar_banco():
+    """Conecta a cada engine e devolve as configurações efetivas (pragmas lidos da conexão)
+
+    O engine principal vem primeiro: é a conexão dele que ativa o WAL no arquivo.
+    """
+    engines = sorted(db.engines.items(), key=lambda item: item[0] is not None)
+    return {chave or 'principal': _descrever_engine(engine) for chave, engine in engines}
@@ -37,36 +37,101 @@ class Usuario(UserMixin, db.Model):
     def __repr__(self):
         return f'<Usuario {self.nome}>'
 
+class TokenApi(db.Model):
+    """Token de acesso às APIs para leitores e integrações (guardado apenas como SHA-256)"""
+    __tablename__ = 'tokens_api'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)  # cliente: leitor, ERP...
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)  # responsável pelas movimentações
+    digest = db.Column(db.String(64), unique=True, nullable=False)
+    prefixo = db.Column(db.String(12), nullable=False)  # início do token, para identificação
+    escopos = db.Column(db.String(100), nullable=False)  # separados por vírgula
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    revogado_em = db.Column(db.DateTime)
+
+    usuario = db.relationship('Usuario')
+
+    @property
+    def lista_escopos(self):
+        return self.escopos.split(',') if self.escopos else []
+
+    def __repr__(self):
+        return f'<TokenApi {self.nome}>'
+
 class Produto(db.Model):
     """Modelo para produtos/materiais do estoque"""
     __tablename__ = 'produtos'
+    __table_args__ = (
+        # Listagem de alertas ordenada por nome direto do índice
+        db.Index('ix_produtos_alerta_nome', 'em_alerta', 'nome'),
+        # Filtro por categoria ordenado por nome (e a chave estrangeira)
+        db.Index('ix_produtos_categoria_nome', 'categoria_id', 'nome'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(50), unique=True, nullable=False)
-    nome = db.Column(db.String(100), nullable=False)
+    nome = db.Column(db.String(100), nullable=False, index=True)
     descricao = db.Column(db.Text)
     quantidade = db.Column(db.Integer, default=0, nullable=False)
     estoque_minimo = db.Column(db.Integer, default=10, nullable=False)
     preco = db.Column(db.Float, default=0.0)
-    categoria = db.Column(db.String(50))
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'))
     data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
     ativo = db.Column(db.Boolean, default=True)
     
+    # Estado de estoque baixo materializado (ativo e quantidade <= estoque_minimo),
+    # mantido onde o estoque muda para que os alertas sejam consultas por índice
+    em_alerta = db.Column(db.Boolean, default=False, server_default='0', nullable=False)
+    alerta_desde = db.Column(db.DateTime)
+    
+    # Versão da linha (ETag) e data da última alteração (Last-Modified); o onupdate
+    # vale também para os UPDATEs em massa dos serviços
+    versao = db.Column(db.Integer, default=1, server_default='1', nullable=False,
+                       onupdate=db.literal_column('versao') + 1)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Sequência global de alteração para a sincronização das réplicas (gatilhos do SQLite)
+    sequencia = db.Column(db.Integer, index=True)
+    
     # Relacionamento com movimentações
     movimentacoes = db.relationship('MovimentacaoEstoque', backref='produto', lazy=True)
     
-    def __init__(self, codigo, nome, descricao='', estoque_minimo=10, preco=0.0, categoria=''):
+    def __init__(self, codigo, nome, descricao='', estoque_minimo=10, preco=0.0, categoria_id=None):
         self.codigo = codigo
         self.nome = nome
         self.descricao = descricao
         self.estoque_minimo = estoque_minimo
         self.preco = preco
-        self.categoria = categoria
+        self.categoria_id = categoria_id
     
     def estoque_baixo(self):
         """Verifica se o produto está com estoque baixo"""
         return self.quantidade <= self.estoque_minimo
     
+    def atualizar_alerta(self):
+        """Recalcula o indicador de estoque baixo após alterar quantidade, mínimo ou ativo
+
+        Retorna True se o produto entrou ou saiu do alerta.
+        """
+        baixo = bool(self.ativo is not False and (self.quantidade or 0) <= self.estoque_minimo)
+        mudou = baixo != bool(self.em_alerta)
+        if baixo and not self.em_alerta:
+            self.alerta_desde = datetime.utcnow()
+        elif not baixo:
+            self.alerta_desde = None
+        self.em_alerta = baixo
+        return mudou
+    
+    @property
+    def status(self):
+        """Situação do estoque: zerado, baixo ou normal"""
+        if self.quantidade == 0:
+            return 'zerado'
+        if self.estoque_baixo():
+            return 'baixo'
+        return 'normal'
+    
     def adicionar_estoque(self, quantidade):
         """Adiciona quantidade ao estoque"""
         self.quantidade += quantidade
@@ -84,6 +149,11 @@ class Produto(db.Model):
 class MovimentacaoEstoque(db.Model):
     """Modelo para controle de movimentações de estoque"""
     __tablename__ = 'movimentacoes_estoque'
+    __table_args__ = (
+        # Paginação por cursor em (data_movimentacao, id), geral e por produto
+        db.Index('ix_movimentacoes_data', 'data_movimentacao'),
+        db.Index('ix_movimentacoes_produto_data', 'produto_id', 'data_movimentacao'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False)
@@ -93,6 +163,10 @@ class MovimentacaoEstoque(db.Model):
     data_movimentacao = db.Column(db.DateTime, default=datetime.utcnow)
     observacao = db.Column(db.Text)
     
+    # Identificador gerado pelo cliente (PDV/coletor offline): reenvios não duplicam
+    id_cliente = db.Column(db.String(64), unique=True, index=True)
+    sequencia = db.Column(db.Integer, index=True)
+    
     def __init__(self, produto_id, usuario_id, tipo, quantidade, observacao=''):
         self.produto_id = produto_id
         self.usuario_id = usuario_id
@@ -103,6 +177,20 @@ class MovimentacaoEstoque(db.Model):
     def __repr__(self):
         return f'<Movimentacao {self.tipo} - {self.quantidade} unidades>'
 
+class ParticaoMovimentacao(db.Model):
+    """Mês de movimentações movido para o banco de arquivo (tabela própria, somente leitura)"""
+    __tablename__ = 'particoes_movimentacoes'
+    
+    periodo = db.Column(db.String(7), primary_key=True)  # AAAA-MM
+    tabela = db.Column(db.String(50), nullable=False)  # nome da tabela no banco de arquivo
+    inicio = db.Column(db.DateTime, nullable=False)
+    fim = db.Column(db.DateTime, nullable=False)  # exclusivo: início do mês seguinte
+    linhas = db.Column(db.Integer, nullable=False)
+    arquivado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<Particao {self.periodo} ({self.linhas} linhas)>'
+
 class Categoria(db.Model):
     """Modelo para categorias de produtos"""
     __tablename__ = 'categorias'
@@ -112,10 +200,152 @@ class Categoria(db.Model):
     descricao = db.Column(db.Text)
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    sequencia = db.Column(db.Integer, index=True)
     
     def __init__(self, nome, descricao=''):
         self.nome = nome
         self.descricao = descricao
     
     def __repr__(self):
-        return f'<Categoria {self.nome}>'
\ No newline at end of file
+        return f'<Categoria {self.nome}>'
+
+class Contador(db.Model):
+    """Contadores nomeados compartilhados entre processos (ex.: versão dos dados de estoque)"""
+    __tablename__ = 'contadores'
+    
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<Contador {self.nome}={self.valor}>'
+
+class ResumoEstoque(db.Model):
+    """Totais pré-calculados do dashboard, atualizados de forma incremental nas escritas
+
+    grupo 'geral' (chaves 'produtos' e 'alertas'), 'categoria' (chave = id da
+    categoria, '' para produtos sem categoria) e 'dia' (chave 'AAAA-MM-DD:entrada'
+    ou 'AAAA-MM-DD:saida').
+    """
+    __tablename__ = 'resumo_estoque'
+    
+    grupo = db.Column(db.String(20), primary_key=True)
+    chave = db.Column(db.String(80), primary_key=True)
+    total = db.Column(db.Integer, default=0, nullable=False)  # produtos ou movimentações
+    quantidade = db.Column(db.Integer, default=0, nullable=False)  # unidades
+    valor = db.Column(db.Float, default=0.0, nullable=False)  # preco * quantidade
+    
+    def __repr__(self):
+        return f'<Resumo {self.grupo}:{self.chave}>'
+
+class EventoEstoque(db.Model):
+    """Eventos de estoque gravados junto com a alteração e distribuídos aos clientes (SSE)"""
+    __tablename__ = 'eventos_estoque'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)  # movimentacao, estoque, alerta
+    dados = db.Column(db.Text, nullable=False)  # JSON
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<Evento {self.id} {self.tipo}>'
+
+class SnapshotEstoque(db.Model):
+    """Fechamento diário de um produto (só nos dias em que houve movimentação)"""
+    __tablename__ = 'snapshots_estoque'
+    
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), primary_key=True)
+    data = db.Column(db.Date, primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False)  # saldo no fim do dia
+    entradas = db.Column(db.Integer, default=0, nullable=False)
+    saidas = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<Snapshot {self.produto_id} {self.data}={self.quantidade}>'
+
+class SnapshotDia(db.Model):
+    """Fechamento diário do estoque inteiro (uma linha por dia)"""
+    __tablename__ = 'snapshots_dia'
+    
+    data = db.Column(db.Date, primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False)  # unidades em estoque no fim do dia
+    entradas = db.Column(db.Integer, default=0, nullable=False)
+    saidas = db.Column(db.Integer, default=0, nullable=False)
+    movimentacoes = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<SnapshotDia {self.data}={self.unidades}>'
+
+class AnaliseProduto(db.Model):
+    """Indicadores calculados em lote por produto (curva ABC, giro, previsão de ruptura)"""
+    __tablename__ = 'analises_produtos'
+    __table_args__ = (
+        db.Index('ix_analises_classe_valor', 'classe_abc', 'valor_consumo'),
+        db.Index('ix_analises_dias_ruptura', 'dias_ate_ruptura'),
+    )
+    
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), primary_key=True)
+    classe_abc = db.Column(db.String(1), nullable=False)
+    consumo = db.Column(db.Integer, default=0, nullable=False)  # unidades saídas na janela
+    valor_consumo = db.Column(db.Float, default=0.0, nullable=False)  # consumo * preco
+    participacao_acumulada = db.Column(db.Float, default=0.0, nullable=False)  # fração 0-1
+    estoque_medio = db.Column(db.Float, default=0.0, nullable=False)
+    giro = db.Column(db.Float)  # consumo / estoque médio na janela
+    consumo_diario = db.Column(db.Float, default=0.0, nullable=False)
+    dias_ate_ruptura = db.Column(db.Float)  # None: sem consumo na janela
+    data_ruptura = db.Column(db.Date)
+    janela_dias = db.Column(db.Integer, nullable=False)
+    calculado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<Analise {self.produto_id} {self.classe_abc}>'
+
+class RecomendacaoEstoque(db.Model):
+    """Estoque mínimo recomendado (ponto de pedido) calculado a partir das saídas"""
+    __tablename__ = 'recomendacoes_estoque'
+    
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), primary_key=True)
+    estoque_minimo_atual = db.Column(db.Integer, nullable=False)  # valor no momento do cálculo
+    estoque_minimo_sugerido = db.Column(db.Integer, nullable=False)
+    diferenca = db.Column(db.Integer, nullable=False, index=True)  # sugerido - atual
+    consumo_medio = db.Column(db.Float, nullable=False)  # unidades por dia
+    desvio_consumo = db.Column(db.Float, nullable=False)  # desvio padrão diário
+    prazo_dias = db.Column(db.Integer, nullable=False)
+    nivel_servico = db.Column(db.Float, nullable=False)
+    calculado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    aplicado_em = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Recomendacao {self.produto_id} {self.estoque_minimo_atual}->{self.estoque_minimo_sugerido}>'
+
+class Tarefa(db.Model):
+    """Tarefa em segundo plano (importação, recálculo, reconstrução) na fila persistente"""
+    __tablename__ = 'tarefas'
+    __table_args__ = (
+        # Próxima tarefa pendente já liberada para execução
+        db.Index('ix_tarefas_fila', 'estado', 'disponivel_em'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    descricao = db.Column(db.String(200), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    estado = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluida, falhou, cancelada
+    progresso = db.Column(db.Float)  # fração 0-1; None quando não há como estimar
+    mensagem = db.Column(db.String(200))
+    resultado = db.Column(db.Text)  # JSON
+    erro = db.Column(db.Text)
+    tentativas = db.Column(db.Integer, default=0, nullable=False)
+    max_tentativas = db.Column(db.Integer, default=3, nullable=False)
+    cancelar = db.Column(db.Boolean, default=False, nullable=False)  # cancelamento pedido durante a execução
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    trabalhador = db.Column(db.String(100))  # host:pid do processo que executa
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    disponivel_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # espera entre tentativas
+    iniciado_em = db.Column(db.DateTime)
+    batimento = db.Column(db.DateTime)  # último sinal de vida do trabalhador
+    concluido_em = db.Column(db.DateTime)
+    
+    usuario = db.relationship('Usuario')
+    
+    def __repr__(self):
+        return f'<Tarefa {self.id} {self.tipo} {self.estado}>'
@@ -0,0 +1,205 @@
+"""Criação e atualização incremental do esquema do banco de dados"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateColumn
+
+from models.database import db
+
+# Índice de busca textual (SQLite FTS5) sincronizado com a tabela produtos.
+# Só produtos ativos são indexados; a exclusão lógica remove o produto do índice.
+# Os gatilhos de UPDATE só disparam quando muda um campo indexado ou o ativo,
+# então movimentações de estoque não tocam no índice.
+SQL_BUSCA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+        codigo, nome, descricao,
+        content='produtos', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos WHEN new.ativo BEGIN
+        INSERT INTO produtos_fts(rowid, codigo, nome, descricao)
+        VALUES (new.id, new.codigo, new.nome, new.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos WHEN old.ativo BEGIN
+        INSERT INTO produtos_fts(produtos_fts, rowid, codigo, nome, descricao)
+        VALUES ('delete', old.id, old.codigo, old.nome, old.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS produtos_fts_au_del AFTER UPDATE OF codigo, nome, descricao, ativo
+        ON produtos WHEN old.ativo BEGIN
+        INSERT INTO produtos_fts(produtos_fts, rowid, codigo, nome, descricao)
+        VALUES ('delete', old.id, old.codigo, old.nome, old.descricao);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS produtos_fts_au_ins AFTER UPDATE OF codigo, nome, descricao, ativo
+        ON produtos WHEN new.ativo BEGIN
+        INSERT INTO produtos_fts(rowid, codigo, nome, descricao)
+        VALUES (new.id, new.codigo, new.nome, new.descricao);
+    END""",
+    # Relevância: código pesa mais que nome, que pesa mais que descrição
+    """INSERT INTO produtos_fts(produtos_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')""",
+]
+
+# Sequência de sincronização: cada inserção ou alteração relevante em produtos,
+# categorias e movimentações recebe o próximo valor do contador 'sincronizacao'.
+# Os gatilhos de UPDATE só disparam quando muda um campo enviado às réplicas.
+CONTADOR_SINCRONIZACAO = 'sincronizacao'
+TABELAS_SINCRONIZADAS = {  # tabela: colunas cuja alteração gera nova sequência
+    'categorias': ('nome', 'descricao', 'ativo'),
+    'produtos': ('codigo', 'nome', 'descricao', 'quantidade', 'estoque_minimo', 'preco', 'categoria_id',
+                 'ativo'),
+    'movimentacoes_estoque': (),  # só inserções
+}
+
+def _sql_sincronizacao():
+    proxima = f"""UPDATE contadores SET valor = valor + 1 WHERE nome = '{CONTADOR_SINCRONIZACAO}';
+        UPDATE {{tabela}} SET sequencia = (SELECT valor FROM contadores WHERE nome = '{CONTADOR_SINCRONIZACAO}')
+        WHERE id = new.id;"""
+    comandos = []
+    for tabela, colunas in TABELAS_SINCRONIZADAS.items():
+        corpo = proxima.format(tabela=tabela)
+        comandos.append(f"""CREATE TRIGGER IF NOT EXISTS {tabela}_sync_ai AFTER INSERT ON {tabela} BEGIN
+        {corpo}
+    END""")
+        if colunas:
+            mudou = ' OR '.join(f'old.{c} IS NOT new.{c}' for c in colunas)
+            comandos.append(f"""CREATE TRIGGER IF NOT EXISTS {tabela}_sync_au AFTER UPDATE OF {', '.join(colunas)}
+        ON {tabela} WHEN {mudou} BEGIN
+        {corpo}
+    END""")
+    return comandos
+
+def _eh_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+def _tabela_existe(nome):
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :nome"), {'nome': nome}
+    ).first() is not None
+
+def reindexar_busca():
+    """Reconstrói o índice de busca a partir dos produtos ativos"""
+    db.session.execute(text("INSERT INTO produtos_fts(produtos_fts) VALUES ('delete-all')"))
+    db.session.execute(text(
+        "INSERT INTO produtos_fts(rowid, codigo, nome, descricao) "
+        "SELECT id, codigo, nome, descricao FROM produtos WHERE ativo"
+    ))
+    db.session.commit()
+
+def criar_indice_busca():
+    """Cria o índice FTS5 e seus gatilhos; indexa o catálogo existente na primeira vez"""
+    if not _eh_sqlite():
+        return False
+    novo = not _tabela_existe('produtos_fts')
+    for comando in SQL_BUSCA:
+        db.session.execute(text(comando))
+    db.session.commit()
+    if novo:
+        reindexar_busca()
+    return True
+
+def numerar_sincronizacao():
+    """Atribui sequências às linhas existentes (categorias, produtos e depois movimentações)
+
+    Usado na primeira vez que os gatilhos são criados: a numeração parte do id
+    de cada tabela, deslocada para não se sobrepor às anteriores, e o contador
+    continua do maior valor atribuído.
+    """
+    proxima = 0
+    for tabela in TABELAS_SINCRONIZADAS:
+        db.session.execute(text(f'UPDATE {tabela} SET sequencia = id + :base'), {'base': proxima})
+        proxima += db.session.execute(text(f'SELECT coalesce(max(id), 0) FROM {tabela}')).scalar()
+    db.session.execute(text('UPDATE contadores SET valor = :valor WHERE nome = :nome'),
+                       {'valor': proxima, 'nome': CONTADOR_SINCRONIZACAO})
+    db.session.commit()
+
+def criar_sincronizacao():
+    """Cria o contador e os gatilhos da sequência de sincronização; numera as linhas existentes na primeira vez"""
+    if not _eh_sqlite():
+        return False
+    novo = not _tabela_existe('produtos_sync_ai')
+    db.session.execute(text('INSERT OR IGNORE INTO contadores (nome, valor) VALUES (:nome, 0)'),
+                       {'nome': CONTADOR_SINCRONIZACAO})
+    for comando in _sql_sincronizacao():
+        db.session.execute(text(comando))
+    db.session.commit()
+    if novo:
+        numerar_sincronizacao()
+    return True
+
+def adicionar_colunas():
+    """Adiciona às tabelas existentes as colunas novas dos modelos (ALTER TABLE ADD COLUMN)
+
+    Retorna o conjunto de 'tabela.coluna' adicionados, para que dados derivados
+    possam ser preenchidos na primeira execução.
+    """
+    inspetor = inspect(db.engine)
+    adicionadas = set()
+    for tabela in db.metadata.sorted_tables:
+        existentes = {c['name'] for c in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in existentes:
+                continue
+            ddl = CreateColumn(coluna).compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {ddl}'))
+            adicionadas.add(f'{tabela.name}.{coluna.name}')
+    db.session.commit()
+    return adicionadas
+
+def criar_indices():
+    """Cria índices declarados nos modelos que ainda não existem em tabelas antigas"""
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(db.engine, checkfirst=True)
+
+def migrar_categorias():
+    """Liga os produtos às categorias pelo texto da antiga coluna produtos.categoria
+
+    Cria as categorias que faltam, preenche categoria_id e remove a coluna de
+    texto (em SQLite anterior ao DROP COLUMN ela é esvaziada, para não ser
+    remapeada). Retorna o número de produtos ligados, ou None se não havia o que migrar.
+    """
+    from services.categorias import mapear_categorias
+
+    if 'categoria' not in {c['name'] for c in inspect(db.engine).get_columns('produtos')}:
+        return None
+
+    ligados = None
+    if db.session.execute(text('SELECT 1 FROM produtos WHERE categoria IS NOT NULL LIMIT 1')).first():
+        nomes = [nome for (nome,) in db.session.execute(text(
+            "SELECT DISTINCT trim(categoria) FROM produtos "
+            "WHERE categoria_id IS NULL AND trim(coalesce(categoria, '')) != ''"
+        ))]
+        ligados = 0
+        for nome, categoria_id in mapear_categorias(nomes).items():
+            ligados += db.session.execute(text(
+                "UPDATE produtos SET categoria_id = :id WHERE categoria_id IS NULL AND trim(categoria) = :nome"
+            ), {'id': categoria_id, 'nome': nome}).rowcount
+        db.session.commit()
+
+    try:
+        db.session.execute(text('ALTER TABLE produtos DROP COLUMN categoria'))
+    except OperationalError:
+        db.session.rollback()
+        if ligados is not None:
+            db.session.execute(text('UPDATE produtos SET categoria = NULL'))
+    db.session.commit()
+    return ligados
+
+def atualizar_esquema():
+    """Cria as tabelas e colunas que faltam e os objetos auxiliares (índices, gatilhos)"""
+    from services.alertas import reconstruir_alertas
+    from services.resumo import reconstruir_resumo
+
+    novas = set(db.metadata.tables) - set(inspect(db.engine).get_table_names())
+    db.create_all()
+    adicionadas = adicionar_colunas()
+    criar_indices()
+    criar_indice_busca()
+    criar_sincronizacao()
+
+    categorias_migradas = migrar_categorias() is not None
+
+    if 'produtos.em_alerta' in adicionadas:
+        reconstruir_alertas()
+    # O resumo por categoria passou a usar o id como chave
+    if 'resumo_estoque' in novas or 'produtos.em_alerta' in adicionadas or categorias_migradas:
+        reconstruir_resumo()
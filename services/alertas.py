@@ -0,0 +1,71 @@
+"""Conjunto materializado de produtos com estoque baixo"""
+from datetime import datetime
+
+from sqlalchemy import and_, or_, case, func, select, update
+
+from models.database import db, Produto
+from services.resumo import reconstruir_resumo
+
+def condicao_estoque_baixo(quantidade=Produto.quantidade):
+    """Predicado original do alerta, avaliado sobre as colunas (ou a nova quantidade)"""
+    return and_(Produto.ativo == True, quantidade <= Produto.estoque_minimo)
+
+def valores_alerta(quantidade=Produto.quantidade):
+    """Valores de em_alerta/alerta_desde para um UPDATE que altera a quantidade
+
+    `quantidade` é a expressão da nova quantidade (ex.: Produto.quantidade + delta).
+    No UPDATE as colunas do lado direito ainda têm os valores antigos, então um
+    produto que já estava em alerta mantém alerta_desde e um que entra recebe agora.
+    """
+    baixo = condicao_estoque_baixo(quantidade)
+    return {
+        'em_alerta': case((baixo, True), else_=False),
+        'alerta_desde': case((baixo, func.coalesce(Produto.alerta_desde, datetime.utcnow())), else_=None),
+    }
+
+def recalcular_alertas(ids=None):
+    """Recalcula o indicador para os produtos informados (ou todos) com um único UPDATE"""
+    stmt = update(Produto).values(**valores_alerta())\
+        .execution_options(synchronize_session=False)
+    if ids is not None:
+        stmt = stmt.where(Produto.id.in_(list(ids)))
+    return db.session.execute(stmt).rowcount
+
+def _divergente():
+    """Produtos cujo indicador não corresponde ao predicado original"""
+    baixo = condicao_estoque_baixo()
+    return or_(
+        Produto.em_alerta != case((baixo, True), else_=False),
+        and_(Produto.em_alerta == True, Produto.alerta_desde.is_(None)),
+        and_(Produto.em_alerta == False, Produto.alerta_desde.isnot(None))
+    )
+
+def divergencias_alerta():
+    """Quantidade de produtos com indicador de alerta inconsistente"""
+    return db.session.execute(
+        select(func.count()).select_from(Produto).where(_divergente())
+    ).scalar()
+
+def reconstruir_alertas():
+    """Corrige o indicador dos produtos divergentes; retorna quantos foram corrigidos"""
+    corrigidos = db.session.execute(
+        update(Produto).where(_divergente()).values(**valores_alerta())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return corrigidos
+
+def corrigir_alertas():
+    """reconstruir_alertas e, se algo mudou, o resumo do dashboard (que guarda a contagem de alertas)
+
+    Usado pelo comando reconstruir-alertas e pela tarefa de mesmo nome.
+    """
+    corrigidos = reconstruir_alertas()
+    if corrigidos:
+        reconstruir_resumo()
+    return corrigidos
+
+def contar_alertas():
+    return db.session.execute(
+        select(func.count()).select_from(Produto).where(Produto.em_alerta == True)
+    ).scalar()
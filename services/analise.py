@@ -0,0 +1,219 @@
+"""Análises de estoque vetorizadas: curva ABC, giro e previsão de ruptura
+
+Produtos ativos e movimentações da janela são lidos de uma vez em arrays
+colunares NumPy (as movimentações já somadas por produto, dia e tipo no
+banco); todos os indicadores do catálogo são calculados com operações
+vetorizadas (bincount, argsort, cumsum) e gravados na tabela
+analises_produtos, que a página /relatorios e a API leem. Requer o pacote
+numpy apenas para recalcular.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select
+
+from models.database import db, AnaliseProduto, Produto
+from services.arquivo import segmentos
+from services.cache import incrementar_contador, ler_contador
+
+JANELA_PADRAO = 90  # dias de movimentação considerados
+LIMITE_A = 0.80  # participação acumulada no valor consumido
+LIMITE_B = 0.95
+TAMANHO_BLOCO = 1000  # linhas por INSERT
+CONTADOR_ANALISES = 'analises'  # versão do último recálculo (ETag de /relatorios)
+
+_analises = AnaliseProduto.__table__
+
+class AnaliseError(Exception):
+    """Erro que impede o cálculo das análises"""
+
+def carregar_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AnaliseError('O cálculo das análises requer o pacote numpy.')
+    return numpy
+
+def carregar_dados(dias=JANELA_PADRAO, agora=None, produtos=None):
+    """Leitura em massa para as análises, em arrays colunares
+
+    Retorna um dicionário com os arrays dos produtos ativos (id, quantidade,
+    preco, estoque_minimo, ordenados por id) e das movimentações da janela
+    somadas por produto e dia (indice: posição do produto nos arrays acima,
+    dia: 0 = primeiro dia da janela, entradas, saidas). `produtos` é uma
+    subconsulta opcional de ids que restringe a leitura.
+    """
+    np = carregar_numpy()
+    agora = agora or datetime.utcnow()
+    inicio = (agora - timedelta(days=dias - 1)).date()
+
+    stmt_produtos = select(Produto.id, Produto.quantidade, func.coalesce(Produto.preco, 0.0),
+                           Produto.estoque_minimo).where(Produto.ativo == True).order_by(Produto.id)
+    if produtos is not None:
+        stmt_produtos = stmt_produtos.where(Produto.id.in_(produtos))
+
+    # Um SELECT por segmento da janela (tabela quente e meses arquivados, se a janela os alcança)
+    desde = datetime.combine(inicio, datetime.min.time())
+    stmts_movimentos = []
+    for segmento in segmentos(desde):
+        c = segmento.c
+        dia = func.date(c.data_movimentacao)
+        stmt = select(
+            c.produto_id, dia,
+            func.sum(case((c.tipo == 'entrada', c.quantidade), else_=0)),
+            func.sum(case((c.tipo == 'saida', c.quantidade), else_=0))
+        ).where(c.data_movimentacao >= desde, *segmento.condicoes())\
+            .group_by(dia, c.produto_id)  # dia primeiro: percorre só a janela no índice de data
+        if produtos is not None:
+            stmt = stmt.where(c.produto_id.in_(produtos))
+        stmts_movimentos.append(stmt)
+
+    linhas = db.session.execute(stmt_produtos).all()
+    ids, quantidade, preco, estoque_minimo = (
+        np.array(coluna) for coluna in (zip(*linhas) if linhas else ((), (), (), ()))
+    )
+
+    linhas = [linha for stmt in stmts_movimentos for linha in db.session.execute(stmt)]
+    movimento_ids, datas, entradas, saidas = (
+        np.array(coluna) for coluna in (zip(*linhas) if linhas else ((), (), (), ()))
+    )
+
+    # Posição de cada linha no array de produtos; descarta produtos inativos ou removidos
+    indice = np.searchsorted(ids, movimento_ids.astype(np.int64)) if len(ids) else \
+        np.zeros(len(movimento_ids), dtype=np.int64)
+    valido = indice < len(ids)
+    valido[valido] = ids[indice[valido]] == movimento_ids[valido]
+    offset = (datas.astype('datetime64[D]') - np.datetime64(inicio, 'D')).astype(np.int64) \
+        if len(datas) else np.zeros(0, dtype=np.int64)
+
+    return {
+        'inicio': inicio,
+        'dias': dias,
+        'ids': ids.astype(np.int64),
+        'quantidade': quantidade.astype(np.int64),
+        'preco': preco.astype(np.float64),
+        'estoque_minimo': estoque_minimo.astype(np.int64),
+        'indice': indice[valido],
+        'dia': offset[valido],
+        'entradas': entradas[valido].astype(np.int64),
+        'saidas': saidas[valido].astype(np.int64),
+    }
+
+def calcular_indicadores(dados):
+    """Indicadores de todos os produtos a partir dos arrays de carregar_dados
+
+    - classe ABC pelo valor consumido (saídas * preço), acumulado em ordem decrescente;
+    - estoque médio exato da janela: média dos saldos de fechamento de cada dia,
+      reconstruídos a partir da quantidade atual;
+    - giro = consumo / estoque médio e dias até a ruptura = saldo / consumo diário.
+    """
+    np = carregar_numpy()
+    n, dias = len(dados['ids']), dados['dias']
+    indice = dados['indice']
+
+    consumo = np.bincount(indice, weights=dados['saidas'], minlength=n)
+    liquido = dados['entradas'] - dados['saidas']
+    # fechamento(d) = atual - soma dos líquidos dos dias > d; somando os `dias` fechamentos,
+    # cada movimentação é descontada uma vez por dia da janela anterior a ela
+    descontos = np.bincount(indice, weights=liquido * dados['dia'], minlength=n)
+    estoque_medio = np.maximum(dados['quantidade'] - descontos / dias, 0.0)
+
+    valor = consumo * dados['preco']
+    ordem = np.argsort(-valor, kind='stable')
+    total = valor.sum()
+    acumulado = np.empty(n)
+    acumulado[ordem] = np.cumsum(valor[ordem]) / total if total > 0 else 0.0
+    # A participação antes do próprio item decide a classe: o primeiro item é sempre A
+    anterior = acumulado - (valor / total if total > 0 else 0.0)
+    classe = np.where(anterior < LIMITE_A, 'A', np.where(anterior < LIMITE_B, 'B', 'C'))
+    classe[valor <= 0] = 'C'
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        giro = np.where(estoque_medio > 0, consumo / estoque_medio, np.nan)
+        consumo_diario = consumo / dias
+        dias_ruptura = np.where(consumo_diario > 0, dados['quantidade'] / consumo_diario, np.nan)
+
+    return {
+        'ids': dados['ids'],
+        'classe_abc': classe,
+        'consumo': consumo.astype(np.int64),
+        'valor_consumo': valor,
+        'participacao_acumulada': acumulado,
+        'estoque_medio': estoque_medio,
+        'giro': giro,
+        'consumo_diario': consumo_diario,
+        'dias_ate_ruptura': dias_ruptura,
+    }
+
+def _opcional(valor, casas):
+    return None if valor != valor else round(float(valor), casas)  # NaN -> None
+
+def recalcular_analises(dias=JANELA_PADRAO):
+    """Recalcula e grava os indicadores do catálogo inteiro; retorna quantos produtos"""
+    agora = datetime.utcnow()
+    indicadores = calcular_indicadores(carregar_dados(dias, agora))
+    hoje = agora.date()
+
+    linhas = []
+    for i, produto_id in enumerate(indicadores['ids'].tolist()):
+        dias_ruptura = _opcional(indicadores['dias_ate_ruptura'][i], 1)
+        linhas.append({
+            'produto_id': produto_id,
+            'classe_abc': str(indicadores['classe_abc'][i]),
+            'consumo': int(indicadores['consumo'][i]),
+            'valor_consumo': round(float(indicadores['valor_consumo'][i]), 2),
+            'participacao_acumulada': round(float(indicadores['participacao_acumulada'][i]), 6),
+            'estoque_medio': round(float(indicadores['estoque_medio'][i]), 2),
+            'giro': _opcional(indicadores['giro'][i], 4),
+            'consumo_diario': round(float(indicadores['consumo_diario'][i]), 4),
+            'dias_ate_ruptura': dias_ruptura,
+            'data_ruptura': hoje + timedelta(days=int(dias_ruptura)) if dias_ruptura is not None
+                            and dias_ruptura < 36500 else None,
+            'janela_dias': dias,
+            'calculado_em': agora,
+        })
+
+    db.session.execute(delete(_analises))
+    for i in range(0, len(linhas), TAMANHO_BLOCO):
+        db.session.execute(insert(_analises), linhas[i:i + TAMANHO_BLOCO])
+    incrementar_contador(CONTADOR_ANALISES)
+    db.session.commit()
+    return len(linhas)
+
+# ==================== CONSULTAS ====================
+
+def versao_analises():
+    return ler_contador(CONTADOR_ANALISES)
+
+ORDENACOES = {
+    'ruptura': (_analises.c.dias_ate_ruptura,),
+    'valor': (_analises.c.valor_consumo.desc(),),
+    'giro': (_analises.c.giro.is_(None), _analises.c.giro.desc()),
+}
+
+def consultar_analises(classe=None, ordem='valor', limite=50):
+    """Linhas da tabela de análises com código e nome do produto"""
+    stmt = select(_analises, Produto.codigo, Produto.nome, Produto.quantidade, Produto.estoque_minimo)\
+        .join(Produto, Produto.id == _analises.c.produto_id)
+    if classe:
+        stmt = stmt.where(_analises.c.classe_abc == classe)
+    if ordem == 'ruptura':
+        stmt = stmt.where(_analises.c.dias_ate_ruptura.isnot(None))
+    stmt = stmt.order_by(*ORDENACOES.get(ordem, ORDENACOES['valor']), _analises.c.produto_id).limit(limite)
+    return [dict(linha) for linha in db.session.execute(stmt).mappings()]
+
+def resumo_abc():
+    """Quantidade de produtos, valor consumido e participação de cada classe"""
+    linhas = db.session.execute(
+        select(_analises.c.classe_abc, func.count(), func.sum(_analises.c.valor_consumo),
+               func.max(_analises.c.calculado_em), func.max(_analises.c.janela_dias))
+        .group_by(_analises.c.classe_abc)
+    ).all()
+    total = sum(linha[2] or 0 for linha in linhas)
+    classes = {c: {'classe': c, 'produtos': 0, 'valor_consumo': 0.0, 'participacao': 0.0} for c in 'ABC'}
+    calculado_em = janela = None
+    for classe, produtos, valor, calculado, dias in linhas:
+        classes[classe].update(produtos=produtos, valor_consumo=round(valor or 0, 2),
+                               participacao=round((valor or 0) / total, 4) if total else 0.0)
+        calculado_em = max(filter(None, (calculado_em, calculado)), default=None)
+        janela = dias
+    return {'classes': list(classes.values()), 'calculado_em': calculado_em, 'janela_dias': janela}
@@ -0,0 +1,258 @@
+"""Movimentações particionadas por mês, com os meses antigos em um banco de arquivo
+
+A tabela movimentacoes_estoque (quente) guarda só os meses recentes. Os meses
+antigos são movidos, um por vez, para tabelas próprias (movimentacoes_AAAA_MM)
+no banco de arquivo, anexado somente leitura como `arquivo` em todas as
+conexões (models/conexao.py). O catálogo particoes_movimentacoes, no banco
+principal, diz quais meses estão arquivados; as consultas percorrem só os
+segmentos (tabela quente e meses arquivados) que cruzam o período pedido, do
+mais recente para o mais antigo. Assim a listagem, o dashboard e as escritas
+custam conforme o volume recente, não conforme o histórico inteiro.
+
+O arquivamento roda com o sistema no ar (comando arquivar-movimentacoes ou a
+tarefa em segundo plano), mês a mês:
+
+1. copia o mês para uma tabela nova no arquivo, em uma conexão própria, e
+   confere linhas e quantidades com a origem;
+2. registra o mês no catálogo: a partir daí as consultas leem o mês do arquivo
+   e, na tabela quente, ignoram tudo antes do fim do último mês arquivado;
+3. apaga as linhas do mês da tabela quente em blocos (transações curtas, sem
+   segurar o escritor).
+
+Uma interrupção antes do passo 2 deixa só uma tabela sem catálogo, refeita na
+próxima execução; depois dele, a próxima execução termina a limpeza.
+
+O SQLite não tem armazenamento colunar nem compressão sem extensões; as
+tabelas do arquivo são compactas: gravadas de uma vez em ordem de id (páginas
+cheias, sem fragmentação), sem a sequência de sincronização e só com os
+índices de leitura (data e produto+data) e o índice único de id_cliente, que
+mantém a deduplicação dos lotes reenviados (services.movimentacoes) depois do
+arquivamento.
+"""
+import sqlite3
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, delete, func, insert, select
+
+from models.conexao import ESQUEMA_ARQUIVO
+from models.database import db, MovimentacaoEstoque, ParticaoMovimentacao
+from services.cache import cache, incrementar_contador, VERSAO_ESTOQUE
+
+MESES_QUENTES_PADRAO = 6  # meses completos mantidos na tabela quente, além do corrente
+TAMANHO_LIMPEZA = 5000  # linhas apagadas da tabela quente por transação
+ESPERA_ARQUIVO = 30  # segundos esperando leituras longas (exportações) liberarem o arquivo
+CACHE_COPIA = 262144  # KiB; a cópia do mês cabe no cache e o lock exclusivo fica só no commit
+
+COLUNAS = ('id', 'produto_id', 'usuario_id', 'tipo', 'quantidade', 'data_movimentacao', 'observacao',
+           'id_cliente')
+DDL_MES = """CREATE TABLE "{tabela}" (
+    id INTEGER PRIMARY KEY,
+    produto_id INTEGER NOT NULL,
+    usuario_id INTEGER NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    quantidade INTEGER NOT NULL,
+    data_movimentacao DATETIME NOT NULL,
+    observacao TEXT,
+    id_cliente VARCHAR(64)
+)"""
+INDICE_ID_CLIENTE = 'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{tabela}_id_cliente" ON "{tabela}" (id_cliente)'
+INDICES_MES = (
+    'CREATE INDEX "ix_{tabela}_data" ON "{tabela}" (data_movimentacao)',
+    'CREATE INDEX "ix_{tabela}_produto_data" ON "{tabela}" (produto_id, data_movimentacao)',
+    INDICE_ID_CLIENTE,
+)
+
+_movimentos = MovimentacaoEstoque.__table__
+_particoes = ParticaoMovimentacao.__table__
+_metadata = MetaData()
+
+class ArquivoError(Exception):
+    """Arquivamento impossível (arquivo desativado ou ocupado, cópia divergente)"""
+
+def _tabela_mes(nome):
+    """Tabela de um mês arquivado (mesmas colunas de leitura da tabela quente)"""
+    return Table(
+        nome, _metadata,
+        Column('id', Integer, primary_key=True),
+        Column('produto_id', Integer, nullable=False),
+        Column('usuario_id', Integer, nullable=False),
+        Column('tipo', String(20), nullable=False),
+        Column('quantidade', Integer, nullable=False),
+        Column('data_movimentacao', DateTime, nullable=False),
+        Column('observacao', Text),
+        Column('id_cliente', String(64)),
+        schema=ESQUEMA_ARQUIVO, keep_existing=True,
+    )
+
+class Segmento:
+    """Parte do histórico de movimentações: a tabela quente ou um mês arquivado"""
+    __slots__ = ('tabela', 'periodo', 'inicio', 'fim', 'linhas')
+
+    def __init__(self, tabela, periodo=None, inicio=None, fim=None, linhas=None):
+        self.tabela = tabela
+        self.periodo = periodo
+        self.inicio = inicio
+        self.fim = fim
+        self.linhas = linhas
+
+    @property
+    def c(self):
+        return self.tabela.c
+
+    @property
+    def arquivado(self):
+        return self.periodo is not None
+
+    def condicoes(self):
+        """Na tabela quente, descarta as sobras de meses já arquivados (limpeza em andamento)"""
+        if not self.arquivado and self.inicio is not None:
+            return [self.c.data_movimentacao >= self.inicio]
+        return []
+
+    def contido(self, inicio=None, fim=None):
+        """True se o mês arquivado está inteiro dentro de [inicio, fim)"""
+        return self.arquivado and (inicio is None or inicio <= self.inicio) and (fim is None or self.fim <= fim)
+
+    def __repr__(self):
+        return f'<Segmento {self.periodo or "quente"}>'
+
+def particoes():
+    """Meses arquivados (periodo, tabela, inicio, fim, linhas), do mais recente para o mais antigo"""
+    if not current_app.config.get('DB_ARQUIVO'):
+        return []
+    return cache.obter(('particoes_movimentacoes',), lambda: [tuple(linha) for linha in db.session.execute(
+        select(_particoes.c.periodo, _particoes.c.tabela, _particoes.c.inicio, _particoes.c.fim,
+               _particoes.c.linhas).order_by(_particoes.c.inicio.desc())
+    )])
+
+def arquivado_ate():
+    """Fim (exclusivo) do último mês arquivado, ou None"""
+    meses = particoes()
+    return meses[0][3] if meses else None
+
+def segmentos(inicio=None, fim=None):
+    """Segmentos que cruzam [inicio, fim), do mais recente para o mais antigo
+
+    A tabela quente vem primeiro e só fica de fora quando o período termina
+    antes do fim do último mês arquivado.
+    """
+    meses = particoes()
+    limite = meses[0][3] if meses else None
+    resultado = []
+    if fim is None or limite is None or fim > limite:
+        resultado.append(Segmento(_movimentos, inicio=limite))
+    for periodo, tabela, inicio_mes, fim_mes, linhas in meses:
+        if (inicio is None or fim_mes > inicio) and (fim is None or inicio_mes < fim):
+            resultado.append(Segmento(_tabela_mes(tabela), periodo, inicio_mes, fim_mes, linhas))
+    return resultado
+
+# ==================== ARQUIVAMENTO ====================
+
+def _mes(data):
+    """[início, fim) do mês de `data`"""
+    inicio = datetime(data.year, data.month, 1)
+    return inicio, datetime(data.year + data.month // 12, data.month % 12 + 1, 1)
+
+def _recuar_meses(data, meses):
+    """Primeiro dia do mês `meses` meses antes do mês de `data`"""
+    indice = data.year * 12 + data.month - 1 - meses
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+def _texto_data(data):
+    # Formato em que o SQLAlchemy grava DateTime no SQLite (comparação de texto)
+    return data.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def _copiar_mes(tabela, inicio, fim):
+    """Passo 1: grava o mês em uma tabela nova do arquivo e confere com a origem; devolve as linhas"""
+    intervalo = (_texto_data(inicio), _texto_data(fim))
+    origem_sql = f'FROM quente.{_movimentos.name} WHERE data_movimentacao >= ? AND data_movimentacao < ?'
+    colunas = ', '.join(COLUNAS)
+    conexao = sqlite3.connect(current_app.config['DB_ARQUIVO'], timeout=ESPERA_ARQUIVO, isolation_level=None)
+    try:
+        conexao.execute(f'PRAGMA cache_size = -{CACHE_COPIA}')
+        conexao.execute('ATTACH DATABASE ? AS quente', (db.engine.url.database,))
+        conexao.execute('BEGIN IMMEDIATE')
+        conexao.execute(f'DROP TABLE IF EXISTS "{tabela}"')  # sobra de uma execução interrompida
+        conexao.execute(DDL_MES.format(tabela=tabela))
+        conexao.execute(f'INSERT INTO "{tabela}" ({colunas}) SELECT {colunas} {origem_sql} ORDER BY id', intervalo)
+        for indice in INDICES_MES:
+            conexao.execute(indice.format(tabela=tabela))
+
+        origem = conexao.execute(f'SELECT count(*), total(quantidade) {origem_sql}', intervalo).fetchone()
+        copia = conexao.execute(f'SELECT count(*), total(quantidade) FROM "{tabela}"').fetchone()
+        if origem != copia:
+            conexao.execute('ROLLBACK')
+            raise ArquivoError(f'Cópia de {inicio:%Y-%m} divergente: origem {origem}, arquivo {copia}.')
+        conexao.execute('COMMIT')
+        return copia[0]
+    except sqlite3.OperationalError as e:
+        if conexao.in_transaction:
+            conexao.execute('ROLLBACK')
+        raise ArquivoError(f'Não foi possível gravar no arquivo: {e}')
+    finally:
+        conexao.close()
+
+def _indexar_meses():
+    """Cria o índice único de id_cliente nos meses arquivados antes de ele existir"""
+    tabelas = db.session.execute(select(_particoes.c.tabela)).scalars().all()
+    if not tabelas:
+        return
+    conexao = sqlite3.connect(current_app.config['DB_ARQUIVO'], timeout=ESPERA_ARQUIVO, isolation_level=None)
+    try:
+        for tabela in tabelas:
+            conexao.execute(INDICE_ID_CLIENTE.format(tabela=tabela))
+    except sqlite3.OperationalError as e:
+        raise ArquivoError(f'Não foi possível gravar no arquivo: {e}')
+    finally:
+        conexao.close()
+
+def _limpar_mes(inicio, fim, tamanho=TAMANHO_LIMPEZA):
+    """Passo 3: apaga o mês arquivado da tabela quente, um bloco por transação"""
+    removidas = 0
+    while True:
+        bloco = select(_movimentos.c.id).where(_movimentos.c.data_movimentacao >= inicio,
+                                               _movimentos.c.data_movimentacao < fim).limit(tamanho)
+        apagadas = db.session.execute(delete(_movimentos).where(_movimentos.c.id.in_(bloco.scalar_subquery()))).rowcount
+        db.session.commit()
+        removidas += apagadas
+        if apagadas < tamanho:
+            return removidas
+
+def arquivar_movimentacoes(meses_quentes=MESES_QUENTES_PADRAO, agora=None, aviso=None):
+    """Move para o arquivo os meses completos anteriores aos `meses_quentes` mais recentes
+
+    Retorna [(periodo, linhas)] dos meses arquivados; `aviso(periodo, linhas)`,
+    se informado, é chamado a cada mês. Pode ser interrompido e repetido.
+    """
+    if not current_app.config.get('DB_ARQUIVO'):
+        raise ArquivoError('O arquivamento requer o banco SQLite em arquivo (veja DATABASE_ARQUIVO).')
+    limite = _recuar_meses(agora or datetime.utcnow(), max(meses_quentes, 0))
+
+    _indexar_meses()
+    # Limpezas interrompidas de execuções anteriores
+    for inicio, fim in db.session.execute(select(_particoes.c.inicio, _particoes.c.fim)).all():
+        _limpar_mes(inicio, fim)
+
+    arquivados = []
+    while True:
+        ultimo = db.session.execute(select(func.max(_particoes.c.fim))).scalar()
+        primeira = db.session.execute(
+            select(func.min(_movimentos.c.data_movimentacao))
+            .where(_movimentos.c.data_movimentacao >= (ultimo or datetime.min))
+        ).scalar()
+        if primeira is None or primeira >= limite:
+            return arquivados
+
+        inicio, fim = _mes(primeira)
+        periodo, tabela = f'{inicio:%Y-%m}', f'movimentacoes_{inicio:%Y_%m}'
+        linhas = _copiar_mes(tabela, inicio, fim)
+        db.session.execute(insert(_particoes).values(periodo=periodo, tabela=tabela, inicio=inicio, fim=fim,
+                                                     linhas=linhas, arquivado_em=datetime.utcnow()))
+        incrementar_contador(VERSAO_ESTOQUE)  # caches e ETags passam a ver o novo catálogo
+        db.session.commit()
+        _limpar_mes(inicio, fim)
+
+        arquivados.append((periodo, linhas))
+        if aviso:
+            aviso(periodo, linhas)
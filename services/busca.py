@@ -0,0 +1,141 @@
+"""Busca textual de produtos com índice FTS5 (SQLite)"""
+import re
+
+from sqlalchemy import or_, select, table, column, text
+
+from models.database import db, Produto
+from services.cache import CacheVersionado
+
+_produtos_fts = table('produtos_fts', column('rowid'), column('rank'), column('produtos_fts'))
+_TERMO = re.compile(r'\w+', re.UNICODE)
+
+_disponivel = {}
+
+SUGESTOES_PADRAO = 10
+SUGESTOES_MAX = 50
+MIN_CARACTERES = 2  # o índice de prefixos do FTS5 cobre prefixos de 2 e 3 letras
+
+def fts_disponivel():
+    """Verifica (uma vez por engine) se o índice FTS5 existe no banco"""
+    engine = db.engine
+    if engine not in _disponivel:
+        _disponivel[engine] = engine.dialect.name == 'sqlite' and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'produtos_fts'")
+        ).first() is not None
+    return _disponivel[engine]
+
+def expressao_fts(busca):
+    """Converte o texto digitado em uma consulta FTS5 de prefixos combinados com AND
+
+    Cada palavra vira um termo entre aspas (neutralizando a sintaxe do FTS5)
+    seguido de '*' para casar prefixos: 'note del' -> "note"* "del"*
+    """
+    termos = _TERMO.findall(busca)
+    if not termos:
+        return None
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+def produto_por_codigo(codigo):
+    """Caminho rápido: busca exata pelo código usando o índice único"""
+    return db.session.execute(
+        select(Produto.id).where(Produto.codigo == codigo.strip())
+    ).scalar()
+
+def subconsulta_relevancia(busca):
+    """Subconsulta (produto_id, relevancia) com os produtos que casam com a busca
+
+    Retorna None quando o FTS5 não está disponível; nesse caso use condicao_busca.
+    """
+    expressao = expressao_fts(busca)
+    if expressao is None or not fts_disponivel():
+        return None
+    return select(
+        _produtos_fts.c.rowid.label('produto_id'),
+        _produtos_fts.c.rank.label('relevancia')
+    ).where(_produtos_fts.c.produtos_fts.op('MATCH')(expressao)).subquery('busca')
+
+def condicao_busca(busca):
+    """Condição SQL para filtrar produtos pela busca, sem ordenação por relevância"""
+    produto_id = produto_por_codigo(busca)
+    if produto_id is not None:
+        return Produto.id == produto_id
+
+    expressao = expressao_fts(busca)
+    if expressao is not None and fts_disponivel():
+        return Produto.id.in_(
+            select(_produtos_fts.c.rowid).where(_produtos_fts.c.produtos_fts.op('MATCH')(expressao))
+        )
+
+    return _condicao_substring(busca)
+
+def _condicao_substring(busca):
+    """Busca por substring, usada quando o FTS5 não está disponível (outros bancos)"""
+    return (
+        (Produto.nome.contains(busca)) |
+        (Produto.codigo.contains(busca)) |
+        (Produto.descricao.contains(busca))
+    )
+
+def aplicar_busca(query, busca):
+    """Aplica a busca a uma query de Produto
+
+    Retorna (query, relevancia): relevancia é a coluna de ordenação por
+    relevância do FTS5, ou None quando não há ranking (código exato ou sem FTS5).
+    """
+    produto_id = produto_por_codigo(busca)
+    if produto_id is not None:
+        return query.filter(Produto.id == produto_id), None
+
+    relevancia = subconsulta_relevancia(busca)
+    if relevancia is None:
+        return query.filter(_condicao_substring(busca)), None
+    return query.join(relevancia, relevancia.c.produto_id == Produto.id), relevancia.c.relevancia
+
+# ==================== SUGESTÕES (AUTOCOMPLETAR) ====================
+
+# Termos digitados com frequência respondem da memória até a próxima escrita no estoque
+sugestoes_cache = CacheVersionado(max_itens=2048)
+
+def sugerir_produtos(termo, limite=SUGESTOES_PADRAO):
+    """Produtos ativos cujo código ou nome tem palavras começando pelo que foi digitado
+
+    Devolve até `limite` dicionários (id, codigo, nome) ordenados pelo nome,
+    com o produto de código exatamente igual ao termo em primeiro lugar.
+    """
+    termo = ' '.join(termo.split())[:100]
+    limite = max(1, min(limite, SUGESTOES_MAX))
+    if len(termo) < MIN_CARACTERES:
+        return []
+    return sugestoes_cache.obter(('sugestoes', termo, limite), lambda: _buscar_sugestoes(termo, limite))
+
+def _buscar_sugestoes(termo, limite):
+    consulta = select(Produto.id, Produto.codigo, Produto.nome).where(Produto.ativo == True)
+    expressao = expressao_fts(termo)
+    if expressao is not None and fts_disponivel():
+        # Sem ORDER BY rank: ordenar por relevância exigiria pontuar todos os produtos que
+        # casam com um prefixo curto; na ordem do índice o LIMIT encerra a leitura cedo
+        consulta = consulta.join(_produtos_fts, _produtos_fts.c.rowid == Produto.id).where(
+            _produtos_fts.c.produtos_fts.op('MATCH')(f'{{codigo nome}} : ({expressao})')
+        )
+    else:
+        consulta = consulta.where(or_(Produto.codigo.startswith(termo, autoescape=True),
+                                      Produto.nome.startswith(termo, autoescape=True)))\
+            .order_by(Produto.nome)
+
+    linhas = sorted((dict(linha) for linha in db.session.execute(consulta.limit(limite)).mappings()),
+                    key=lambda linha: linha['nome'].casefold())
+    # Código completo (ex.: leitor de código de barras) sempre em primeiro, mesmo fora do limite
+    exato = opcao_produto(produto_por_codigo(termo))
+    if exato:
+        linhas = [exato] + [linha for linha in linhas if linha['id'] != exato['id']][:limite - 1]
+    return linhas
+
+def opcao_produto(produto_id):
+    """(id, codigo, nome) de um produto ativo, para exibir a escolha atual de um campo"""
+    if not produto_id:
+        return None
+    linha = db.session.execute(
+        select(Produto.id, Produto.codigo, Produto.nome)
+        .where(Produto.id == produto_id, Produto.ativo == True)
+    ).mappings().first()
+    return dict(linha) if linha else None
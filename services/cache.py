@@ -0,0 +1,127 @@
+"""Cache em processo para valores globais (contadores, listas de apoio) com invalidação por versão
+
+Cada escrita em produtos, movimentações ou categorias incrementa a linha
+'estoque' da tabela contadores na mesma transação. Uma entrada do cache só é
+usada se foi calculada na versão atual, então todos os workers (gunicorn)
+enxergam a alteração no próximo request sem precisar de um cache externo.
+A versão é lida uma vez por request (consulta por chave primária).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.database import db, Contador
+
+VERSAO_ESTOQUE = 'estoque'
+TABELAS_MONITORADAS = {'produtos', 'movimentacoes_estoque', 'categorias'}
+TTL_PADRAO = 300  # segundos; limite de segurança para escritas feitas fora da aplicação
+MAX_ITENS = 512
+
+_contadores = Contador.__table__
+
+def ler_contador(nome, conexao=None):
+    stmt = select(_contadores.c.valor).where(_contadores.c.nome == nome)
+    valor = (conexao or db.session).execute(stmt).scalar()
+    return valor or 0
+
+def incrementar_contador(nome, conexao=None):
+    """Incrementa (criando se necessário) um contador na transação corrente"""
+    conexao = conexao or db.session
+    resultado = conexao.execute(
+        update(_contadores).where(_contadores.c.nome == nome).values(valor=_contadores.c.valor + 1)
+    )
+    if resultado.rowcount == 0:
+        conexao.execute(insert(_contadores).values(nome=nome, valor=1))
+
+def versao_atual():
+    """Versão dos dados de estoque, memorizada no request corrente"""
+    if not has_app_context():
+        return ler_contador(VERSAO_ESTOQUE)
+    if '_versao_estoque' not in g:
+        g._versao_estoque = ler_contador(VERSAO_ESTOQUE)
+    return g._versao_estoque
+
+class CacheVersionado:
+    """LRU com TTL cujas entradas valem apenas para a versão em que foram calculadas"""
+    def __init__(self, max_itens=MAX_ITENS, ttl=TTL_PADRAO):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, calcular, ttl=None):
+        """Devolve o valor em cache para `chave` ou o calcula com `calcular()`"""
+        versao = versao_atual()
+        agora = time.monotonic()
+        with self._trava:
+            registro = self._itens.get(chave)
+            if registro and registro[1] == versao and registro[2] > agora:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return registro[0]
+            self.falhas += 1
+
+        valor = calcular()
+        with self._trava:
+            self._itens[chave] = (valor, versao, agora + (ttl or self.ttl))
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(self.acertos / total, 4) if total else None,
+            'versao': versao_atual(),
+        }
+
+cache = CacheVersionado()
+
+# ==================== INVALIDAÇÃO ====================
+
+def _marcar_alteracao(session):
+    """Incrementa a versão uma vez por transação, antes do commit que publica a alteração"""
+    if session.info.get('versao_incrementada'):
+        return
+    session.info['versao_incrementada'] = True
+    incrementar_contador(VERSAO_ESTOQUE, session.connection())
+
+@event.listens_for(Session, 'do_orm_execute')
+def _apos_execucao_dml(estado):
+    # UPDATE/INSERT/DELETE em massa (serviços de movimentação e importação)
+    if not (estado.is_update or estado.is_insert or estado.is_delete):
+        return
+    tabela = getattr(estado.statement, 'table', None)
+    if getattr(tabela, 'name', None) in TABELAS_MONITORADAS:
+        _marcar_alteracao(estado.session)
+
+@event.listens_for(Session, 'after_flush')
+def _apos_flush(session, contexto):
+    # Alterações feitas por objetos do ORM (cadastro, edição e exclusão de produtos)
+    alterados = list(session.new) + list(session.deleted) + \
+        [obj for obj in session.dirty if session.is_modified(obj)]
+    if any(getattr(obj, '__tablename__', None) in TABELAS_MONITORADAS for obj in alterados):
+        _marcar_alteracao(session)
+
+@event.listens_for(Session, 'after_commit')
+def _apos_commit(session):
+    if session.info.pop('versao_incrementada', False) and has_app_context():
+        g.pop('_versao_estoque', None)
+
+@event.listens_for(Session, 'after_rollback')
+def _apos_rollback(session):
+    session.info.pop('versao_incrementada', None)
@@ -0,0 +1,73 @@
+"""Respostas condicionais (ETag / Last-Modified) para APIs de leitura e páginas de listagem"""
+import hashlib
+import time
+from functools import wraps
+
+from flask import g, make_response, request, session
+from flask_login import current_user
+
+# Páginas HTML levam um token CSRF com validade limitada (WTF_CSRF_TIME_LIMIT,
+# 1 hora por padrão); a janela entra na ETag para que uma cópia revalidada
+# nunca carregue um token vencido.
+JANELA_CSRF = 1800
+
+def _etag(partes):
+    return hashlib.sha1(repr(partes).encode()).hexdigest()[:32]
+
+def _identidade():
+    """Quem fez o request: o token de API (Authorization: Bearer) ou o usuário da sessão"""
+    cliente = g.get('cliente_api')
+    if cliente is not None:
+        return 'token', cliente.token_id
+    return current_user.get_id()
+
+def condicional(partes, cache_control='private, no-cache', html=False, ultima_modificacao=None):
+    """Decorator: responde 304 a If-None-Match/If-Modified-Since antes de executar a view
+
+    `partes(**kwargs)` devolve o que identifica a versão do conteúdo (ex.: versão
+    da linha do produto ou versão global do estoque) ou None quando não há
+    como validar (a view roda normalmente, ex.: 404). `ultima_modificacao(**kwargs)`
+    é opcional e alimenta Last-Modified. A ETag inclui quem pediu (usuário da
+    sessão ou token de API), e a resposta varia por Cookie e Authorization:
+    um cache compartilhado nunca entrega a resposta de um cliente a outro.
+    Páginas HTML usam ETag fraca, já que o conteúdo (menu, permissões) varia
+    com o usuário.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            # Mensagens flash pendentes precisam ser exibidas (e consumidas) pela página
+            if html and session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            chave = partes(**kwargs)
+            if chave is None:
+                return view(*args, **kwargs)
+            chave = (chave, _identidade())
+            if html:
+                chave += (int(time.time() // JANELA_CSRF),)
+            etag = _etag(chave)
+            modificado = ultima_modificacao(**kwargs) if ultima_modificacao else None
+
+            if request.if_none_match:
+                igual = request.if_none_match.contains_weak(etag) if html \
+                    else request.if_none_match.contains(etag)
+            else:
+                igual = modificado is not None and request.if_modified_since is not None \
+                    and modificado.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+
+            if igual:
+                resposta = make_response('', 304)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag, weak=html)
+            if modificado is not None:
+                resposta.last_modified = modificado
+            resposta.headers['Cache-Control'] = cache_control
+            resposta.vary.add('Cookie')
+            resposta.vary.add('Authorization')
+            return resposta
+        return decorated_function
+    return decorator
@@ -0,0 +1,73 @@
+"""Categorias de produtos: índice em cache e conversão de nomes em ids
+
+Os produtos apontam para a tabela categorias por categoria_id, indexado junto
+com o nome para que o filtro da listagem e a ordenação usem o mesmo índice.
+Nomes de categoria só aparecem nas bordas (formulário, importação,
+exportação); por dentro tudo é id.
+
+A lista de categorias com o número de produtos ativos de cada uma vem do
+resumo pré-calculado (grupo 'categoria'), sem varrer produtos, e fica no cache
+versionado até a próxima escrita no estoque: o filtro da listagem não custa
+consulta nenhuma.
+"""
+from sqlalchemy import String, cast, func, insert, select
+
+from models.database import db, Categoria, ResumoEstoque
+from services.cache import cache
+
+_categorias = Categoria.__table__
+_resumo = ResumoEstoque.__table__
+
+def _carregar_indice():
+    contagem = select(_resumo.c.chave, _resumo.c.total)\
+        .where(_resumo.c.grupo == 'categoria').subquery()
+    linhas = db.session.execute(
+        select(_categorias.c.id, _categorias.c.nome, func.coalesce(contagem.c.total, 0).label('produtos'))
+        .outerjoin(contagem, contagem.c.chave == cast(_categorias.c.id, String))
+        .where(_categorias.c.ativo == True)
+        .order_by(_categorias.c.nome)
+    ).mappings()
+    return [dict(linha) for linha in linhas]
+
+def indice_categorias():
+    """Categorias ativas por nome: [{'id', 'nome', 'produtos'}], em cache até a próxima escrita"""
+    return cache.obter('categorias', _carregar_indice)
+
+def nome_categoria(categoria_id):
+    """Nome da categoria, inclusive desativada (o índice só traz as ativas)"""
+    if categoria_id is None:
+        return ''
+    nome = next((c['nome'] for c in indice_categorias() if c['id'] == categoria_id), None)
+    if nome is None:
+        categoria = db.session.get(Categoria, categoria_id)
+        nome = categoria.nome if categoria else ''
+    return nome
+
+def id_categoria(nome):
+    """Id da categoria existente com esse nome (ativa ou não), ou None; nunca cria"""
+    nome = (nome or '').strip()
+    categoria_id = next((c['id'] for c in indice_categorias() if c['nome'] == nome), None)
+    if categoria_id is None and nome:
+        categoria_id = db.session.execute(select(_categorias.c.id).where(_categorias.c.nome == nome)).scalar()
+    return categoria_id
+
+def mapear_categorias(nomes):
+    """{nome: id} para os nomes informados, criando as categorias que ainda não existem"""
+    nomes = {nome.strip() for nome in nomes if nome and nome.strip()}
+    if not nomes:
+        return {}
+    ids = dict(db.session.execute(
+        select(_categorias.c.nome, _categorias.c.id).where(_categorias.c.nome.in_(nomes))
+    ).all())
+    faltando = sorted(nomes - set(ids))
+    if faltando:
+        db.session.execute(insert(_categorias), [{'nome': nome, 'descricao': '', 'ativo': True}
+                                                 for nome in faltando])
+        ids.update(db.session.execute(
+            select(_categorias.c.nome, _categorias.c.id).where(_categorias.c.nome.in_(faltando))
+        ).all())
+    return ids
+
+def obter_categoria_id(nome):
+    """Id da categoria com esse nome (criada se necessário); None para nome vazio"""
+    return mapear_categorias([nome or '']).get((nome or '').strip())
@@ -0,0 +1,225 @@
+"""Instrumentação por request: consultas SQL, tempo de banco e de template
+
+Eventos do SQLAlchemy (before/after_cursor_execute, em todos os engines) e
+os sinais de template do Flask medem cada request em `g`; no after_request
+a medição vira um registro com endpoint, status, duração, consultas, tempo
+de banco, tempo de template, tamanho da resposta e as instruções mais lentas
+(SQL normalizado, sem valores). Uma mesma instrução repetida muitas vezes no
+request é marcada como suspeita de N+1 (ex.: lazy load por linha da lista).
+
+Os registros ficam em um buffer circular em memória (últimos N requests) de
+onde saem os agregados da página /admin/desempenho; contadores acumulados
+por endpoint alimentam a exportação no formato texto do Prometheus. Cada
+resposta leva o cabeçalho Server-Timing (db, render e total).
+Respostas em streaming são medidas até o envio dos cabeçalhos.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TAMANHO_BUFFER = 2000  # requests recentes mantidos
+LIMITE_N1 = 10  # execuções da mesma instrução em um request para marcar N+1
+INSTRUCOES_POR_REQUEST = 5  # mais lentas guardadas por request
+FAIXAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # segundos
+
+_LITERAIS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?, ...)'),  # listas do IN
+    (re.compile(r'\s+'), ' '),
+)
+
+def normalizar_sql(sql):
+    """SQL sem literais e com listas do IN colapsadas, para agrupar instruções iguais"""
+    for padrao, troca in _LITERAIS:
+        sql = padrao.sub(troca, sql)
+    return sql.strip()
+
+class Desempenho:
+    """Buffer circular dos requests medidos e contadores acumulados por endpoint"""
+    def __init__(self, tamanho=TAMANHO_BUFFER):
+        self.registros = deque(maxlen=tamanho)
+        self.totais = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, registro):
+        with self._trava:
+            self.registros.append(registro)
+            chave = (registro['endpoint'], registro['metodo'])
+            total = self.totais.get(chave)
+            if total is None:
+                total = self.totais[chave] = {
+                    'requests': 0, 'erros': 0, 'segundos': 0.0, 'segundos_db': 0.0, 'segundos_render': 0.0,
+                    'consultas': 0, 'bytes': 0, 'n_mais_1': 0, 'faixas': [0] * len(FAIXAS_LATENCIA),
+                }
+            total['requests'] += 1
+            total['erros'] += registro['status'] >= 500
+            total['segundos'] += registro['duracao']
+            total['segundos_db'] += registro['tempo_db']
+            total['segundos_render'] += registro['tempo_render']
+            total['consultas'] += registro['consultas']
+            total['bytes'] += registro['bytes'] or 0
+            total['n_mais_1'] += bool(registro['n_mais_1'])
+            for i, limite in enumerate(FAIXAS_LATENCIA):
+                if registro['duracao'] <= limite:
+                    total['faixas'][i] += 1
+
+    def limpar(self):
+        with self._trava:
+            self.registros.clear()
+            self.totais.clear()
+
+    def agregados(self):
+        """Resumo por endpoint dos requests no buffer, mais lentos primeiro"""
+        with self._trava:
+            registros = list(self.registros)
+
+        grupos = {}
+        for registro in registros:
+            grupos.setdefault((registro['endpoint'], registro['metodo']), []).append(registro)
+
+        resultado = []
+        for (endpoint, metodo), itens in grupos.items():
+            duracoes = sorted(r['duracao'] for r in itens)
+            n = len(itens)
+            instrucoes = {}
+            suspeitas = Counter()
+            for r in itens:
+                for sql, duracao in r['lentas']:
+                    instrucoes[sql] = max(instrucoes.get(sql, 0), duracao)
+                for sql, vezes in r['n_mais_1']:
+                    suspeitas[sql] = max(suspeitas[sql], vezes)
+            resultado.append({
+                'endpoint': endpoint,
+                'metodo': metodo,
+                'requests': n,
+                'p50_ms': duracoes[n // 2] * 1000,
+                'p95_ms': duracoes[min(n - 1, int(n * 0.95))] * 1000,
+                'max_ms': duracoes[-1] * 1000,
+                'consultas': sum(r['consultas'] for r in itens) / n,
+                'db_ms': sum(r['tempo_db'] for r in itens) / n * 1000,
+                'render_ms': sum(r['tempo_render'] for r in itens) / n * 1000,
+                'bytes': sum(r['bytes'] or 0 for r in itens) / n,
+                'lentas': sorted(instrucoes.items(), key=lambda item: -item[1])[:INSTRUCOES_POR_REQUEST],
+                'n_mais_1': suspeitas.most_common(),
+            })
+        return sorted(resultado, key=lambda item: -item['p95_ms'])
+
+    def prometheus(self):
+        """Contadores acumulados no formato texto de exposição do Prometheus"""
+        with self._trava:
+            totais = {chave: dict(total, faixas=list(total['faixas'])) for chave, total in self.totais.items()}
+
+        linhas = []
+        metricas = (
+            ('estoque_http_requests_total', 'counter', 'Requests atendidos', 'requests'),
+            ('estoque_http_erros_total', 'counter', 'Respostas 5xx', 'erros'),
+            ('estoque_sql_consultas_total', 'counter', 'Consultas SQL executadas', 'consultas'),
+            ('estoque_sql_segundos_total', 'counter', 'Tempo gasto no banco', 'segundos_db'),
+            ('estoque_template_segundos_total', 'counter', 'Tempo de renderização de templates', 'segundos_render'),
+            ('estoque_http_resposta_bytes_total', 'counter', 'Bytes enviados nas respostas', 'bytes'),
+            ('estoque_n_mais_1_total', 'counter', 'Requests com suspeita de N+1', 'n_mais_1'),
+        )
+        for nome, tipo, ajuda, campo in metricas:
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+            for (endpoint, metodo), total in sorted(totais.items()):
+                linhas.append(f'{nome}{{{_rotulos(endpoint, metodo)}}} {total[campo]}')
+
+        nome = 'estoque_http_duracao_segundos'
+        linhas += [f'# HELP {nome} Duração dos requests', f'# TYPE {nome} histogram']
+        for (endpoint, metodo), total in sorted(totais.items()):
+            rotulos = _rotulos(endpoint, metodo)
+            for limite, quantidade in zip(FAIXAS_LATENCIA, total['faixas']):
+                linhas.append(f'{nome}_bucket{{{rotulos},le="{limite}"}} {quantidade}')
+            linhas.append(f'{nome}_bucket{{{rotulos},le="+Inf"}} {total["requests"]}')
+            linhas.append(f'{nome}_sum{{{rotulos}}} {total["segundos"]}')
+            linhas.append(f'{nome}_count{{{rotulos}}} {total["requests"]}')
+        return '\n'.join(linhas) + '\n'
+
+def _rotulos(endpoint, metodo):
+    endpoint = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+    return f'endpoint="{endpoint}",metodo="{metodo}"'
+
+desempenho = Desempenho()
+
+# ==================== MEDIÇÃO ====================
+
+def _medicao():
+    if has_request_context():
+        return g.get('_medicao')
+    return None
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _antes_consulta(conexao, cursor, sql, parametros, contexto, executemany):
+    if _medicao() is not None:
+        conexao.info.setdefault('_inicio_consulta', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _apos_consulta(conexao, cursor, sql, parametros, contexto, executemany):
+    medicao = _medicao()
+    inicios = conexao.info.get('_inicio_consulta')
+    if medicao is None or not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    medicao['consultas'] += 1
+    medicao['tempo_db'] += duracao
+    instrucao = medicao['instrucoes'].setdefault(normalizar_sql(sql), [0, 0.0])
+    instrucao[0] += 1
+    instrucao[1] = max(instrucao[1], duracao)
+
+def _antes_template(app, template, context, **extra):
+    medicao = _medicao()
+    if medicao is not None:
+        medicao['inicio_render'].append(time.perf_counter())
+
+def _apos_template(app, template, context, **extra):
+    medicao = _medicao()
+    if medicao is not None and medicao['inicio_render']:
+        medicao['tempo_render'] += time.perf_counter() - medicao['inicio_render'].pop()
+
+def iniciar_medicao():
+    g._medicao = {
+        'inicio': time.perf_counter(), 'consultas': 0, 'tempo_db': 0.0, 'tempo_render': 0.0,
+        'inicio_render': [], 'instrucoes': {},
+    }
+
+def finalizar_medicao(resposta):
+    """Registra o request no buffer e adiciona o cabeçalho Server-Timing"""
+    medicao = g.pop('_medicao', None)
+    if medicao is None:
+        return resposta
+
+    duracao = time.perf_counter() - medicao['inicio']
+    instrucoes = medicao['instrucoes']
+    desempenho.registrar({
+        'instante': time.time(),
+        'endpoint': request.endpoint or '(sem rota)',
+        'metodo': request.method,
+        'status': resposta.status_code,
+        'duracao': duracao,
+        'consultas': medicao['consultas'],
+        'tempo_db': medicao['tempo_db'],
+        'tempo_render': medicao['tempo_render'],
+        'bytes': None if resposta.is_streamed else resposta.calculate_content_length(),
+        'lentas': sorted(((sql, dados[1]) for sql, dados in instrucoes.items()),
+                         key=lambda item: -item[1])[:INSTRUCOES_POR_REQUEST],
+        'n_mais_1': [(sql, dados[0]) for sql, dados in instrucoes.items() if dados[0] >= LIMITE_N1],
+    })
+    resposta.headers.add(
+        'Server-Timing',
+        f'db;dur={medicao["tempo_db"] * 1000:.1f};desc="{medicao["consultas"]} consultas", '
+        f'render;dur={medicao["tempo_render"] * 1000:.1f}, total;dur={duracao * 1000:.1f}'
+    )
+    return resposta
+
+def instalar(app):
+    """Liga a medição aos hooks de request e aos sinais de template da aplicação"""
+    app.before_request(iniciar_medicao)
+    app.after_request(finalizar_medicao)
+    before_render_template.connect(_antes_template, app)
+    template_rendered.connect(_apos_template, app)
@@ -0,0 +1,186 @@
+"""Canal de eventos de estoque para clientes conectados via Server-Sent Events
+
+As alterações gravam seus eventos na tabela eventos_estoque dentro da mesma
+transação, então um evento só existe se a movimentação foi confirmada. Cada
+processo tem um único leitor (thread) que busca os eventos novos e os
+distribui para as filas dos clientes conectados; as conexões ociosas ficam
+apenas esperando na sua fila. Em produção a aplicação roda com os workers
+gevent de gunicorn.conf.py: cada conexão é uma greenlet, e milhares de
+clientes ociosos não ocupam threads do servidor. Fora deles (ex.: `python
+app.py`) cada conexão aberta prende uma thread, e o hub avisa no log.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from models.database import db, EventoEstoque, ResumoEstoque
+
+INTERVALO_LEITURA = 0.5  # segundos entre consultas por eventos novos
+INTERVALO_LIMPEZA = 60
+RETENCAO = timedelta(hours=1)  # eventos mais antigos não podem mais ser reenviados
+LIMITE_LEITURA = 500
+TAMANHO_FILA = 1000  # por cliente; um cliente lento perde eventos em vez de acumular memória
+INTERVALO_PING = 15
+
+logger = logging.getLogger(__name__)
+
+_eventos = EventoEstoque.__table__
+
+def _conexoes_cooperativas():
+    """True quando o processo roda com o monkey-patching do gevent (filas e esperas cooperativas)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+# ==================== PUBLICAÇÃO ====================
+
+def publicar(eventos):
+    """Grava eventos (lista de (tipo, dados)) na transação corrente"""
+    if not eventos:
+        return
+    agora = datetime.utcnow()
+    db.session.execute(insert(_eventos), [
+        {'tipo': tipo, 'dados': json.dumps(dados, separators=(',', ':')), 'criado_em': agora}
+        for tipo, dados in eventos
+    ])
+
+def total_alertas():
+    """Total de produtos em alerta, lido do resumo do dashboard (chave primária)"""
+    return db.session.execute(
+        select(ResumoEstoque.total).where(ResumoEstoque.grupo == 'geral', ResumoEstoque.chave == 'alertas')
+    ).scalar() or 0
+
+def evento_alerta(produto_id, em_alerta, quantidade, total=None):
+    """Produto entrou ou saiu do alerta de estoque baixo"""
+    return ('alerta', {
+        'produto_id': produto_id,
+        'em_alerta': bool(em_alerta),
+        'quantidade': quantidade,
+        'total_alertas': total_alertas() if total is None else total,
+    })
+
+def eventos_produto(produto_id, quantidade, em_alerta, estava_em_alerta, total=None):
+    """Eventos de mudança de saldo e, se houver, de entrada/saída do alerta"""
+    eventos = [('estoque', {'produto_id': produto_id, 'quantidade': quantidade})]
+    if bool(em_alerta) != bool(estava_em_alerta):
+        eventos.append(evento_alerta(produto_id, em_alerta, quantidade, total))
+    return eventos
+
+def eventos_movimentacao(movimentacao, linha):
+    """Eventos de uma movimentação individual a partir do RETURNING do UPDATE do produto"""
+    delta = movimentacao.quantidade if movimentacao.tipo == 'entrada' else -movimentacao.quantidade
+    estava_em_alerta = linha.quantidade - delta <= linha.estoque_minimo
+    return [('movimentacao', {
+        'id': movimentacao.id,
+        'produto_id': movimentacao.produto_id,
+        'tipo': movimentacao.tipo,
+        'quantidade': movimentacao.quantidade,
+    })] + eventos_produto(movimentacao.produto_id, linha.quantidade, linha.em_alerta, estava_em_alerta)
+
+# ==================== DISTRIBUIÇÃO ====================
+
+def formatar(evento):
+    """Serializa (id, tipo, dados) no formato text/event-stream"""
+    id_evento, tipo, dados = evento
+    return f'id: {id_evento}\nevent: {tipo}\ndata: {dados}\n\n'
+
+def eventos_desde(ultimo_id, limite=LIMITE_LEITURA):
+    return [tuple(linha) for linha in db.session.execute(
+        select(_eventos.c.id, _eventos.c.tipo, _eventos.c.dados)
+        .where(_eventos.c.id > ultimo_id).order_by(_eventos.c.id).limit(limite)
+    )]
+
+class HubEventos:
+    """Distribui os eventos gravados para as filas dos clientes deste processo"""
+    def __init__(self):
+        self._filas = set()
+        self._trava = threading.Lock()
+        self._leitor = None
+        self._ultimo = None
+
+    @property
+    def assinantes(self):
+        return len(self._filas)
+
+    def assinar(self, app):
+        """Registra um cliente e inicia o leitor do processo na primeira assinatura"""
+        fila = queue.Queue(maxsize=TAMANHO_FILA)
+        with self._trava:
+            self._filas.add(fila)
+            if self._leitor is None or not self._leitor.is_alive():
+                if not _conexoes_cooperativas():
+                    logger.warning('Canal de eventos sem workers gevent: cada conexão aberta ocupa uma thread '
+                                   'do servidor (use gunicorn -c gunicorn.conf.py).')
+                self._leitor = threading.Thread(target=self._executar, args=(app,),
+                                                name='hub-eventos', daemon=True)
+                self._leitor.start()
+        return fila
+
+    def cancelar(self, fila):
+        with self._trava:
+            self._filas.discard(fila)
+
+    def _distribuir(self, eventos):
+        with self._trava:
+            filas = list(self._filas)
+        for evento in eventos:
+            for fila in filas:
+                try:
+                    fila.put_nowait(evento)
+                except queue.Full:
+                    pass
+
+    def _executar(self, app):
+        with app.app_context():
+            proxima_limpeza = 0
+            while True:
+                eventos = []
+                try:
+                    if self._ultimo is None:
+                        self._ultimo = db.session.execute(select(func.max(_eventos.c.id))).scalar() or 0
+                    eventos = eventos_desde(self._ultimo)
+                    if eventos:
+                        self._ultimo = eventos[-1][0]
+                        self._distribuir(eventos)
+
+                    if time.monotonic() >= proxima_limpeza:
+                        db.session.execute(delete(_eventos).where(
+                            _eventos.c.criado_em < datetime.utcnow() - RETENCAO))
+                        db.session.commit()
+                        proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+                except Exception:
+                    logger.exception('Falha ao ler eventos de estoque')
+                finally:
+                    # Não mantém transação de leitura aberta entre as consultas
+                    db.session.remove()
+                # Com a leitura cheia ainda há eventos acumulados: busca de novo sem esperar
+                if len(eventos) < LIMITE_LEITURA:
+                    time.sleep(INTERVALO_LEITURA)
+
+hub = HubEventos()
+
+def fluxo_eventos(fila, pendentes, intervalo_ping=INTERVALO_PING):
+    """Gerador da resposta SSE: reenvia os pendentes e segue com os eventos ao vivo"""
+    try:
+        yield 'retry: 5000\n\n'
+        ultimo = 0
+        for evento in pendentes:
+            ultimo = evento[0]
+            yield formatar(evento)
+        while True:
+            try:
+                evento = fila.get(timeout=intervalo_ping)
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            if evento[0] > ultimo:
+                yield formatar(evento)
+    finally:
+        hub.cancelar(fila)
@@ -0,0 +1,126 @@
+"""Exportação em streaming de produtos e movimentações (CSV e NDJSON)
+
+As exportações leem pelo pool somente leitura: um download longo não ocupa
+uma conexão do pool principal enquanto o cliente recebe os dados. As
+movimentações percorrem os meses arquivados do período (do mais antigo ao mais
+recente) e depois a tabela quente, cada segmento pela sua chave primária.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models.conexao import sessao_leitura
+from models.database import db, Categoria, Usuario, Produto, MovimentacaoEstoque
+from services.arquivo import segmentos
+from services.filtros import condicoes_movimentacao, condicoes_produto, periodo_movimentacao
+
+TAMANHO_BLOCO = 2000
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUNAS_MOVIMENTACAO = (
+    MovimentacaoEstoque.id,
+    MovimentacaoEstoque.data_movimentacao,
+    MovimentacaoEstoque.tipo,
+    MovimentacaoEstoque.quantidade,
+    MovimentacaoEstoque.produto_id,
+    Produto.codigo.label('produto_codigo'),
+    Produto.nome.label('produto_nome'),
+    Usuario.nome.label('usuario'),
+    MovimentacaoEstoque.observacao,
+)
+
+COLUNAS_PRODUTO = (
+    Produto.id,
+    Produto.codigo,
+    Produto.nome,
+    Produto.descricao,
+    Categoria.nome.label('categoria'),
+    Produto.quantidade,
+    Produto.estoque_minimo,
+    Produto.preco,
+    Produto.ativo,
+    Produto.data_cadastro,
+)
+
+def iterar_por_chave(stmt, coluna_id, tamanho=TAMANHO_BLOCO, sessao=None):
+    """Percorre uma consulta em blocos ordenados pela chave primária (keyset)
+
+    Cada bloco é uma consulta independente `WHERE id > :ultimo ORDER BY id LIMIT n`,
+    então o custo por bloco não cresce com a posição e a memória fica constante.
+    """
+    sessao = sessao or db.session
+    ultimo = 0
+    while True:
+        linhas = sessao.execute(
+            stmt.where(coluna_id > ultimo).order_by(coluna_id).limit(tamanho)
+        ).all()
+        if not linhas:
+            return
+        yield linhas
+        ultimo = linhas[-1].id
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat(sep=' ', timespec='seconds')
+    return valor
+
+def _valor_json(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat(timespec='seconds')
+    return str(valor)
+
+def _serializar(blocos, campos, formato):
+    """Converte blocos de linhas em pedaços de texto prontos para a resposta"""
+    if formato == 'csv':
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(campos)
+        yield buffer.getvalue()
+        for linhas in blocos:
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows([_valor_csv(v) for v in linha] for linha in linhas)
+            yield buffer.getvalue()
+    else:
+        for linhas in blocos:
+            yield ''.join(
+                json.dumps(dict(zip(campos, linha)), default=_valor_json, ensure_ascii=False) + '\n'
+                for linha in linhas
+            )
+
+def _exportar(consultas, campos, formato):
+    """Serializa as consultas (stmt, coluna_id), uma após a outra"""
+    with sessao_leitura() as sessao:
+        blocos = (bloco for stmt, coluna_id in consultas
+                  for bloco in iterar_por_chave(stmt, coluna_id, sessao=sessao))
+        yield from _serializar(blocos, campos, formato)
+
+def exportar_movimentacoes(filtros, formato):
+    """Gera o conteúdo da exportação de movimentações com os filtros da listagem"""
+    consultas = []
+    for segmento in reversed(segmentos(*periodo_movimentacao(filtros))):
+        c = segmento.c
+        stmt = select(*(c[coluna.key] if coluna.table is MovimentacaoEstoque.__table__ else coluna
+                        for coluna in COLUNAS_MOVIMENTACAO))\
+            .select_from(segmento.tabela)\
+            .join(Produto, Produto.id == c.produto_id)\
+            .join(Usuario, Usuario.id == c.usuario_id)\
+            .where(*segmento.condicoes(), *condicoes_movimentacao(filtros, segmento.tabela))
+        consultas.append((stmt, c.id))
+    campos = [c.key for c in COLUNAS_MOVIMENTACAO]
+    return _exportar(consultas, campos, formato)
+
+def exportar_produtos(filtros, formato):
+    """Gera o conteúdo da exportação de produtos com os filtros da listagem"""
+    stmt = select(*COLUNAS_PRODUTO)\
+        .outerjoin(Categoria, Categoria.id == Produto.categoria_id)\
+        .where(*condicoes_produto(filtros))
+    campos = [c.key for c in COLUNAS_PRODUTO]
+    return _exportar([(stmt, Produto.id)], campos, formato)
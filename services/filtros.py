@@ -0,0 +1,98 @@
+"""Filtros compartilhados entre listagens, exportações e APIs"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import false
+
+from models.database import Produto, MovimentacaoEstoque
+from services.busca import condicao_busca
+from services.categorias import id_categoria
+
+def _data(valor):
+    """Converte 'AAAA-MM-DD' (input type=date) em datetime; valores inválidos são ignorados"""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def _categoria(valor):
+    """Id da categoria; aceita também o nome (links antigos, ex.: ?categoria=Informática)
+
+    Um nome sem categoria correspondente continua como texto e não encontra
+    produto nenhum, em vez de ser ignorado e devolver a lista sem filtro.
+    """
+    valor = (valor or '').strip()
+    if not valor or valor.isdigit():
+        return int(valor) if valor else ''
+    categoria_id = id_categoria(valor)
+    return categoria_id if categoria_id is not None else valor
+
+def filtros_movimentacao(args):
+    """Lê os filtros de movimentação da query string"""
+    return {
+        'tipo': args.get('tipo', '', type=str),
+        'produto': args.get('produto', '', type=int),
+        'data_inicio': args.get('data_inicio', '', type=str),
+        'data_fim': args.get('data_fim', '', type=str),
+    }
+
+def periodo_movimentacao(filtros):
+    """Intervalo [inicio, fim) dos filtros de data (None quando aberto)"""
+    inicio = _data(filtros.get('data_inicio'))
+    fim = _data(filtros.get('data_fim'))
+    # Data final inclusiva: tudo antes do início do dia seguinte
+    return inicio, fim + timedelta(days=1) if fim else None
+
+def condicoes_movimentacao(filtros, tabela=None):
+    """Monta as condições SQL para os filtros de movimentação
+
+    `tabela` é a tabela de um segmento do histórico (services.arquivo); por
+    padrão, a tabela quente.
+    """
+    c = (tabela if tabela is not None else MovimentacaoEstoque.__table__).c
+    condicoes = []
+    if filtros.get('tipo'):
+        condicoes.append(c.tipo == filtros['tipo'])
+    if filtros.get('produto'):
+        condicoes.append(c.produto_id == filtros['produto'])
+
+    inicio, fim = periodo_movimentacao(filtros)
+    if inicio:
+        condicoes.append(c.data_movimentacao >= inicio)
+    if fim:
+        condicoes.append(c.data_movimentacao < fim)
+    return condicoes
+
+def filtros_produto(args):
+    """Lê os filtros de produto da query string"""
+    return {
+        'busca': args.get('busca', '', type=str),
+        'categoria': _categoria(args.get('categoria', '', type=str)),
+        'status': args.get('status', '', type=str),
+    }
+
+def condicoes_produto(filtros, incluir_busca=True):
+    """Monta as condições SQL para os filtros de produto
+
+    Com incluir_busca=False a busca textual fica a cargo de services.busca.aplicar_busca,
+    que também ordena por relevância.
+    """
+    condicoes = []
+    status = filtros.get('status')
+    if status == 'inativo':
+        condicoes.append(Produto.ativo == False)
+    else:
+        condicoes.append(Produto.ativo == True)
+        if status == 'baixo_estoque':
+            condicoes.append(Produto.em_alerta == True)
+
+    busca = filtros.get('busca')
+    if busca and incluir_busca:
+        condicoes.append(condicao_busca(busca))
+    categoria = filtros.get('categoria')
+    if isinstance(categoria, str) and categoria:
+        condicoes.append(false())  # nome de categoria inexistente
+    elif categoria:
+        condicoes.append(Produto.categoria_id == categoria)
+    return condicoes
@@ -0,0 +1,339 @@
+"""Snapshots diários de estoque e consultas históricas (saldo em uma data, séries para gráficos)
+
+Cada produto ganha uma linha em snapshots_estoque nos dias em que teve
+movimentação, com o saldo de fechamento e as entradas/saídas do dia; o
+estoque inteiro ganha uma linha por dia em snapshots_dia. O último dia
+fechado fica no contador 'snapshots' (ordinal da data).
+
+O saldo de um dia parte do snapshot mais próximo e reaplica só as
+movimentações entre ele e a data pedida. Como os dias fechados sem linha de
+um produto não tiveram movimentação, essa diferença se limita aos dias ainda
+não fechados. Os fechamentos são ancorados na quantidade atual (saldo menos
+o que foi movimentado depois), então o estoque inicial cadastrado sem
+movimentação também entra no histórico.
+
+As movimentações são lidas da tabela quente e dos meses arquivados que cruzam
+o período (services.arquivo); as condições por produto recebem as colunas do
+segmento (`condicao(c)`).
+"""
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+
+from sqlalchemy import case, delete, func, insert, select, true, update
+
+from models.database import db, Contador, Produto, SnapshotEstoque, SnapshotDia
+from services.arquivo import segmentos
+from services.cache import ler_contador
+
+CONTADOR_SNAPSHOTS = 'snapshots'
+TAMANHO_BLOCO = 1000  # linhas por INSERT
+DIAS_PADRAO = 90
+PONTOS_PADRAO = 60
+MAX_PONTOS = 500
+MAX_DIAS = 3660
+
+_snapshots = SnapshotEstoque.__table__
+_dias = SnapshotDia.__table__
+_contadores = Contador.__table__
+
+def _delta(c):
+    return case((c.tipo == 'entrada', c.quantidade), else_=-c.quantidade)
+
+def _entradas(c):
+    return case((c.tipo == 'entrada', c.quantidade), else_=0)
+
+def _saidas(c):
+    return case((c.tipo == 'saida', c.quantidade), else_=0)
+
+def _todas(c):
+    return true()
+
+class HistoricoError(ValueError):
+    """Parâmetros inválidos para uma consulta histórica"""
+
+def _inicio_dia(dia):
+    return datetime.combine(dia, time.min)
+
+def _dia_seguinte(dia):
+    return dia + timedelta(days=1)
+
+def _como_data(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+def ultimo_fechamento():
+    """Último dia com snapshots gerados, ou None se ainda não houve backfill"""
+    ordinal = ler_contador(CONTADOR_SNAPSHOTS)
+    return date.fromordinal(ordinal) if ordinal else None
+
+def _por_segmento(inicio=None, fim=None):
+    """(colunas, condições) de cada segmento que cruza [inicio, fim) (datas, fim exclusivo)"""
+    inicio = _inicio_dia(inicio) if inicio is not None else None
+    fim = _inicio_dia(fim) if fim is not None else None
+    for segmento in segmentos(inicio, fim):
+        c = segmento.c
+        condicoes = segmento.condicoes()
+        if inicio is not None:
+            condicoes.append(c.data_movimentacao >= inicio)
+        if fim is not None:
+            condicoes.append(c.data_movimentacao < fim)
+        yield c, condicoes
+
+def _saldo_periodo(condicao, inicio=None, fim=None):
+    """Soma das movimentações em [inicio, fim) (datas, fim exclusivo) que atendem `condicao(c)`"""
+    return sum(
+        db.session.execute(select(func.coalesce(func.sum(_delta(c)), 0)).where(condicao(c), *condicoes)).scalar()
+        for c, condicoes in _por_segmento(inicio, fim)
+    )
+
+# ==================== GERAÇÃO ====================
+
+def _marcar_fechamento(anterior, dia):
+    """Avança o contador de forma condicional; False se outro processo fechou antes"""
+    if anterior is None:
+        if db.session.execute(select(_contadores.c.nome)
+                              .where(_contadores.c.nome == CONTADOR_SNAPSHOTS)).first():
+            return False
+        db.session.execute(insert(_contadores).values(nome=CONTADOR_SNAPSHOTS, valor=dia.toordinal()))
+        return True
+    return db.session.execute(
+        update(_contadores)
+        .where(_contadores.c.nome == CONTADOR_SNAPSHOTS, _contadores.c.valor == anterior.toordinal())
+        .values(valor=dia.toordinal())
+    ).rowcount == 1
+
+def gerar_snapshots(ate=None):
+    """Fecha os dias ainda sem snapshot até `ate` (padrão: ontem); retorna quantos dias fechou
+
+    Sem nenhum snapshot anterior faz o backfill desde a primeira movimentação.
+    Uma passada pelas movimentações do período, agrupadas por dia e produto,
+    percorrida do dia mais recente para o mais antigo.
+    """
+    ate = ate or datetime.utcnow().date() - timedelta(days=1)
+    anterior = ultimo_fechamento()
+    if anterior is not None:
+        inicio = _dia_seguinte(anterior)
+    else:
+        # O segmento mais antigo com alguma linha (o último da lista, salvo limpeza em andamento)
+        primeira = next(filter(None, (
+            db.session.execute(select(func.min(c.data_movimentacao)).where(*condicoes)).scalar()
+            for c, condicoes in reversed(list(_por_segmento()))
+        )), None)
+        inicio = primeira.date() if primeira else _dia_seguinte(ate)
+    if anterior is not None and inicio > ate:
+        return 0
+
+    # Saldos no fim de `ate` em uma única leitura: quantidade atual menos o que veio depois
+    saldos = dict(db.session.execute(select(Produto.id, Produto.quantidade)).all())
+    for c, condicoes in _por_segmento(inicio=_dia_seguinte(ate)):
+        for produto_id, depois in db.session.execute(
+                select(c.produto_id, func.sum(_delta(c))).where(*condicoes).group_by(c.produto_id)):
+            saldos[produto_id] = saldos.get(produto_id, 0) - depois
+    unidades = sum(saldos.values())
+
+    # Restos de uma geração interrompida
+    db.session.execute(delete(_snapshots).where(_snapshots.c.data >= inicio, _snapshots.c.data <= ate))
+    db.session.execute(delete(_dias).where(_dias.c.data >= inicio, _dias.c.data <= ate))
+
+    def por_dia(c, condicoes):
+        dia = func.date(c.data_movimentacao)
+        return db.session.execute(
+            select(dia, c.produto_id, func.sum(_entradas(c)), func.sum(_saidas(c)), func.count())
+            .where(*condicoes)
+            .group_by(dia, c.produto_id)
+            .order_by(dia.desc())
+        )
+
+    # Segmentos do mais recente para o mais antigo: o fluxo continua em ordem decrescente de dia
+    linhas = chain.from_iterable(por_dia(c, condicoes)
+                                 for c, condicoes in _por_segmento(inicio, _dia_seguinte(ate)))
+
+    totais = defaultdict(lambda: [0, 0, 0])
+    bloco = []
+    for data, produto_id, entradas, saidas, total in linhas:
+        data = _como_data(data)
+        fechamento = saldos.get(produto_id, 0)
+        bloco.append({'produto_id': produto_id, 'data': data, 'quantidade': fechamento,
+                      'entradas': entradas, 'saidas': saidas})
+        saldos[produto_id] = fechamento - entradas + saidas
+        dia_total = totais[data]
+        dia_total[0] += entradas
+        dia_total[1] += saidas
+        dia_total[2] += total
+        if len(bloco) >= TAMANHO_BLOCO:
+            db.session.execute(insert(_snapshots), bloco)
+            bloco = []
+    if bloco:
+        db.session.execute(insert(_snapshots), bloco)
+
+    # Estoque inteiro: uma linha por dia, inclusive os dias sem movimentação
+    fechamentos = []
+    data = ate
+    while data >= inicio:
+        entradas, saidas, total = totais.get(data, (0, 0, 0))
+        fechamentos.append({'data': data, 'unidades': unidades, 'entradas': entradas,
+                            'saidas': saidas, 'movimentacoes': total})
+        unidades -= entradas - saidas
+        data -= timedelta(days=1)
+    for i in range(0, len(fechamentos), TAMANHO_BLOCO):
+        db.session.execute(insert(_dias), fechamentos[i:i + TAMANHO_BLOCO])
+
+    if not _marcar_fechamento(anterior, ate):
+        db.session.rollback()
+        return 0
+    db.session.commit()
+    return len(fechamentos)
+
+def fechamento_pendente():
+    """True se o backfill já foi feito e falta fechar algum dia até ontem
+
+    As consultas nunca fecham dias (isso grava e disputaria o lock com as
+    movimentações): o comando gerar-snapshots agendado ou a tarefa
+    gerar_snapshots, que os trabalhadores enfileiram sozinhos, fazem isso.
+    """
+    fechado = ultimo_fechamento()
+    return fechado is not None and fechado < datetime.utcnow().date() - timedelta(days=1)
+
+def reconstruir_snapshots():
+    """Apaga todos os snapshots e refaz o backfill a partir do histórico de movimentações"""
+    db.session.execute(delete(_snapshots))
+    db.session.execute(delete(_dias))
+    db.session.execute(delete(_contadores).where(_contadores.c.nome == CONTADOR_SNAPSHOTS))
+    db.session.commit()
+    return gerar_snapshots()
+
+# ==================== CONSULTAS ====================
+
+def _fechamento(tabela, coluna, condicao_snapshot, condicao_movimento, atual, dia):
+    """Saldo no fim de `dia` a partir do snapshot mais próximo (anterior ou posterior)
+
+    Sem snapshot algum, desconta da quantidade atual as movimentações posteriores.
+    """
+    anterior = db.session.execute(
+        select(tabela.c.data, coluna).where(condicao_snapshot, tabela.c.data <= dia)
+        .order_by(tabela.c.data.desc()).limit(1)
+    ).first()
+    if anterior is not None:
+        data, valor = _como_data(anterior[0]), anterior[1]
+        return valor + _saldo_periodo(condicao_movimento, inicio=_dia_seguinte(data), fim=_dia_seguinte(dia))
+
+    posterior = db.session.execute(
+        select(tabela.c.data, coluna).where(condicao_snapshot, tabela.c.data > dia)
+        .order_by(tabela.c.data).limit(1)
+    ).first()
+    if posterior is not None:
+        data, valor = _como_data(posterior[0]), posterior[1]
+        return valor - _saldo_periodo(condicao_movimento, inicio=_dia_seguinte(dia), fim=_dia_seguinte(data))
+
+    return db.session.execute(select(atual)).scalar() - _saldo_periodo(condicao_movimento,
+                                                                       inicio=_dia_seguinte(dia))
+
+def estoque_em(produto_id, dia):
+    """Quantidade do produto no fim de `dia`; None se o produto não existe"""
+    if db.session.get(Produto, produto_id) is None:
+        return None
+    atual = select(Produto.quantidade).where(Produto.id == produto_id).scalar_subquery()
+    return _fechamento(_snapshots, _snapshots.c.quantidade, _snapshots.c.produto_id == produto_id,
+                       lambda c: c.produto_id == produto_id, atual, dia)
+
+def unidades_em(dia):
+    """Unidades em estoque (todos os produtos) no fim de `dia`"""
+    atual = select(func.coalesce(func.sum(Produto.quantidade), 0)).scalar_subquery()
+    return _fechamento(_dias, _dias.c.unidades, true(), _todas, atual, dia)
+
+def _movimentos_por_dia(condicao, inicio, fim):
+    """Entradas e saídas por dia em [inicio, fim] direto do histórico (dias ainda não fechados)"""
+    dias = {}
+    for c, condicoes in _por_segmento(inicio, _dia_seguinte(fim)):
+        dia = func.date(c.data_movimentacao)
+        for data, entradas, saidas in db.session.execute(
+                select(dia, func.sum(_entradas(c)), func.sum(_saidas(c))).where(condicao(c), *condicoes)
+                .group_by(dia)):
+            dias[_como_data(data)] = (entradas, saidas)
+    return dias
+
+def _reduzir(dias, inicio, fim, saldo, pontos):
+    """Percorre os dias do período e agrupa em no máximo `pontos` intervalos
+
+    `dias` mapeia data -> (fechamento ou None, entradas, saidas); sem
+    fechamento gravado o saldo avança pelas entradas e saídas do dia.
+    """
+    total_dias = (fim - inicio).days + 1
+    passo = max(1, math.ceil(total_dias / pontos))
+    serie = []
+    ponto = None
+    data = inicio
+    for indice in range(total_dias):
+        fechamento, entradas, saidas = dias.get(data, (None, 0, 0))
+        saldo = fechamento if fechamento is not None else saldo + entradas - saidas
+        if indice % passo == 0:
+            ponto = {'data': None, 'quantidade': saldo, 'minimo': saldo, 'maximo': saldo,
+                     'entradas': 0, 'saidas': 0}
+            serie.append(ponto)
+        ponto['data'] = data.isoformat()
+        ponto['quantidade'] = saldo
+        ponto['minimo'] = min(ponto['minimo'], saldo)
+        ponto['maximo'] = max(ponto['maximo'], saldo)
+        ponto['entradas'] += entradas
+        ponto['saidas'] += saidas
+        data = _dia_seguinte(data)
+    return {'inicio': inicio.isoformat(), 'fim': fim.isoformat(), 'dias_por_ponto': passo, 'pontos': serie}
+
+def _dias_abertos(inicio, fim):
+    """Parte do período ainda não coberta pelos snapshots"""
+    fechado = ultimo_fechamento()
+    return max(inicio, _dia_seguinte(fechado)) if fechado else inicio
+
+def serie_produto(produto_id, inicio, fim, pontos=PONTOS_PADRAO):
+    """Série diária (reduzida a `pontos`) do saldo e das movimentações de um produto"""
+    saldo = estoque_em(produto_id, inicio - timedelta(days=1))
+    if saldo is None:
+        return None
+
+    dias = {
+        data: (quantidade, entradas, saidas)
+        for data, quantidade, entradas, saidas in db.session.execute(
+            select(_snapshots.c.data, _snapshots.c.quantidade, _snapshots.c.entradas, _snapshots.c.saidas)
+            .where(_snapshots.c.produto_id == produto_id,
+                   _snapshots.c.data >= inicio, _snapshots.c.data <= fim)
+        )
+    }
+    abertos = _dias_abertos(inicio, fim)
+    if abertos <= fim:
+        for data, (entradas, saidas) in _movimentos_por_dia(
+                lambda c: c.produto_id == produto_id, abertos, fim).items():
+            dias[data] = (None, entradas, saidas)
+
+    return dict(_reduzir(dias, inicio, fim, saldo, pontos), produto_id=produto_id)
+
+def serie_geral(inicio, fim, pontos=PONTOS_PADRAO):
+    """Série diária (reduzida a `pontos`) das unidades em estoque e das movimentações"""
+    saldo = unidades_em(inicio - timedelta(days=1))
+    dias = {
+        data: (unidades, entradas, saidas)
+        for data, unidades, entradas, saidas in db.session.execute(
+            select(_dias.c.data, _dias.c.unidades, _dias.c.entradas, _dias.c.saidas)
+            .where(_dias.c.data >= inicio, _dias.c.data <= fim)
+        )
+    }
+    abertos = _dias_abertos(inicio, fim)
+    if abertos <= fim:
+        for data, (entradas, saidas) in _movimentos_por_dia(_todas, abertos, fim).items():
+            dias[data] = (None, entradas, saidas)
+    return _reduzir(dias, inicio, fim, saldo, pontos)
+
+def periodo_consulta(args):
+    """Lê inicio, fim (AAAA-MM-DD) e pontos da query string, com padrões e limites"""
+    try:
+        fim = date.fromisoformat(args['fim']) if args.get('fim') else datetime.utcnow().date()
+        inicio = date.fromisoformat(args['inicio']) if args.get('inicio') \
+            else fim - timedelta(days=DIAS_PADRAO - 1)
+        pontos = int(args.get('pontos', PONTOS_PADRAO))
+    except ValueError:
+        raise HistoricoError('Use datas no formato AAAA-MM-DD e um número inteiro de pontos.')
+    if inicio > fim:
+        raise HistoricoError('A data inicial deve ser anterior à final.')
+    if (fim - inicio).days >= MAX_DIAS:
+        raise HistoricoError(f'Período máximo de {MAX_DIAS} dias.')
+    return inicio, fim, min(max(pontos, 1), MAX_PONTOS)
@@ -0,0 +1,214 @@
+"""Importação em streaming do catálogo de produtos (CSV/XLSX) com upsert por código"""
+import csv
+import io
+import math
+import os
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import select, insert, update
+
+from models.database import db, Produto
+from services.alertas import recalcular_alertas
+from services.categorias import mapear_categorias
+from services.resumo import ajuste_resumo
+
+TAMANHO_LOTE = 900  # linhas por bloco; mantém o IN abaixo do limite de parâmetros do SQLite
+MAX_ERROS_DETALHADOS = 1000
+
+class ImportacaoError(Exception):
+    """Erro de importação que impede o processamento do arquivo"""
+
+def _texto(valor):
+    """Normaliza células vindas de CSV ou XLSX para texto sem espaços nas pontas"""
+    if valor is None:
+        return ''
+    return str(valor).strip()
+
+def _finito(texto):
+    """float de um texto, recusando inf e nan (int(inf) levantaria OverflowError)"""
+    numero = float(texto)
+    if not math.isfinite(numero):
+        raise ValueError(texto)
+    return numero
+
+def _inteiro(valor, campo, padrao):
+    texto = _texto(valor)
+    if not texto:
+        return padrao
+    try:
+        numero = int(_finito(texto.replace(',', '.')))
+    except (ValueError, OverflowError):
+        raise ValueError(f'{campo} inválido: {texto}')
+    if numero < 0:
+        raise ValueError(f'{campo} deve ser maior ou igual a zero')
+    return numero
+
+def _decimal(valor, campo, padrao):
+    texto = _texto(valor)
+    if not texto:
+        return padrao
+    # Aceita formato brasileiro (1.234,56) e internacional (1234.56)
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        numero = _finito(texto)
+    except (ValueError, OverflowError):
+        raise ValueError(f'{campo} inválido: {_texto(valor)}')
+    if numero < 0:
+        raise ValueError(f'{campo} deve ser maior ou igual a zero')
+    return numero
+
+def validar_linha(linha):
+    """Valida uma linha do catálogo com as mesmas regras do ProdutoForm"""
+    codigo = _texto(linha.get('codigo'))
+    nome = _texto(linha.get('nome'))
+    categoria = _texto(linha.get('categoria'))
+
+    if not codigo or len(codigo) > 50:
+        raise ValueError('Código deve ter entre 1 e 50 caracteres')
+    if len(nome) < 2 or len(nome) > 100:
+        raise ValueError('Nome deve ter entre 2 e 100 caracteres')
+    if len(categoria) > 50:
+        raise ValueError('Categoria deve ter no máximo 50 caracteres')
+
+    return {
+        'codigo': codigo,
+        'nome': nome,
+        'descricao': _texto(linha.get('descricao')),
+        'estoque_minimo': _inteiro(linha.get('estoque_minimo'), 'Estoque mínimo', 10),
+        'preco': _decimal(linha.get('preco'), 'Preço', 0.0),
+        'categoria': categoria,
+    }
+
+def _linhas_csv(arquivo):
+    """Itera as linhas de um CSV binário sem carregá-lo inteiro na memória"""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    dialeto = csv.excel
+    if texto.seekable():
+        # Detecta o separador (vírgula, ponto e vírgula ou tab) por uma amostra do início
+        amostra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+        except csv.Error:
+            pass
+    leitor = csv.DictReader(texto, dialect=dialeto)
+    if not leitor.fieldnames:
+        raise ImportacaoError('Arquivo vazio ou sem cabeçalho.')
+    leitor.fieldnames = [_texto(c).lower() for c in leitor.fieldnames]
+    _verificar_cabecalho(leitor.fieldnames)
+    while True:
+        try:
+            linha = next(leitor)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # Linha ilegível (ex.: campo acima do limite do csv): vira erro da linha e a leitura segue
+            linha = ValueError(f'Linha ilegível no CSV: {e}')
+        yield linha
+
+def _linhas_xlsx(arquivo):
+    """Itera as linhas da primeira planilha em modo somente leitura (streaming)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportacaoError('Importação de XLSX requer o pacote openpyxl.')
+
+    planilha = load_workbook(arquivo, read_only=True, data_only=True).active
+    linhas = planilha.iter_rows(values_only=True)
+    cabecalho = [_texto(c).lower() for c in next(linhas, ())]
+    _verificar_cabecalho(cabecalho)
+    for valores in linhas:
+        if any(v is not None for v in valores):
+            yield dict(zip(cabecalho, valores))
+
+def _verificar_cabecalho(colunas):
+    faltando = [c for c in ('codigo', 'nome') if c not in colunas]
+    if faltando:
+        raise ImportacaoError(f'Colunas obrigatórias ausentes: {", ".join(faltando)}')
+
+def _aplicar_bloco(validas):
+    """Faz o upsert de um bloco: uma consulta IN, um INSERT em massa e um UPDATE em massa"""
+    existentes = dict(db.session.execute(
+        select(Produto.codigo, Produto.id).where(Produto.codigo.in_(list(validas)))
+    ).all())
+    # Nomes de categoria viram ids (categorias novas são criadas no mesmo bloco)
+    categorias = mapear_categorias(dados['categoria'] for dados in validas.values())
+
+    agora = datetime.utcnow()
+    novos = []
+    alterados = []
+    for codigo, dados in validas.items():
+        dados = dict(dados)
+        dados['categoria_id'] = categorias.get(dados.pop('categoria'))
+        if codigo in existentes:
+            alterados.append(dict(dados, id=existentes[codigo]))
+        else:
+            # Produto novo entra com estoque zero, portanto já em alerta se o mínimo for >= 0
+            em_alerta = dados.get('estoque_minimo', 10) >= 0
+            novos.append(dict(dados, quantidade=0, ativo=True, data_cadastro=agora,
+                              em_alerta=em_alerta, alerta_desde=agora if em_alerta else None))
+
+    with ajuste_resumo(Produto.codigo.in_(list(validas))):
+        if novos:
+            db.session.execute(insert(Produto), novos)
+        if alterados:
+            db.session.execute(update(Produto), alterados)
+            # O estoque mínimo pode ter mudado: reavalia o alerta dos produtos atualizados
+            recalcular_alertas(item['id'] for item in alterados)
+    db.session.commit()
+    return len(novos), len(alterados)
+
+def importar_produtos(arquivo, nome_arquivo, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """Importa um catálogo em blocos de tamanho fixo, criando ou atualizando por código
+
+    `arquivo` é um objeto binário (upload ou arquivo aberto); o formato é
+    definido pela extensão de `nome_arquivo`. `progresso`, se informado, é
+    chamado a cada bloco com o dicionário de resultado parcial.
+    """
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    if extensao == '.csv':
+        linhas = _linhas_csv(arquivo)
+    elif extensao == '.xlsx':
+        linhas = _linhas_xlsx(arquivo)
+    else:
+        raise ImportacaoError('Formato não suportado. Use arquivos .csv ou .xlsx.')
+
+    resultado = {'linhas': 0, 'inseridos': 0, 'atualizados': 0, 'total_erros': 0, 'erros': []}
+    numero_linha = 1  # cabeçalho
+
+    while True:
+        bloco = list(islice(linhas, tamanho_lote))
+        if not bloco:
+            break
+
+        validas = {}
+        for linha in bloco:
+            numero_linha += 1
+            try:
+                if isinstance(linha, ValueError):
+                    raise linha
+                dados = validar_linha(linha)
+            except ValueError as e:
+                resultado['total_erros'] += 1
+                if len(resultado['erros']) < MAX_ERROS_DETALHADOS:
+                    resultado['erros'].append({'linha': numero_linha, 'erro': str(e)})
+                continue
+            # Códigos repetidos no mesmo bloco: prevalece a última ocorrência
+            validas[dados['codigo']] = dados
+
+        if validas:
+            try:
+                inseridos, atualizados = _aplicar_bloco(validas)
+            except Exception:
+                db.session.rollback()
+                raise
+            resultado['inseridos'] += inseridos
+            resultado['atualizados'] += atualizados
+
+        resultado['linhas'] += len(bloco)
+        if progresso:
+            progresso(resultado)
+
+    return resultado
@@ -0,0 +1,143 @@
+"""Consultas das listagens de produtos, movimentações e alertas
+
+As listagens leem só as colunas exibidas, com produto e usuário já unidos
+por JOIN na mesma consulta, e devolvem objetos leves de leitura (`__slots__`)
+em vez de entidades do ORM: sem identity map, sem rastreamento de alterações
+e sem lazy load por linha no template. Cada página custa uma consulta (mais o
+total, reaproveitado por alguns segundos).
+
+As movimentações vêm da tabela quente e dos meses arquivados que cruzam o
+período filtrado (services.arquivo), encadeados na mesma paginação.
+"""
+from models.database import db, Categoria, Produto, MovimentacaoEstoque, Usuario
+from services.arquivo import arquivado_ate, segmentos
+from services.busca import aplicar_busca
+from services.filtros import condicoes_produto, condicoes_movimentacao, periodo_movimentacao
+from services.paginacao import paginar_por_cursor, paginar_segmentos, total_estimado
+
+class Linha:
+    """Linha somente leitura com os atributos de `colunas`, na mesma ordem"""
+    __slots__ = ()
+    colunas = ()
+    campos = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.campos = tuple(coluna.key for coluna in cls.colunas)
+
+    def __init__(self, *valores):
+        # Colunas extras no fim da linha (ex.: relevância da busca) são ignoradas
+        for nome, valor in zip(self.campos, valores):
+            setattr(self, nome, valor)
+
+    @classmethod
+    def consulta(cls):
+        return db.session.query(*cls.colunas)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.id}>'
+
+class ProdutoLinha(Linha):
+    colunas = (Produto.id, Produto.codigo, Produto.nome, Produto.descricao, Produto.categoria_id,
+               Categoria.nome.label('categoria'), Produto.quantidade, Produto.estoque_minimo, Produto.preco,
+               Produto.ativo)
+    __slots__ = tuple(coluna.key for coluna in colunas)
+
+    @classmethod
+    def consulta(cls):
+        return super().consulta().outerjoin(Categoria, Categoria.id == Produto.categoria_id)
+
+    def estoque_baixo(self):
+        return self.quantidade <= self.estoque_minimo
+
+    @property
+    def status(self):
+        """Situação do estoque: zerado, baixo ou normal (como Produto.status)"""
+        if self.quantidade == 0:
+            return 'zerado'
+        if self.estoque_baixo():
+            return 'baixo'
+        return 'normal'
+
+class AlertaLinha(ProdutoLinha):
+    colunas = ProdutoLinha.colunas + (Produto.alerta_desde,)
+    __slots__ = ('alerta_desde',)
+
+class MovimentacaoLinha(Linha):
+    colunas = (MovimentacaoEstoque.id, MovimentacaoEstoque.data_movimentacao, MovimentacaoEstoque.tipo,
+               MovimentacaoEstoque.quantidade, MovimentacaoEstoque.observacao, MovimentacaoEstoque.produto_id,
+               Produto.codigo.label('produto_codigo'), Produto.nome.label('produto_nome'),
+               Usuario.nome.label('usuario_nome'))
+    __slots__ = tuple(coluna.key for coluna in colunas)
+
+    @classmethod
+    def consulta(cls, tabela=None):
+        """Consulta na tabela quente ou, com `tabela`, na de um mês arquivado (mesmas colunas)"""
+        tabela = MovimentacaoEstoque.__table__ if tabela is None else tabela
+        c = tabela.c
+        return db.session.query(c.id, c.data_movimentacao, c.tipo, c.quantidade, c.observacao, c.produto_id,
+                                *cls.colunas[6:])\
+            .select_from(tabela)\
+            .join(Produto, c.produto_id == Produto.id)\
+            .join(Usuario, c.usuario_id == Usuario.id)
+
+def _chave_total(nome, filtros):
+    return (nome,) + tuple(sorted(filtros.items()))
+
+def pagina_produtos(filtros, cursor=None, por_pagina=10):
+    """Página de produtos em (nome, id), ou (relevância, id) quando há busca textual"""
+    query = ProdutoLinha.consulta().filter(*condicoes_produto(filtros, incluir_busca=False))
+
+    relevancia = None
+    if filtros.get('busca'):
+        query, relevancia = aplicar_busca(query, filtros['busca'])
+
+    if relevancia is not None:
+        pagina = paginar_por_cursor(
+            query.add_columns(relevancia),
+            ordem=[(relevancia, False), (Produto.id, False)],
+            chave=lambda linha: (linha[-1], linha.id),
+            item=lambda linha: ProdutoLinha(*linha),
+            cursor=cursor, por_pagina=por_pagina
+        )
+    else:
+        pagina = paginar_por_cursor(
+            query,
+            ordem=[(Produto.nome, False), (Produto.id, False)],
+            chave=lambda linha: (linha.nome, linha.id),
+            item=lambda linha: ProdutoLinha(*linha),
+            cursor=cursor, por_pagina=por_pagina
+        )
+
+    pagina.total = total_estimado(_chave_total('produtos', filtros), query)
+    return pagina
+
+def pagina_movimentacoes(filtros, cursor=None, por_pagina=15):
+    """Página de movimentações da mais recente para a mais antiga, em (data, id)"""
+    inicio, fim = periodo_movimentacao(filtros)
+    partes = [(s, s.condicoes() + condicoes_movimentacao(filtros, s.tabela)) for s in segmentos(inicio, fim)]
+    pagina = paginar_segmentos(
+        [(MovimentacaoLinha.consulta(s.tabela).filter(*condicoes),
+          [(s.c.data_movimentacao, True), (s.c.id, True)]) for s, condicoes in partes],
+        chave=lambda linha: (linha.data_movimentacao, linha.id),
+        item=lambda linha: MovimentacaoLinha(*linha),
+        cursor=cursor, por_pagina=por_pagina
+    )
+    # Produto e usuário são obrigatórios: o total dispensa os JOINs. Meses
+    # arquivados inteiros no período, sem outros filtros, usam a contagem do catálogo.
+    sem_filtros = not filtros.get('tipo') and not filtros.get('produto')
+    inteiros = [s for s, _ in partes if sem_filtros and s.contido(inicio, fim)]
+    contar = [db.session.query(s.c.id).filter(*condicoes) for s, condicoes in partes if s not in inteiros]
+    pagina.total = total_estimado(_chave_total('movimentacoes', filtros) + (arquivado_ate(),), contar) \
+        + sum(s.linhas for s in inteiros)
+    return pagina
+
+def linha_produto(produto_id):
+    """Um produto como ProdutoLinha (com o nome da categoria), ou None"""
+    linha = ProdutoLinha.consulta().filter(Produto.id == produto_id).first()
+    return ProdutoLinha(*linha) if linha else None
+
+def listar_alertas():
+    """Produtos em alerta por nome, servidos pelo índice (em_alerta, nome)"""
+    return [AlertaLinha(*linha) for linha in
+            AlertaLinha.consulta().filter(Produto.em_alerta == True).order_by(Produto.nome)]
@@ -0,0 +1,384 @@
+"""Serviço de movimentações de estoque com atualização atômica"""
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, func, case, bindparam
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models.database import db, Produto, MovimentacaoEstoque, Usuario
+from models.esquema import atualizar_esquema
+from services.alertas import valores_alerta
+from services.arquivo import segmentos
+from services.eventos import publicar, eventos_movimentacao, eventos_produto, total_alertas
+from services.resumo import ajuste_resumo, aplicar_delta, contribuicao_movimentos, delta_movimentacao
+
+TIPOS_MOVIMENTACAO = ('entrada', 'saida')
+
+# Política de nova tentativa quando o banco está em contenção
+MAX_TENTATIVAS = 6
+ESPERA_INICIAL = 0.02  # segundos, dobra a cada tentativa
+
+# Limites do processamento em lote
+TAMANHO_MAXIMO_LOTE = 10000
+TAMANHO_BLOCO_IN = 500  # parâmetros por cláusula IN
+TAMANHO_ID_CLIENTE = 64
+
+class MovimentacaoError(Exception):
+    """Erro base para movimentações de estoque"""
+
+class ProdutoIndisponivelError(MovimentacaoError):
+    """Produto inexistente ou inativo"""
+    def __init__(self, produto_id):
+        super().__init__(f'Produto {produto_id} não encontrado ou inativo.')
+        self.produto_id = produto_id
+
+class EstoqueInsuficienteError(MovimentacaoError):
+    """Saída maior que a quantidade disponível em estoque"""
+    def __init__(self, disponivel):
+        super().__init__(f'Quantidade insuficiente em estoque. Disponível: {disponivel}')
+        self.disponivel = disponivel
+
+def _em_contencao(erro):
+    """Verifica se o erro operacional indica bloqueio/conflito entre transações"""
+    mensagem = str(getattr(erro, 'orig', erro)).lower()
+    return any(trecho in mensagem for trecho in ('locked', 'busy', 'deadlock', 'could not serialize'))
+
+def com_nova_tentativa(funcao):
+    """Executa a função repetindo com backoff exponencial em caso de contenção"""
+    for tentativa in range(MAX_TENTATIVAS):
+        try:
+            return funcao()
+        except OperationalError as e:
+            db.session.rollback()
+            if not _em_contencao(e) or tentativa == MAX_TENTATIVAS - 1:
+                raise
+            time.sleep(ESPERA_INICIAL * (2 ** tentativa) * (1 + random.random()))
+
+def _aplicar(produto_id, usuario_id, tipo, quantidade, observacao):
+    """Executa UPDATE condicional + INSERT no histórico em uma única transação curta"""
+    delta = quantidade if tipo == 'entrada' else -quantidade
+
+    stmt = update(Produto).where(Produto.id == produto_id, Produto.ativo == True)
+    if delta < 0:
+        # A condição garante que o estoque nunca fique negativo, mesmo com escritores concorrentes
+        stmt = stmt.where(Produto.quantidade >= quantidade)
+    stmt = stmt.values(quantidade=Produto.quantidade + delta, **valores_alerta(Produto.quantidade + delta))\
+        .returning(Produto.quantidade, Produto.estoque_minimo, Produto.preco,
+                   Produto.categoria_id, Produto.em_alerta)\
+        .execution_options(synchronize_session='fetch')
+
+    linha = db.session.execute(stmt).first()
+    if linha is None:
+        db.session.rollback()
+        disponivel = db.session.query(Produto.quantidade)\
+            .filter(Produto.id == produto_id, Produto.ativo == True).scalar()
+        if disponivel is None:
+            raise ProdutoIndisponivelError(produto_id)
+        raise EstoqueInsuficienteError(disponivel)
+    aplicar_delta(delta_movimentacao(linha, delta))
+
+    movimentacao = MovimentacaoEstoque(
+        produto_id=produto_id,
+        usuario_id=usuario_id,
+        tipo=tipo,
+        quantidade=quantidade,
+        observacao=observacao
+    )
+    db.session.add(movimentacao)
+    db.session.flush()
+    publicar(eventos_movimentacao(movimentacao, linha))
+    db.session.commit()
+    return movimentacao
+
+def registrar_movimentacao(produto_id, usuario_id, tipo, quantidade, observacao=''):
+    """Registra uma movimentação aplicando o saldo de forma atômica no banco"""
+    if tipo not in TIPOS_MOVIMENTACAO:
+        raise MovimentacaoError(f'Tipo de movimentação inválido: {tipo}')
+    if quantidade is None or quantidade <= 0:
+        raise MovimentacaoError('Quantidade deve ser maior que zero')
+
+    return com_nova_tentativa(
+        lambda: _aplicar(produto_id, usuario_id, tipo, quantidade, observacao)
+    )
+
+class ConflitoLoteError(MovimentacaoError):
+    """Saldo (ou id_cliente) alterado por outra transação durante a aplicação do lote"""
+
+def _em_blocos(valores, tamanho=TAMANHO_BLOCO_IN):
+    """Divide uma lista em blocos de tamanho fixo"""
+    for i in range(0, len(valores), tamanho):
+        yield valores[i:i + tamanho]
+
+def _normalizar_linha(linha):
+    """Valida o formato de uma linha do lote
+
+    Retorna (produto_id, codigo, tipo, quantidade, observacao, id_cliente).
+    """
+    if not isinstance(linha, dict):
+        raise MovimentacaoError('Linha deve ser um objeto JSON')
+
+    tipo = linha.get('tipo')
+    if tipo not in TIPOS_MOVIMENTACAO:
+        raise MovimentacaoError(f'Tipo de movimentação inválido: {tipo}')
+
+    quantidade = linha.get('quantidade')
+    if isinstance(quantidade, bool) or not isinstance(quantidade, int) or quantidade <= 0:
+        raise MovimentacaoError('Quantidade deve ser um inteiro maior que zero')
+
+    produto_id = linha.get('produto_id')
+    codigo = linha.get('codigo')
+    if produto_id is None and not codigo:
+        raise MovimentacaoError('Informe produto_id ou codigo')
+    if produto_id is not None and (isinstance(produto_id, bool) or not isinstance(produto_id, int)):
+        raise MovimentacaoError('produto_id deve ser inteiro')
+
+    id_cliente = linha.get('id_cliente')
+    if id_cliente is not None and (not isinstance(id_cliente, str) or not id_cliente.strip()
+                                   or len(id_cliente) > TAMANHO_ID_CLIENTE):
+        raise MovimentacaoError(f'id_cliente deve ser um texto de até {TAMANHO_ID_CLIENTE} caracteres')
+
+    observacao = linha.get('observacao') or ''
+    return produto_id, (str(codigo) if codigo else None), tipo, quantidade, str(observacao), \
+        (id_cliente.strip() if id_cliente else None)
+
+def _carregar_produtos(ids, codigos):
+    """Busca id, código, saldo e situação dos produtos do lote com poucas consultas IN"""
+    produtos = {}
+    tabela = Produto.__table__
+    colunas = (tabela.c.id, tabela.c.codigo, tabela.c.quantidade, tabela.c.ativo)
+
+    for bloco in _em_blocos(sorted(ids)):
+        for linha in db.session.execute(select(*colunas).where(tabela.c.id.in_(bloco))):
+            produtos[linha.id] = linha
+    por_codigo = {}
+    for bloco in _em_blocos(sorted(codigos)):
+        for linha in db.session.execute(select(*colunas).where(tabela.c.codigo.in_(bloco))):
+            produtos[linha.id] = linha
+            por_codigo[linha.codigo] = linha.id
+    return produtos, por_codigo
+
+def _ids_cliente_gravados(ids_cliente):
+    """Quais desses identificadores de cliente já foram gravados (reenvio de um lote)
+
+    Procura na tabela quente e nos meses arquivados (cada um com índice único
+    em id_cliente): um lote reenviado depois que o seu mês foi para o arquivo
+    continua reconhecido como repetido.
+    """
+    gravados = set()
+    for segmento in segmentos():
+        pendentes = set(ids_cliente) - gravados
+        if not pendentes:
+            break
+        coluna = segmento.c.id_cliente
+        for bloco in _em_blocos(sorted(pendentes)):
+            gravados.update(db.session.execute(select(coluna).where(coluna.in_(bloco))).scalars())
+    return gravados
+
+def _aplicar_lote(linhas, usuario_id, atomico):
+    """Valida o lote contra um mapa pré-carregado e grava tudo em uma transação"""
+    normalizadas = []
+    erros = []
+    for indice, linha in enumerate(linhas):
+        try:
+            normalizadas.append((indice, _normalizar_linha(linha)))
+        except MovimentacaoError as e:
+            erros.append({'linha': indice, 'erro': str(e)})
+
+    ids = {n[0] for _, n in normalizadas if n[0] is not None}
+    codigos = {n[1] for _, n in normalizadas if n[0] is None}
+    produtos, por_codigo = _carregar_produtos(ids, codigos)
+    vistos = _ids_cliente_gravados({n[5] for _, n in normalizadas if n[5]})
+
+    # Simula o lote em ordem para validar cada saída contra o saldo corrente
+    saldos = {pid: p.quantidade for pid, p in produtos.items()}
+    deltas = {}
+    registros = []
+    repetidas = []
+    agora = datetime.utcnow()
+    for indice, (produto_id, codigo, tipo, quantidade, observacao, id_cliente) in normalizadas:
+        if id_cliente in vistos:
+            repetidas.append(indice)
+            continue
+        if produto_id is None:
+            produto_id = por_codigo.get(codigo)
+        produto = produtos.get(produto_id)
+        if produto is None or not produto.ativo:
+            erros.append({'linha': indice, 'erro': f'Produto {produto_id or codigo} não encontrado ou inativo.'})
+            continue
+
+        delta = quantidade if tipo == 'entrada' else -quantidade
+        if saldos[produto_id] + delta < 0:
+            erros.append({'linha': indice,
+                          'erro': f'Quantidade insuficiente em estoque. Disponível: {saldos[produto_id]}'})
+            continue
+
+        saldos[produto_id] += delta
+        deltas[produto_id] = deltas.get(produto_id, 0) + delta
+        if id_cliente:
+            vistos.add(id_cliente)
+        registros.append({
+            'produto_id': produto_id,
+            'usuario_id': usuario_id,
+            'tipo': tipo,
+            'quantidade': quantidade,
+            'observacao': observacao,
+            'data_movimentacao': agora,
+            'id_cliente': id_cliente,
+        })
+
+    erros.sort(key=lambda e: e['linha'])
+    if not registros or (atomico and erros):
+        return 0, erros, repetidas
+
+    # Saldos líquidos por produto; a condição protege contra alterações concorrentes
+    tabela = Produto.__table__
+    alteracoes = [{'p_id': pid, 'p_delta': delta} for pid, delta in sorted(deltas.items()) if delta]
+    if alteracoes:
+        stmt = update(tabela)\
+            .where(tabela.c.id == bindparam('p_id'),
+                   tabela.c.ativo == True,
+                   tabela.c.quantidade + bindparam('p_delta') >= 0)\
+            .values(quantidade=tabela.c.quantidade + bindparam('p_delta'),
+                    **valores_alerta(tabela.c.quantidade + bindparam('p_delta')))
+        with ajuste_resumo(tabela.c.id.in_([a['p_id'] for a in alteracoes])):
+            resultado = db.session.execute(stmt, alteracoes)
+            if resultado.rowcount != len(alteracoes):
+                db.session.rollback()
+                raise ConflitoLoteError('Saldo alterado durante o processamento do lote.')
+
+    try:
+        db.session.execute(insert(MovimentacaoEstoque.__table__), registros)
+    except IntegrityError:
+        # Outro envio do mesmo lote gravou um id_cliente entre a leitura e o INSERT
+        db.session.rollback()
+        raise ConflitoLoteError('Movimentação repetida gravada por outra transação.')
+    aplicar_delta(contribuicao_movimentos(registros))
+    publicar(_eventos_lote(registros, {a['p_id']: a['p_delta'] for a in alteracoes}))
+    db.session.commit()
+    return len(registros), erros, repetidas
+
+def _eventos_lote(registros, deltas):
+    """Um evento de resumo do lote e os eventos de saldo/alerta de cada produto alterado"""
+    eventos = [('movimentacao', {'lote': True, 'registradas': len(registros)})]
+    total = total_alertas()
+    tabela = Produto.__table__
+    for bloco in _em_blocos(sorted(deltas)):
+        for linha in db.session.execute(
+            select(tabela.c.id, tabela.c.quantidade, tabela.c.estoque_minimo, tabela.c.em_alerta)
+            .where(tabela.c.id.in_(bloco))
+        ):
+            estava_em_alerta = linha.quantidade - deltas[linha.id] <= linha.estoque_minimo
+            eventos += eventos_produto(linha.id, linha.quantidade, linha.em_alerta, estava_em_alerta, total)
+    return eventos
+
+def registrar_lote(linhas, usuario_id, atomico=False):
+    """Registra um lote de movimentações em uma única transação
+
+    Cada linha é um dicionário com tipo, quantidade, produto_id ou codigo e
+    observacao e id_cliente opcionais. Linhas inválidas são reportadas
+    individualmente; com atomico=True qualquer erro rejeita o lote inteiro.
+    Linhas cujo id_cliente já foi gravado são ignoradas, então reenviar um lote
+    (ex.: coletor que ficou offline sem receber a resposta) não duplica nada.
+    Retorna uma tupla (quantidade_registrada, erros, índices das linhas repetidas).
+    """
+    if len(linhas) > TAMANHO_MAXIMO_LOTE:
+        raise MovimentacaoError(f'Lote excede o limite de {TAMANHO_MAXIMO_LOTE} linhas')
+
+    for tentativa in range(MAX_TENTATIVAS):
+        try:
+            return com_nova_tentativa(lambda: _aplicar_lote(linhas, usuario_id, atomico))
+        except ConflitoLoteError:
+            if tentativa == MAX_TENTATIVAS - 1:
+                raise
+            time.sleep(ESPERA_INICIAL * (2 ** tentativa) * (1 + random.random()))
+
+def verificar_concorrencia(criar_app, escritores=8, operacoes=50):
+    """Teste de estresse: N escritores paralelos movimentando o mesmo produto
+
+    Roda em um banco SQLite temporário, criado e apagado aqui: o banco
+    configurado não recebe nada, então réplicas sincronizadas e clientes do
+    canal de eventos nunca veem o produto de teste. `criar_app(config)` é a
+    fábrica da aplicação. Dispara entradas e saídas concorrentes e confere se
+    o saldo final bate com as operações aceitas e com o histórico gravado.
+    Retorna um dicionário com o resultado.
+    """
+    with tempfile.TemporaryDirectory(prefix='estresse-') as pasta:
+        uri = 'sqlite:///' + os.path.join(pasta, 'estresse.db')
+        app = criar_app({'SQLALCHEMY_DATABASE_URI': uri, 'DATABASE_URL_LEITURA': uri, 'DB_ARQUIVO': None})
+        try:
+            return _estressar(app, escritores, operacoes)
+        finally:
+            with app.app_context():
+                for engine in db.engines.values():
+                    engine.dispose()
+
+def _estressar(app, escritores, operacoes):
+    with app.app_context():
+        atualizar_esquema()
+        usuario = Usuario(nome='Teste de concorrência', email='estresse@localhost', senha=uuid.uuid4().hex,
+                          tipo_usuario='admin')
+        produto = Produto(codigo='ESTRESSE', nome='Produto de teste de concorrência', estoque_minimo=0)
+        produto.quantidade = escritores * operacoes // 4
+        db.session.add_all([usuario, produto])
+        db.session.commit()
+        usuario_id, produto_id = usuario.id, produto.id
+        inicial = produto.quantidade
+
+    aceitas = {'entrada': 0, 'saida': 0}
+    recusadas = [0]
+    erros = []
+    trava = threading.Lock()
+
+    def escritor(semente):
+        sorteio = random.Random(semente)
+        with app.app_context():
+            for _ in range(operacoes):
+                tipo = sorteio.choice(TIPOS_MOVIMENTACAO)
+                try:
+                    registrar_movimentacao(produto_id, usuario_id, tipo, 1, 'teste de concorrência')
+                    with trava:
+                        aceitas[tipo] += 1
+                except EstoqueInsuficienteError:
+                    with trava:
+                        recusadas[0] += 1
+                except Exception as e:
+                    with trava:
+                        erros.append(repr(e))
+            db.session.remove()
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=escritor, args=(i,)) for i in range(escritores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    with app.app_context():
+        final = db.session.query(Produto.quantidade).filter(Produto.id == produto_id).scalar()
+        saldo_historico = db.session.query(func.coalesce(func.sum(
+            case((MovimentacaoEstoque.tipo == 'entrada', MovimentacaoEstoque.quantidade),
+                 else_=-MovimentacaoEstoque.quantidade)), 0))\
+            .filter(MovimentacaoEstoque.produto_id == produto_id).scalar()
+
+        esperado = inicial + aceitas['entrada'] - aceitas['saida']
+        resultado = {
+            'escritores': escritores,
+            'operacoes': escritores * operacoes,
+            'entradas': aceitas['entrada'],
+            'saidas': aceitas['saida'],
+            'recusadas': recusadas[0],
+            'erros': erros,
+            'quantidade_inicial': inicial,
+            'quantidade_final': final,
+            'quantidade_esperada': esperado,
+            'duracao': duracao,
+            'ok': not erros and final == esperado and final >= 0
+                  and inicial + saldo_historico == final,
+        }
+    return resultado
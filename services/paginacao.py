@@ -0,0 +1,144 @@
+"""Paginação por cursor (keyset) para listagens grandes"""
+import base64
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+TTL_TOTAL = 60  # segundos que um total estimado fica em cache
+MAX_TOTAIS_EM_CACHE = 256
+
+_totais = {}
+
+class CursorInvalidoError(ValueError):
+    """Token de paginação malformado ou adulterado"""
+
+class PaginaCursor:
+    """Página de resultados com tokens opacos para a próxima página e a anterior"""
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+def _codificar(valores, direcao):
+    """Gera o token opaco (base64 de JSON) com os valores da chave e a direção"""
+    dados = [['d', v.isoformat()] if isinstance(v, datetime) else ['v', v] for v in valores]
+    bruto = json.dumps({'c': dados, 'd': direcao}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+def _decodificar(token):
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        dados = json.loads(bruto)
+        valores = [datetime.fromisoformat(v) if t == 'd' else v for t, v in dados['c']]
+        direcao = dados['d']
+    except (ValueError, KeyError, TypeError):
+        raise CursorInvalidoError('Cursor de paginação inválido')
+    if direcao not in ('n', 'p'):
+        raise CursorInvalidoError('Cursor de paginação inválido')
+    return valores, direcao
+
+def _condicao_seek(ordem, valores, anterior):
+    """Condição 'depois de' (ou 'antes de') uma chave, aceitando colunas ASC e DESC
+
+    Expande (a, b) > (x, y) em a > x OR (a = x AND b > y) respeitando a direção
+    de cada coluna, e repete a primeira comparação de forma não estrita para que
+    o banco consiga usar o índice da coluna líder como intervalo.
+    """
+    def comparar(expressao, descendente, valor, estrito):
+        menor = descendente != anterior
+        if estrito:
+            return expressao < valor if menor else expressao > valor
+        return expressao <= valor if menor else expressao >= valor
+
+    alternativas = []
+    for i, (expressao, descendente) in enumerate(ordem):
+        iguais = [ordem[j][0] == valores[j] for j in range(i)]
+        alternativas.append(and_(*iguais, comparar(expressao, descendente, valores[i], True)))
+
+    lider, lider_desc = ordem[0]
+    return and_(comparar(lider, lider_desc, valores[0], False), or_(*alternativas))
+
+def total_estimado(chave, query):
+    """COUNT da consulta reaproveitado por alguns segundos para cada combinação de filtros
+
+    `query` pode ser uma lista de consultas (segmentos disjuntos); o total é a soma.
+    """
+    agora = time.monotonic()
+    registro = _totais.get(chave)
+    if registro and registro[1] > agora:
+        return registro[0]
+
+    consultas = query if isinstance(query, (list, tuple)) else [query]
+    total = sum(consulta.order_by(None).count() for consulta in consultas)
+    if len(_totais) >= MAX_TOTAIS_EM_CACHE:
+        _totais.pop(min(_totais, key=lambda k: _totais[k][1]))
+    _totais[chave] = (total, agora + TTL_TOTAL)
+    return total
+
+def paginar_por_cursor(query, ordem, chave, cursor=None, por_pagina=15, item=None):
+    """Busca uma página seguindo a ordenação `ordem` a partir do `cursor`
+
+    `ordem` é uma lista de (expressão, descendente) terminando em uma coluna única
+    (normalmente o id); `chave(linha)` devolve os valores dessas expressões para
+    uma linha do resultado e `item(linha)` o objeto exibido (padrão: a própria linha).
+    O custo de qualquer página é o de um seek no índice, sem OFFSET.
+    """
+    return paginar_segmentos([(query, ordem)], chave, cursor, por_pagina, item)
+
+def paginar_segmentos(consultas, chave, cursor=None, por_pagina=15, item=None):
+    """Como paginar_por_cursor, sobre várias consultas (query, ordem) encadeadas
+
+    As consultas são segmentos disjuntos já na ordem da listagem (ex.: tabela
+    quente e meses arquivados, do mais recente para o mais antigo), com a
+    mesma chave de ordenação. A página é preenchida segmento a segmento; o
+    cursor vale para qualquer um deles, e os segmentos que ficam antes dele
+    custam só um seek vazio.
+    """
+    item = item or (lambda linha: linha)
+    direcao = 'n'
+    valores = None
+    if cursor:
+        valores, direcao = _decodificar(cursor)
+        if len(valores) != len(consultas[0][1]):
+            raise CursorInvalidoError('Cursor de paginação inválido')
+
+    # Para voltar, percorre a ordenação invertida e desinverte o resultado
+    inverter = direcao == 'p'
+    linhas = []
+    for query, ordem in (reversed(consultas) if inverter else consultas):
+        if valores is not None:
+            query = query.filter(_condicao_seek(ordem, valores, anterior=inverter))
+        criterios = [(e.asc() if desc == inverter else e.desc()) for e, desc in ordem]
+        linhas += query.order_by(None).order_by(*criterios).limit(por_pagina + 1 - len(linhas)).all()
+        if len(linhas) > por_pagina:
+            break
+
+    sobrou = len(linhas) > por_pagina
+    linhas = linhas[:por_pagina]
+    if inverter:
+        linhas.reverse()
+
+    next_cursor = prev_cursor = None
+    if linhas:
+        tem_proxima = sobrou if direcao == 'n' else True
+        tem_anterior = bool(cursor) if direcao == 'n' else sobrou
+        if tem_proxima:
+            next_cursor = _codificar(chave(linhas[-1]), 'n')
+        if tem_anterior:
+            prev_cursor = _codificar(chave(linhas[0]), 'p')
+
+    return PaginaCursor([item(linha) for linha in linhas], next_cursor, prev_cursor)
@@ -0,0 +1,176 @@
+"""Recálculo em lote do estoque mínimo (ponto de pedido) a partir do consumo
+
+Para cada produto, com as saídas diárias da janela: consumo médio d e desvio
+padrão s. Com prazo de reposição L (dias) e nível de serviço p,
+
+    estoque mínimo = d * L + z(p) * s * sqrt(L)
+
+arredondado para cima, onde z é o quantil da normal padrão. O cálculo é
+vetorizado sobre os arrays de services.analise. As recomendações ficam em
+recomendacoes_estoque com a diferença para o valor atual e só mudam o
+produto quando aplicadas. Execuções agendadas recalculam apenas os produtos
+com movimentações depois da última execução (contador 'reposicao').
+"""
+import math
+from datetime import datetime
+from statistics import NormalDist
+
+from sqlalchemy import delete, func, insert, select, update
+
+from models.database import db, Contador, Produto, MovimentacaoEstoque, RecomendacaoEstoque
+from services.alertas import recalcular_alertas
+from services.analise import carregar_dados, carregar_numpy, JANELA_PADRAO
+from services.cache import ler_contador
+from services.eventos import publicar, evento_alerta, total_alertas
+from services.resumo import ajuste_resumo
+
+PRAZO_PADRAO = 7  # dias entre o pedido e a chegada
+NIVEL_SERVICO_PADRAO = 0.95
+CONTADOR_REPOSICAO = 'reposicao'  # maior id de movimentação já considerado
+TAMANHO_BLOCO = 500  # produtos por UPDATE (parâmetros do IN)
+
+_recomendacoes = RecomendacaoEstoque.__table__
+_movimentos = MovimentacaoEstoque.__table__
+_contadores = Contador.__table__
+
+class ReposicaoError(ValueError):
+    """Parâmetros inválidos para o cálculo do estoque mínimo"""
+
+def calcular_recomendacoes(dados, prazo, nivel_servico):
+    """Estoque mínimo sugerido para os produtos dos arrays, vetorizado
+
+    Produtos sem saída na janela não recebem recomendação (máscara `com_consumo`).
+    """
+    np = carregar_numpy()
+    n, dias = len(dados['ids']), dados['dias']
+    saidas = dados['saidas'].astype(np.float64)
+    soma = np.bincount(dados['indice'], weights=saidas, minlength=n)
+    soma_quadrados = np.bincount(dados['indice'], weights=saidas * saidas, minlength=n)
+
+    # Dias sem saída contam como zero na média e na variância
+    media = soma / dias
+    desvio = np.sqrt(np.maximum(soma_quadrados / dias - media * media, 0.0))
+    z = NormalDist().inv_cdf(nivel_servico)
+    sugerido = np.ceil(media * prazo + z * desvio * math.sqrt(prazo)).astype(np.int64)
+
+    return {
+        'ids': dados['ids'],
+        'com_consumo': soma > 0,
+        'atual': dados['estoque_minimo'],
+        'sugerido': np.maximum(sugerido, 0),
+        'media': media,
+        'desvio': desvio,
+    }
+
+def _validar(prazo, nivel_servico):
+    if not prazo or prazo < 1:
+        raise ReposicaoError('O prazo de reposição deve ser de pelo menos 1 dia.')
+    if not 0.5 <= nivel_servico < 1:
+        raise ReposicaoError('O nível de serviço deve estar entre 0,5 e 1 (ex.: 0,95).')
+
+def _marcar_execucao(ultimo_id):
+    atualizado = db.session.execute(
+        update(_contadores).where(_contadores.c.nome == CONTADOR_REPOSICAO).values(valor=ultimo_id)
+    ).rowcount
+    if not atualizado:
+        db.session.execute(insert(_contadores).values(nome=CONTADOR_REPOSICAO, valor=ultimo_id))
+
+def recalcular_reposicao(prazo=PRAZO_PADRAO, nivel_servico=NIVEL_SERVICO_PADRAO, dias=JANELA_PADRAO,
+                         completo=False):
+    """Recalcula as recomendações; retorna (produtos analisados, recomendações com diferença)
+
+    Por padrão só os produtos movimentados desde a última execução; com
+    completo=True (ou na primeira execução) o catálogo inteiro.
+    """
+    _validar(prazo, nivel_servico)
+    ultimo_id = db.session.execute(select(func.max(_movimentos.c.id))).scalar() or 0
+    anterior = ler_contador(CONTADOR_REPOSICAO)
+
+    produtos = None
+    if anterior and not completo:
+        if anterior >= ultimo_id:
+            return 0, 0
+        produtos = select(_movimentos.c.produto_id).distinct()\
+            .where(_movimentos.c.id > anterior, _movimentos.c.id <= ultimo_id)
+
+    agora = datetime.utcnow()
+    resultado = calcular_recomendacoes(carregar_dados(dias, agora, produtos), prazo, nivel_servico)
+
+    linhas = []
+    for i in resultado['com_consumo'].nonzero()[0].tolist():
+        atual, sugerido = int(resultado['atual'][i]), int(resultado['sugerido'][i])
+        linhas.append({
+            'produto_id': int(resultado['ids'][i]),
+            'estoque_minimo_atual': atual,
+            'estoque_minimo_sugerido': sugerido,
+            'diferenca': sugerido - atual,
+            'consumo_medio': round(float(resultado['media'][i]), 4),
+            'desvio_consumo': round(float(resultado['desvio'][i]), 4),
+            'prazo_dias': prazo,
+            'nivel_servico': nivel_servico,
+            'calculado_em': agora,
+        })
+
+    apagar = delete(_recomendacoes)
+    if produtos is not None:
+        apagar = apagar.where(_recomendacoes.c.produto_id.in_(produtos))
+    db.session.execute(apagar)
+    for i in range(0, len(linhas), 1000):
+        db.session.execute(insert(_recomendacoes), linhas[i:i + 1000])
+    _marcar_execucao(ultimo_id)
+    db.session.commit()
+    return len(resultado['ids']), sum(1 for linha in linhas if linha['diferenca'])
+
+def recomendacoes_pendentes(limite=200):
+    """Recomendações ainda não aplicadas que mudam o estoque mínimo, maiores diferenças primeiro"""
+    return db.session.execute(
+        select(_recomendacoes, Produto.codigo, Produto.nome, Produto.quantidade,
+               Produto.estoque_minimo.label('estoque_minimo_produto'))
+        .join(Produto, Produto.id == _recomendacoes.c.produto_id)
+        .where(_recomendacoes.c.aplicado_em.is_(None), _recomendacoes.c.diferenca != 0,
+               Produto.ativo == True)
+        .order_by(func.abs(_recomendacoes.c.diferenca).desc(), _recomendacoes.c.produto_id)
+        .limit(limite)
+    ).mappings().all()
+
+def contar_pendentes():
+    return db.session.execute(
+        select(func.count()).select_from(_recomendacoes)
+        .where(_recomendacoes.c.aplicado_em.is_(None), _recomendacoes.c.diferenca != 0)
+    ).scalar()
+
+def _aplicar_bloco(ids, agora):
+    sugerido = select(_recomendacoes.c.estoque_minimo_sugerido)\
+        .where(_recomendacoes.c.produto_id == Produto.id).scalar_subquery()
+    antes = dict(db.session.execute(select(Produto.id, Produto.em_alerta).where(Produto.id.in_(ids))).all())
+
+    with ajuste_resumo(Produto.id.in_(ids)):
+        db.session.execute(
+            update(Produto).where(Produto.id.in_(ids), Produto.ativo == True)
+            .values(estoque_minimo=sugerido).execution_options(synchronize_session=False)
+        )
+        recalcular_alertas(ids)
+    db.session.execute(
+        update(_recomendacoes).where(_recomendacoes.c.produto_id.in_(ids)).values(aplicado_em=agora)
+    )
+
+    mudaram = [linha for linha in db.session.execute(
+        select(Produto.id, Produto.quantidade, Produto.em_alerta).where(Produto.id.in_(ids))
+    ) if bool(linha.em_alerta) != bool(antes.get(linha.id))]
+    if mudaram:
+        total = total_alertas()
+        publicar([evento_alerta(linha.id, linha.em_alerta, linha.quantidade, total) for linha in mudaram])
+
+def aplicar_recomendacoes(produto_ids=None):
+    """Aplica as recomendações pendentes (todas ou as dos produtos informados); retorna quantas"""
+    stmt = select(_recomendacoes.c.produto_id)\
+        .where(_recomendacoes.c.aplicado_em.is_(None), _recomendacoes.c.diferenca != 0)
+    if produto_ids is not None:
+        stmt = stmt.where(_recomendacoes.c.produto_id.in_(list(produto_ids)))
+    ids = sorted(db.session.execute(stmt).scalars())
+
+    agora = datetime.utcnow()
+    for i in range(0, len(ids), TAMANHO_BLOCO):
+        _aplicar_bloco(ids[i:i + TAMANHO_BLOCO], agora)
+    db.session.commit()
+    return len(ids)
@@ -0,0 +1,253 @@
+"""Resumo pré-calculado do dashboard (totais, valor em estoque, categorias e movimentações do dia)
+
+A tabela resumo_estoque guarda as contribuições somadas dos produtos ativos e
+das movimentações. Cada escrita aplica só a diferença que causou: para um
+conjunto de produtos, a contribuição depois da escrita menos a de antes, na
+mesma transação. Assim o dashboard lê todos os números em uma consulta.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import String, and_, case, cast, delete, event, func, insert, or_, select, true, update
+from sqlalchemy.orm import Session
+
+from models.database import db, Categoria, Produto, MovimentacaoEstoque, ResumoEstoque, Usuario
+from services.arquivo import segmentos
+
+_resumo = ResumoEstoque.__table__
+
+def _novo_delta():
+    return defaultdict(lambda: [0, 0, 0.0])
+
+def _somar(delta, outro, sinal=1):
+    for chave, (total, quantidade, valor) in outro.items():
+        atual = delta[chave]
+        atual[0] += sinal * total
+        atual[1] += sinal * quantidade
+        atual[2] += sinal * valor
+    return delta
+
+def contribuicao_produtos(condicao, conexao=None):
+    """Contribuição dos produtos que satisfazem `condicao` para os totais gerais e por categoria"""
+    categoria = func.coalesce(cast(Produto.categoria_id, String), '')
+    stmt = select(
+        categoria,
+        func.count(),
+        func.coalesce(func.sum(Produto.quantidade), 0),
+        func.coalesce(func.sum(func.coalesce(Produto.preco, 0) * Produto.quantidade), 0),
+        func.coalesce(func.sum(case((Produto.em_alerta == True, 1), else_=0)), 0),
+    ).where(Produto.ativo == True, condicao).group_by(categoria)
+
+    delta = _novo_delta()
+    for nome, total, quantidade, valor, alertas in (conexao or db.session).execute(stmt):
+        _somar(delta, {
+            ('geral', 'produtos'): (total, quantidade, valor),
+            ('geral', 'alertas'): (alertas, 0, 0.0),
+            ('categoria', nome): (total, quantidade, valor),
+        })
+    return delta
+
+def contribuicao_movimentos(registros, sinal=1):
+    """Totais do dia a partir de movimentações (objetos ou dicionários com data, tipo e quantidade)"""
+    delta = _novo_delta()
+    for registro in registros:
+        if isinstance(registro, dict):
+            data, tipo, quantidade = registro['data_movimentacao'], registro['tipo'], registro['quantidade']
+        else:
+            data, tipo, quantidade = registro.data_movimentacao, registro.tipo, registro.quantidade
+        atual = delta[('dia', f'{data or datetime.utcnow():%Y-%m-%d}:{tipo}')]
+        atual[0] += sinal
+        atual[1] += sinal * quantidade
+    return delta
+
+def contribuicao_dias(condicao, conexao=None, sinal=1, tabela=None):
+    """Totais por dia e tipo das movimentações gravadas que satisfazem `condicao`
+
+    `tabela` é a de um mês arquivado (services.arquivo); por padrão, a tabela quente.
+    """
+    c = (tabela if tabela is not None else MovimentacaoEstoque.__table__).c
+    dia = func.date(c.data_movimentacao)
+    delta = _novo_delta()
+    for data, tipo, total, quantidade in (conexao or db.session).execute(
+        select(dia, c.tipo, func.count(), func.sum(c.quantidade))
+        .where(condicao).group_by(dia, c.tipo)
+    ):
+        delta[('dia', f'{data}:{tipo}')] = [sinal * total, sinal * quantidade, 0.0]
+    return delta
+
+def contribuicao_historico():
+    """Totais por dia e tipo de todo o histórico: tabela quente e meses arquivados"""
+    delta = _novo_delta()
+    for segmento in segmentos():
+        _somar(delta, contribuicao_dias(and_(true(), *segmento.condicoes()), tabela=segmento.tabela))
+    return delta
+
+def delta_movimentacao(linha, delta):
+    """Diferença causada por uma movimentação, a partir do RETURNING do UPDATE do produto
+
+    `linha` traz quantidade (já atualizada), estoque_minimo, preco, categoria_id e
+    em_alerta; o estado anterior é deduzido da quantidade menos `delta`.
+    """
+    valor = (linha.preco or 0) * delta
+    estava_em_alerta = linha.quantidade - delta <= linha.estoque_minimo
+    return _somar(_novo_delta(), {
+        ('geral', 'produtos'): (0, delta, valor),
+        ('geral', 'alertas'): (int(linha.em_alerta) - int(estava_em_alerta), 0, 0.0),
+        ('categoria', str(linha.categoria_id or '')): (0, delta, valor),
+    })
+
+def aplicar_delta(delta, conexao=None):
+    """Soma as diferenças às linhas do resumo, criando as que ainda não existem"""
+    conexao = conexao or db.session
+    for (grupo, chave), (total, quantidade, valor) in delta.items():
+        if not (total or quantidade or valor):
+            continue
+        resultado = conexao.execute(
+            update(_resumo)
+            .where(_resumo.c.grupo == grupo, _resumo.c.chave == chave)
+            .values(total=_resumo.c.total + total,
+                    quantidade=_resumo.c.quantidade + quantidade,
+                    valor=_resumo.c.valor + valor)
+        )
+        if resultado.rowcount == 0:
+            conexao.execute(insert(_resumo).values(
+                grupo=grupo, chave=chave, total=total, quantidade=quantidade, valor=valor
+            ))
+
+@contextmanager
+def ajuste_resumo(condicao):
+    """Envolve uma escrita em massa nos produtos que satisfazem `condicao`
+
+    Lê a contribuição desses produtos antes e depois do bloco e aplica a
+    diferença. Se o bloco levantar exceção nada é aplicado.
+    """
+    antes = contribuicao_produtos(condicao)
+    yield
+    aplicar_delta(_somar(contribuicao_produtos(condicao), antes, sinal=-1))
+
+def reconstruir_resumo():
+    """Recalcula o resumo inteiro a partir de produtos e movimentações"""
+    db.session.execute(delete(_resumo))
+    delta = _somar(contribuicao_produtos(true()), contribuicao_historico())
+    # Linhas gerais existem mesmo com o catálogo vazio
+    delta[('geral', 'produtos')]
+    delta[('geral', 'alertas')]
+
+    db.session.execute(insert(_resumo), [
+        {'grupo': grupo, 'chave': chave, 'total': total, 'quantidade': quantidade, 'valor': valor}
+        for (grupo, chave), (total, quantidade, valor) in delta.items()
+    ])
+    db.session.commit()
+
+def _linhas_resumo(dia):
+    # Linhas por categoria vêm com o nome da categoria (chave = id)
+    return db.session.execute(
+        select(_resumo.c.grupo, _resumo.c.chave, _resumo.c.total, _resumo.c.quantidade, _resumo.c.valor,
+               Categoria.nome)
+        .outerjoin(Categoria, and_(_resumo.c.grupo == 'categoria',
+                                   _resumo.c.chave == cast(Categoria.id, String)))
+        .where(or_(_resumo.c.grupo.in_(('geral', 'categoria')),
+                   and_(_resumo.c.grupo == 'dia',
+                        _resumo.c.chave.in_((f'{dia}:entrada', f'{dia}:saida')))))
+    ).all()
+
+def obter_resumo(dia=None):
+    """Todos os números do dashboard em uma única consulta"""
+    dia = dia or datetime.utcnow().strftime('%Y-%m-%d')
+    resumo = {
+        'total_produtos': 0,
+        'unidades_em_estoque': 0,
+        'valor_estoque': 0.0,
+        'produtos_estoque_baixo': 0,
+        'categorias': [],
+        'hoje': {'data': dia,
+                 'entrada': {'movimentacoes': 0, 'quantidade': 0},
+                 'saida': {'movimentacoes': 0, 'quantidade': 0}},
+    }
+    for grupo, chave, total, quantidade, valor, nome in _linhas_resumo(dia):
+        if grupo == 'geral' and chave == 'produtos':
+            resumo.update(total_produtos=total, unidades_em_estoque=quantidade, valor_estoque=round(valor, 2))
+        elif grupo == 'geral' and chave == 'alertas':
+            resumo['produtos_estoque_baixo'] = total
+        elif grupo == 'categoria' and total:
+            resumo['categorias'].append({'nome': nome or 'Sem categoria', 'produtos': total,
+                                         'quantidade': quantidade, 'valor': round(valor, 2)})
+        elif grupo == 'dia':
+            resumo['hoje'][chave.rsplit(':', 1)[1]] = {'movimentacoes': total, 'quantidade': quantidade}
+    resumo['categorias'].sort(key=lambda c: c['nome'])
+    return resumo
+
+def divergencias_resumo():
+    """Compara o resumo gravado com um recálculo completo; retorna as chaves divergentes"""
+    esperado = _somar(contribuicao_produtos(true()), contribuicao_historico())
+    gravado = {(g, c): [t, q, v] for g, c, t, q, v in db.session.execute(
+        select(_resumo.c.grupo, _resumo.c.chave, _resumo.c.total, _resumo.c.quantidade, _resumo.c.valor)
+    )}
+    divergentes = []
+    for chave in set(esperado) | set(gravado):
+        calculado = esperado.get(chave, [0, 0, 0.0])
+        atual = gravado.get(chave, [0, 0, 0.0])
+        if calculado[:2] != atual[:2] or abs(calculado[2] - atual[2]) > 0.01:
+            divergentes.append({'chave': ':'.join(chave), 'esperado': calculado, 'gravado': atual})
+    return divergentes
+
+# ==================== ESCRITAS PELO ORM ====================
+# Cadastro, edição e exclusão de produtos e as movimentações individuais passam
+# pelo flush do ORM; as escritas em massa dos serviços usam ajuste_resumo.
+
+@event.listens_for(Session, 'before_flush')
+def _antes_flush(session, contexto, instancias):
+    ids = [obj.id for obj in session.dirty if isinstance(obj, Produto) and session.is_modified(obj)] + \
+          [obj.id for obj in session.deleted if isinstance(obj, Produto)]
+    if ids:
+        session.info['resumo_antes'] = (ids, contribuicao_produtos(Produto.id.in_(ids), session.connection()))
+
+@event.listens_for(Session, 'after_flush')
+def _apos_flush(session, contexto):
+    ids, antes = session.info.pop('resumo_antes', ([], _novo_delta()))
+    ids = ids + [obj.id for obj in session.new if isinstance(obj, Produto)]
+    delta = _novo_delta()
+    if ids:
+        _somar(delta, contribuicao_produtos(Produto.id.in_(ids), session.connection()))
+        _somar(delta, antes, sinal=-1)
+
+    _somar(delta, contribuicao_movimentos(
+        obj for obj in session.new if isinstance(obj, MovimentacaoEstoque)))
+    _somar(delta, contribuicao_movimentos(
+        (obj for obj in session.deleted if isinstance(obj, MovimentacaoEstoque)), sinal=-1))
+    if delta:
+        aplicar_delta(delta, session.connection())
+
+@event.listens_for(Session, 'after_rollback')
+def _apos_rollback(session):
+    session.info.pop('resumo_antes', None)
+
+# ==================== DASHBOARD ====================
+
+def movimentacoes_recentes(limite=5):
+    """Últimas movimentações com produto e usuário em uma consulta (sem lazy load no template)"""
+    linhas = db.session.execute(
+        select(MovimentacaoEstoque.id, MovimentacaoEstoque.data_movimentacao, MovimentacaoEstoque.tipo,
+               MovimentacaoEstoque.quantidade, Produto.codigo.label('produto_codigo'),
+               Produto.nome.label('produto_nome'), Usuario.nome.label('usuario_nome'))
+        .join(Produto, MovimentacaoEstoque.produto_id == Produto.id)
+        .join(Usuario, MovimentacaoEstoque.usuario_id == Usuario.id)
+        .order_by(MovimentacaoEstoque.data_movimentacao.desc(), MovimentacaoEstoque.id.desc())
+        .limit(limite)
+    ).mappings().all()
+    return [dict(linha) for linha in linhas]
+
+def alertas_recentes(limite=5):
+    linhas = db.session.execute(
+        select(Produto.id, Produto.codigo, Produto.nome, Produto.quantidade, Produto.estoque_minimo)
+        .where(Produto.em_alerta == True).order_by(Produto.nome).limit(limite)
+    ).mappings().all()
+    return [dict(linha) for linha in linhas]
+
+def painel_dashboard():
+    """Resumo + últimas movimentações + primeiros alertas, como dados simples (cacheáveis)"""
+    painel = obter_resumo()
+    painel['movimentacoes_recentes'] = movimentacoes_recentes()
+    painel['produtos_alerta'] = alertas_recentes()
+    return painel
@@ -0,0 +1,131 @@
+"""Cache da identidade do usuário logado (user_loader do Flask-Login)
+
+O Flask-Login carrega o usuário da sessão em todo request autenticado,
+inclusive chamadas de API e atualizações via AJAX. Os campos usados a cada
+request (id, nome, email, tipo e situação) ficam em um cache por processo
+com TTL curto, como uma cópia somente leitura; requests que não mexem em
+usuários não consultam a tabela usuarios. Alterações em usuários feitas
+pela aplicação invalidam a entrada no commit; as feitas em outro worker ou
+fora da aplicação valem no máximo após o TTL.
+"""
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models.database import db, Usuario
+
+TTL_PADRAO = 60  # segundos
+MAX_ITENS = 1024
+
+_usuarios = Usuario.__table__
+
+class UsuarioSessao(UserMixin):
+    """Cópia dos dados do usuário usados pelas páginas e pelas verificações de acesso"""
+    __slots__ = ('id', 'nome', 'email', 'tipo_usuario', 'ativo')
+
+    def __init__(self, id, nome, email, tipo_usuario, ativo):
+        self.id = id
+        self.nome = nome
+        self.email = email
+        self.tipo_usuario = tipo_usuario
+        self.ativo = ativo
+
+    @property
+    def is_active(self):
+        return bool(self.ativo)
+
+    def is_admin(self):
+        """Verifica se o usuário é administrador"""
+        return self.tipo_usuario == 'admin'
+
+    def __repr__(self):
+        return f'<UsuarioSessao {self.nome}>'
+
+class CacheUsuarios:
+    """Identidades por id de usuário, com expiração"""
+    def __init__(self, ttl=TTL_PADRAO, max_itens=MAX_ITENS):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+        self._itens = {}
+        self._trava = threading.Lock()
+
+    def obter(self, usuario_id):
+        """Usuário ativo com o id informado, do cache ou do banco; None se não existir ou estiver inativo"""
+        agora = time.monotonic()
+        with self._trava:
+            registro = self._itens.get(usuario_id)
+            if registro and registro[1] > agora:
+                self.acertos += 1
+                return registro[0]
+            self.falhas += 1
+
+        linha = db.session.execute(
+            select(_usuarios.c.id, _usuarios.c.nome, _usuarios.c.email, _usuarios.c.tipo_usuario,
+                   _usuarios.c.ativo).where(_usuarios.c.id == usuario_id)
+        ).first()
+        usuario = UsuarioSessao(*linha) if linha and linha.ativo else None
+        with self._trava:
+            if len(self._itens) >= self.max_itens:
+                self._itens = {chave: registro for chave, registro in self._itens.items() if registro[1] > agora}
+                if len(self._itens) >= self.max_itens:
+                    self._itens.clear()
+            self._itens[usuario_id] = (usuario, agora + self.ttl)
+        return usuario
+
+    def invalidar(self, usuario_ids=None):
+        """Descarta as entradas dos usuários informados (ou todas)"""
+        with self._trava:
+            if usuario_ids is None:
+                self._itens.clear()
+            else:
+                for usuario_id in usuario_ids:
+                    self._itens.pop(usuario_id, None)
+            self.invalidacoes += 1
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'invalidacoes': self.invalidacoes,
+            'taxa_acerto': round(self.acertos / total, 4) if total else None,
+            'ttl': self.ttl,
+        }
+
+usuarios_cache = CacheUsuarios()
+
+# ==================== INVALIDAÇÃO ====================
+
+_TODOS = object()
+
+@event.listens_for(Session, 'after_flush')
+def _apos_flush(session, contexto):
+    # Edição, desativação e exclusão de usuários pelo ORM
+    alterados = list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]
+    ids = {obj.id for obj in alterados if isinstance(obj, Usuario)}
+    if ids:
+        session.info.setdefault('usuarios_alterados', set()).update(ids)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _apos_execucao_dml(estado):
+    # UPDATE/DELETE em massa na tabela de usuários: não há como saber os ids
+    if (estado.is_update or estado.is_delete) and \
+            getattr(getattr(estado.statement, 'table', None), 'name', None) == _usuarios.name:
+        estado.session.info.setdefault('usuarios_alterados', set()).add(_TODOS)
+
+@event.listens_for(Session, 'after_commit')
+def _apos_commit(session):
+    ids = session.info.pop('usuarios_alterados', None)
+    if ids:
+        usuarios_cache.invalidar(None if _TODOS in ids else ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _apos_rollback(session):
+    session.info.pop('usuarios_alterados', None)
@@ -0,0 +1,96 @@
+"""Sincronização incremental das réplicas locais (PDVs, coletores offline)
+
+Categorias, produtos e movimentações levam uma `sequencia`: um número global e
+crescente atribuído pelos gatilhos do SQLite a cada inserção ou alteração de
+um campo enviado às réplicas (contador 'sincronizacao', veja models/esquema.py).
+Como o SQLite tem um único escritor, uma transação confirmada depois sempre
+tem sequências maiores, então o cursor do cliente é só a maior sequência já
+recebida: `GET /api/sync?since=<cursor>` devolve as linhas alteradas depois
+dele, em ordem e em blocos de tamanho limitado, lidas por índice.
+
+As linhas vão em formato colunar (nomes dos campos uma vez, valores em
+listas); produtos e categorias desativados vão só como ids em `*_removidos`.
+Movimentações de meses já arquivados (services.arquivo) não são enviadas:
+`movimentacoes_desde` diz a partir de quando a réplica recebe o histórico.
+"""
+from sqlalchemy import select
+
+from models.conexao import sessao_leitura
+from models.database import Categoria, Produto, MovimentacaoEstoque
+from models.esquema import CONTADOR_SINCRONIZACAO
+from services.arquivo import arquivado_ate
+from services.cache import ler_contador
+
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+
+COLUNAS = {
+    'categorias': (Categoria.id, Categoria.nome),
+    'produtos': (Produto.id, Produto.codigo, Produto.nome, Produto.descricao, Produto.categoria_id,
+                 Produto.quantidade, Produto.estoque_minimo, Produto.preco),
+    'movimentacoes': (MovimentacaoEstoque.id, MovimentacaoEstoque.produto_id, MovimentacaoEstoque.tipo,
+                      MovimentacaoEstoque.quantidade, MovimentacaoEstoque.data_movimentacao,
+                      MovimentacaoEstoque.id_cliente),
+}
+MODELOS = {'categorias': Categoria, 'produtos': Produto, 'movimentacoes': MovimentacaoEstoque}
+REMOVIDOS = {'categorias': 'categorias_removidas', 'produtos': 'produtos_removidos'}
+
+class CursorSincronizacaoError(ValueError):
+    """Cursor inválido ou à frente do servidor (réplica de outro banco): sincronize do zero"""
+
+def _valor(valor):
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+def _alteradas(sessao, nome, cursor, limite):
+    """(sequencia, nome, ativo, valores) das linhas de uma tabela alteradas depois do cursor"""
+    modelo = MODELOS[nome]
+    ativo = getattr(modelo, 'ativo', None)
+    stmt = select(modelo.sequencia, *COLUNAS[nome])
+    if ativo is not None:
+        stmt = stmt.add_columns(ativo)
+    stmt = stmt.where(modelo.sequencia > cursor).order_by(modelo.sequencia).limit(limite + 1)
+    for linha in sessao.execute(stmt):
+        valores = linha[1:len(COLUNAS[nome]) + 1]
+        yield linha[0], nome, (linha[-1] if ativo is not None else True), valores
+
+def alteracoes_desde(cursor, limite=LIMITE_PADRAO, movimentacoes=False):
+    """Próximo bloco de alterações depois de `cursor` (0 = carga completa)
+
+    Retorna {'cursor', 'mais', '<tabela>': {'campos', 'linhas'}, 'produtos_removidos',
+    'categorias_removidas'} e, com movimentações, 'movimentacoes_desde' (início da
+    tabela quente; None enquanto nada foi arquivado).
+    Movimentações só são incluídas com movimentacoes=True. Se `mais` for True,
+    o cliente repete a chamada com o cursor devolvido.
+    """
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    tabelas = ['categorias', 'produtos'] + (['movimentacoes'] if movimentacoes else [])
+
+    # Uma transação de leitura só: as três tabelas no mesmo instante
+    with sessao_leitura() as sessao:
+        atual = ler_contador(CONTADOR_SINCRONIZACAO, sessao)
+        if cursor > atual:
+            raise CursorSincronizacaoError('Cursor à frente do servidor; sincronize a partir de 0.')
+        alteradas = sorted(
+            (linha for nome in tabelas for linha in _alteradas(sessao, nome, cursor, limite)),
+            key=lambda linha: linha[0]
+        )
+
+    mais = len(alteradas) > limite
+    alteradas = alteradas[:limite]
+    resultado = {
+        'cursor': alteradas[-1][0] if alteradas else cursor,
+        'mais': mais,
+    }
+    if movimentacoes:
+        desde = arquivado_ate()
+        resultado['movimentacoes_desde'] = desde.isoformat() if desde else None
+    for nome in tabelas:
+        resultado[nome] = {'campos': [c.key for c in COLUNAS[nome]], 'linhas': []}
+        if nome in REMOVIDOS:
+            resultado[REMOVIDOS[nome]] = []
+    for _, nome, ativo, valores in alteradas:
+        if ativo is not False:
+            resultado[nome]['linhas'].append([_valor(v) for v in valores])
+        else:
+            resultado[REMOVIDOS[nome]].append(valores[0])
+    return resultado
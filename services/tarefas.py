@@ -0,0 +1,452 @@
+"""Tarefas em segundo plano: fila persistente no banco e trabalhadores em processos
+
+Operações longas (importação do catálogo, recálculo das análises e da
+reposição, reconstruções, arquivamento) não rodam dentro do request: a rota só grava uma
+linha em `tarefas` e responde. O comando `flask tarefas-trabalhador` inicia N
+processos (padrão: um por núcleo), cada um com a sua aplicação; cada processo
+pega a próxima tarefa pendente com um UPDATE ... RETURNING (o SQLite serializa
+as escritas, então dois processos nunca pegam a mesma) e a executa, de modo que
+cálculos pesados (NumPy, leitura de planilhas) se espalham pelos núcleos sem
+depender de um broker externo.
+
+- progresso e cancelamento: a tarefa recebe um `Contexto`; `progresso()` grava a
+  fração e a mensagem em uma conexão separada e interrompe a tarefa se o
+  cancelamento foi pedido (cooperativo: o que já foi gravado permanece);
+- falhas: nova tentativa com espera exponencial até max_tentativas; erros de
+  validação (ex.: arquivo inválido) falham na hora;
+- processos interrompidos: quem executa grava um batimento periódico, e tarefas
+  em execução sem batimento há TEMPO_ABANDONO voltam para a fila.
+"""
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import OperationalError
+from werkzeug.utils import secure_filename
+
+from models.database import db, Tarefa
+from models.esquema import reindexar_busca
+from services.alertas import corrigir_alertas
+from services.analise import recalcular_analises, AnaliseError, JANELA_PADRAO
+from services.arquivo import arquivar_movimentacoes
+from services.historico import fechamento_pendente, gerar_snapshots, reconstruir_snapshots
+from services.importacao import importar_produtos, ImportacaoError
+from services.reposicao import recalcular_reposicao, ReposicaoError
+from services.resumo import reconstruir_resumo
+
+MAX_TENTATIVAS = 3
+ESPERA_INICIAL = 10  # segundos antes da 2ª tentativa; dobra a cada falha
+ESPERA_MAXIMA = 600
+INTERVALO_BATIMENTO = 30  # segundos
+TEMPO_ABANDONO = timedelta(minutes=5)  # sem batimento: o processo morreu
+INTERVALO_PROGRESSO = 0.5  # segundos entre gravações de progresso
+INTERVALO_MANUTENCAO = 60  # segundos entre recuperações e limpezas da fila
+RETENCAO = timedelta(days=7)  # tarefas encerradas mais antigas são apagadas
+TEMPO_PARADA = 30  # segundos esperando as tarefas em curso ao encerrar o trabalhador
+PASTA_ARQUIVOS = 'tarefas'  # dentro de instance/, arquivos enviados para as tarefas
+
+PENDENTE, EXECUTANDO, CONCLUIDA, FALHOU, CANCELADA = 'pendente', 'executando', 'concluida', 'falhou', 'cancelada'
+ENCERRADAS = (CONCLUIDA, FALHOU, CANCELADA)
+
+_tarefas = Tarefa.__table__
+_registro = {}
+
+class TarefaError(Exception):
+    """Tarefa desconhecida ou parâmetros inválidos"""
+
+class TarefaCancelada(Exception):
+    """Levantada por Contexto.progresso quando o cancelamento foi pedido"""
+
+def tarefa(tipo, descricao, max_tentativas=MAX_TENTATIVAS, permanentes=()):
+    """Registra uma função como tarefa: funcao(contexto, **parametros) -> resultado (JSON)
+
+    `permanentes` são as exceções que não adiantam repetir (validação, dependência ausente).
+    """
+    def decorator(funcao):
+        _registro[tipo] = {'funcao': funcao, 'descricao': descricao, 'max_tentativas': max_tentativas,
+                           'permanentes': tuple(permanentes)}
+        return funcao
+    return decorator
+
+def _agora():
+    return datetime.utcnow()
+
+# ==================== FILA ====================
+
+def enfileirar(tipo, usuario_id=None, **parametros):
+    """Grava a tarefa como pendente e a devolve; nada é executado no processo web"""
+    definicao = _registro.get(tipo)
+    if definicao is None:
+        raise TarefaError(f'Tarefa desconhecida: {tipo}')
+    nova = Tarefa(tipo=tipo, descricao=definicao['descricao'], parametros=json.dumps(parametros),
+                  max_tentativas=definicao['max_tentativas'], usuario_id=usuario_id, estado=PENDENTE,
+                  disponivel_em=_agora())
+    db.session.add(nova)
+    db.session.commit()
+    return nova
+
+def salvar_arquivo(arquivo):
+    """Grava um upload na pasta das tarefas e devolve o caminho (removido quando a tarefa termina)"""
+    pasta = os.path.join(current_app.instance_path, PASTA_ARQUIVOS)
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f'{uuid.uuid4().hex}-{secure_filename(arquivo.filename) or "arquivo"}')
+    arquivo.save(caminho)
+    return caminho
+
+def _remover_arquivo(parametros):
+    caminho = parametros.get('arquivo')
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+def cancelar_tarefa(tarefa_id):
+    """Cancela na hora se pendente; se em execução, pede o cancelamento ao trabalhador
+
+    Retorna 'cancelada', 'solicitado' ou None (tarefa inexistente ou já encerrada).
+    """
+    linha = db.session.execute(
+        update(_tarefas).where(_tarefas.c.id == tarefa_id, _tarefas.c.estado == PENDENTE)
+        .values(estado=CANCELADA, concluido_em=_agora(), mensagem='Cancelada antes de iniciar.')
+        .returning(_tarefas.c.parametros)
+    ).first()
+    if linha is not None:
+        db.session.commit()
+        _remover_arquivo(json.loads(linha.parametros))
+        return 'cancelada'
+    pedido = db.session.execute(
+        update(_tarefas).where(_tarefas.c.id == tarefa_id, _tarefas.c.estado == EXECUTANDO).values(cancelar=True)
+    ).rowcount
+    db.session.commit()
+    return 'solicitado' if pedido else None
+
+def tarefa_para_dict(tarefa, resultado=True):
+    dados = {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'descricao': tarefa.descricao,
+        'estado': tarefa.estado,
+        'progresso': tarefa.progresso,
+        'mensagem': tarefa.mensagem,
+        'erro': tarefa.erro,
+        'tentativas': tarefa.tentativas,
+        'max_tentativas': tarefa.max_tentativas,
+        'cancelamento_pedido': tarefa.cancelar,
+        'criado_em': tarefa.criado_em.isoformat() if tarefa.criado_em else None,
+        'iniciado_em': tarefa.iniciado_em.isoformat() if tarefa.iniciado_em else None,
+        'concluido_em': tarefa.concluido_em.isoformat() if tarefa.concluido_em else None,
+    }
+    if resultado:
+        dados['resultado'] = json.loads(tarefa.resultado) if tarefa.resultado else None
+    return dados
+
+def listar_tarefas(limite=50):
+    return Tarefa.query.order_by(Tarefa.id.desc()).limit(limite).all()
+
+def fila_parada(tolerancia=timedelta(seconds=30)):
+    """True se há tarefa pendente há mais que `tolerancia` e nenhuma em execução (trabalhador parado?)"""
+    atrasada = db.session.query(Tarefa.id).filter(
+        Tarefa.estado == PENDENTE, Tarefa.disponivel_em < _agora() - tolerancia).first()
+    if atrasada is None:
+        return False
+    return db.session.query(Tarefa.id).filter(Tarefa.estado == EXECUTANDO).first() is None
+
+# ==================== EXECUÇÃO ====================
+
+class Contexto:
+    """Canal da tarefa em execução com a fila: progresso, mensagem e cancelamento"""
+    def __init__(self, tarefa_id, tentativa=1):
+        self.tarefa_id = tarefa_id
+        self.tentativa = tentativa
+        self.mensagem_final = None
+        self._ultima = 0.0
+
+    def concluir(self, mensagem):
+        """Mensagem gravada junto com a conclusão (o trabalho já foi feito: não verifica cancelamento)"""
+        self.mensagem_final = mensagem
+
+    def progresso(self, fracao=None, mensagem=None, forcar=False):
+        """Registra o andamento (no máximo a cada INTERVALO_PROGRESSO) e para se cancelada
+
+        Usa uma conexão própria: não confirma nem interfere na transação da tarefa.
+        """
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima < INTERVALO_PROGRESSO:
+            return
+        self._ultima = agora
+        valores = {'batimento': _agora()}
+        if fracao is not None:
+            valores['progresso'] = max(0.0, min(float(fracao), 1.0))
+        if mensagem is not None:
+            valores['mensagem'] = mensagem[:200]
+        try:
+            with db.engine.begin() as conexao:
+                cancelar = conexao.execute(
+                    update(_tarefas).where(_tarefas.c.id == self.tarefa_id).values(**valores)
+                    .returning(_tarefas.c.cancelar)
+                ).scalar()
+        except OperationalError:
+            # Banco ocupado pela própria tarefa ou por outra escrita: o progresso é só informativo
+            cancelar = db.session.execute(
+                select(_tarefas.c.cancelar).where(_tarefas.c.id == self.tarefa_id)).scalar()
+        if cancelar:
+            raise TarefaCancelada()
+
+class Batimento(threading.Thread):
+    """Grava o sinal de vida da tarefa enquanto ela executa (mesmo sem chamadas de progresso)"""
+    def __init__(self, app, tarefa_id):
+        super().__init__(name=f'batimento-{tarefa_id}', daemon=True)
+        self.app = app
+        self.tarefa_id = tarefa_id
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.wait(INTERVALO_BATIMENTO):
+            try:
+                with self.app.app_context(), db.engine.begin() as conexao:
+                    conexao.execute(update(_tarefas).where(_tarefas.c.id == self.tarefa_id)
+                                    .values(batimento=_agora()))
+            except OperationalError:
+                pass
+
+def _pegar_proxima(trabalhador):
+    """Marca a próxima tarefa liberada como em execução (atômico) e a devolve, ou None"""
+    agora = _agora()
+    proxima = select(_tarefas.c.id)\
+        .where(_tarefas.c.estado == PENDENTE, _tarefas.c.disponivel_em <= agora)\
+        .order_by(_tarefas.c.disponivel_em, _tarefas.c.id).limit(1).scalar_subquery()
+    linha = db.session.execute(
+        update(_tarefas).where(_tarefas.c.id == proxima, _tarefas.c.estado == PENDENTE)
+        .values(estado=EXECUTANDO, trabalhador=trabalhador, iniciado_em=agora, batimento=agora,
+                tentativas=_tarefas.c.tentativas + 1, erro=None)
+        .returning(_tarefas.c.id, _tarefas.c.tipo, _tarefas.c.parametros, _tarefas.c.tentativas,
+                   _tarefas.c.max_tentativas)
+    ).first()
+    db.session.commit()
+    return linha
+
+def _encerrar(tarefa_id, estado, parametros, **valores):
+    db.session.execute(update(_tarefas).where(_tarefas.c.id == tarefa_id)
+                       .values(estado=estado, concluido_em=_agora(), trabalhador=None, **valores))
+    db.session.commit()
+    _remover_arquivo(parametros)
+
+def _falhar(tarefa_id, parametros, erro, tentativas, max_tentativas, permanente=False):
+    """Volta a tarefa para a fila com espera exponencial, ou a encerra como falha"""
+    if permanente or tentativas >= max_tentativas:
+        _encerrar(tarefa_id, FALHOU, parametros, erro=erro, mensagem=f'Falhou na tentativa {tentativas}.')
+        return
+    espera = min(ESPERA_INICIAL * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+    db.session.execute(update(_tarefas).where(_tarefas.c.id == tarefa_id).values(
+        estado=PENDENTE, erro=erro, trabalhador=None,
+        disponivel_em=_agora() + timedelta(seconds=espera),
+        mensagem=f'Falhou na tentativa {tentativas}; nova tentativa em {espera}s.'))
+    db.session.commit()
+
+def executar_tarefa(app, linha):
+    """Executa uma tarefa já marcada como em execução e registra o desfecho"""
+    parametros = json.loads(linha.parametros or '{}')
+    definicao = _registro.get(linha.tipo)
+    if definicao is None:
+        _encerrar(linha.id, FALHOU, parametros, erro=f'Tarefa desconhecida: {linha.tipo}')
+        return
+
+    contexto = Contexto(linha.id, linha.tentativas)
+    batimento = Batimento(app, linha.id)
+    batimento.start()
+    try:
+        resultado = definicao['funcao'](contexto, **parametros)
+    except TarefaCancelada:
+        db.session.rollback()
+        _encerrar(linha.id, CANCELADA, parametros, mensagem='Cancelada durante a execução.')
+    except Exception as e:
+        db.session.rollback()
+        permanente = isinstance(e, definicao['permanentes'])
+        if not permanente:
+            app.logger.exception('Tarefa %s (%s) falhou', linha.id, linha.tipo)
+        _falhar(linha.id, parametros, str(e) or type(e).__name__, linha.tentativas, linha.max_tentativas,
+                permanente)
+    else:
+        _encerrar(linha.id, CONCLUIDA, parametros, progresso=1.0, mensagem=contexto.mensagem_final,
+                  resultado=json.dumps(resultado, default=str, ensure_ascii=False))
+    finally:
+        batimento.parar.set()
+        db.session.remove()
+
+def manter_fila():
+    """Devolve à fila as tarefas abandonadas por processos mortos e apaga as encerradas antigas"""
+    agora = _agora()
+    abandonadas = db.session.execute(
+        select(_tarefas.c.id, _tarefas.c.parametros, _tarefas.c.tentativas, _tarefas.c.max_tentativas,
+               _tarefas.c.cancelar)
+        .where(_tarefas.c.estado == EXECUTANDO, _tarefas.c.batimento < agora - TEMPO_ABANDONO)
+    ).all()
+    for linha in abandonadas:
+        parametros = json.loads(linha.parametros or '{}')
+        if linha.cancelar:
+            _encerrar(linha.id, CANCELADA, parametros, mensagem='Cancelada (trabalhador interrompido).')
+        else:
+            _falhar(linha.id, parametros, 'Trabalhador interrompido durante a execução.',
+                    linha.tentativas, linha.max_tentativas)
+
+    db.session.execute(delete(_tarefas).where(_tarefas.c.estado.in_(ENCERRADAS),
+                                              _tarefas.c.concluido_em < agora - RETENCAO))
+    db.session.commit()
+    _agendar_fechamento()
+    return len(abandonadas)
+
+def _agendar_fechamento():
+    """Enfileira o fechamento dos dias do histórico quando há dias pendentes e nenhum em andamento"""
+    if not fechamento_pendente():
+        return
+    em_andamento = db.session.execute(
+        select(_tarefas.c.id).where(_tarefas.c.tipo == 'gerar_snapshots',
+                                    _tarefas.c.estado.in_((PENDENTE, EXECUTANDO)))
+    ).first()
+    if em_andamento is None:
+        enfileirar('gerar_snapshots')
+
+def _processo_trabalhador(parar, intervalo):
+    """Laço de um processo do pool: pega, executa e repete até o aviso de parada"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # quem encerra é o processo principal, entre tarefas
+    from app import create_app
+    app = create_app()
+    trabalhador = f'{socket.gethostname()}:{os.getpid()}'
+    proxima_manutencao = 0.0
+    with app.app_context():
+        while not parar.is_set():
+            if time.monotonic() >= proxima_manutencao:
+                manter_fila()
+                proxima_manutencao = time.monotonic() + INTERVALO_MANUTENCAO
+            try:
+                linha = _pegar_proxima(trabalhador)
+            except OperationalError:
+                db.session.rollback()
+                linha = None
+            if linha is None:
+                parar.wait(intervalo)
+                continue
+            executar_tarefa(app, linha)
+
+def iniciar_trabalhadores(processos, intervalo=1.0, aviso=print):
+    """Mantém `processos` trabalhadores vivos até Ctrl+C/SIGTERM; reinicia os que morrerem"""
+    contexto = multiprocessing.get_context('spawn')
+    parar = contexto.Event()
+
+    def novo():
+        processo = contexto.Process(target=_processo_trabalhador, args=(parar, intervalo), daemon=False)
+        processo.start()
+        return processo
+
+    # O tratador só marca o pedido: acionar o Event dentro dele pode travar o laço que o espera
+    encerrar = []
+    signal.signal(signal.SIGTERM, lambda *args: encerrar.append(True))
+    filhos = [novo() for _ in range(processos)]
+    aviso(f'{processos} trabalhador(es) iniciado(s): {", ".join(str(f.pid) for f in filhos)}')
+    try:
+        while not encerrar:
+            time.sleep(1)
+            for i, filho in enumerate(filhos):
+                if not filho.is_alive() and not encerrar:
+                    aviso(f'Trabalhador {filho.pid} saiu (código {filho.exitcode}); reiniciando.')
+                    filhos[i] = novo()
+    except KeyboardInterrupt:
+        pass
+    parar.set()
+    aviso('Encerrando: aguardando as tarefas em execução...')
+    limite = time.monotonic() + TEMPO_PARADA
+    for filho in filhos:
+        filho.join(max(0, limite - time.monotonic()))
+        if filho.is_alive():
+            filho.terminate()  # a tarefa volta para a fila pelo batimento vencido
+
+# ==================== TAREFAS ====================
+
+@tarefa('importar_produtos', 'Importação do catálogo', permanentes=(ImportacaoError,))
+def tarefa_importar_produtos(contexto, arquivo, nome_arquivo):
+    tamanho = os.path.getsize(arquivo) or 1
+    with open(arquivo, 'rb') as entrada:
+        # Posição no CSV estima a fração lida; no XLSX (zip) não há como estimar. O leitor
+        # de CSV fecha o arquivo ao chegar ao fim, antes do último bloco
+        eh_csv = nome_arquivo.lower().endswith('.csv')
+
+        def progresso(parcial):
+            lido = 1.0 if entrada.closed else entrada.tell() / tamanho
+            contexto.progresso(lido if eh_csv else None,
+                               f"{parcial['linhas']} linhas: {parcial['inseridos']} criados, "
+                               f"{parcial['atualizados']} atualizados, {parcial['total_erros']} erros")
+
+        resultado = importar_produtos(entrada, nome_arquivo, progresso=progresso)
+    contexto.concluir(f"Importação concluída: {resultado['inseridos']} produto(s) criado(s) e "
+                      f"{resultado['atualizados']} atualizado(s).")
+    return resultado
+
+@tarefa('recalcular_analises', 'Recálculo das análises (curva ABC, giro, ruptura)', permanentes=(AnaliseError,))
+def tarefa_recalcular_analises(contexto, janela=JANELA_PADRAO):
+    contexto.progresso(None, f'Calculando com janela de {janela} dias...', forcar=True)
+    total = recalcular_analises(janela)
+    contexto.concluir(f'Análises recalculadas para {total} produto(s).')
+    return {'produtos': total, 'janela': janela}
+
+@tarefa('recalcular_reposicao', 'Recálculo do estoque mínimo recomendado',
+        permanentes=(ReposicaoError, AnaliseError))
+def tarefa_recalcular_reposicao(contexto, prazo, nivel_servico):
+    contexto.progresso(None, 'Calculando recomendações...', forcar=True)
+    analisados, com_diferenca = recalcular_reposicao(prazo, nivel_servico, completo=True)
+    contexto.concluir(f'{analisados} produto(s) analisado(s); {com_diferenca} com estoque mínimo '
+                      'diferente do recomendado.')
+    return {'analisados': analisados, 'com_diferenca': com_diferenca}
+
+@tarefa('reconstruir_resumo', 'Reconstrução do resumo do dashboard')
+def tarefa_reconstruir_resumo(contexto):
+    reconstruir_resumo()
+    contexto.concluir('Resumo do dashboard reconstruído.')
+    return {}
+
+@tarefa('reconstruir_alertas', 'Reconstrução dos alertas de estoque baixo')
+def tarefa_reconstruir_alertas(contexto):
+    corrigidos = corrigir_alertas()
+    contexto.concluir(f'{corrigidos} produto(s) corrigido(s).')
+    return {'corrigidos': corrigidos}
+
+@tarefa('reconstruir_snapshots', 'Reconstrução dos snapshots do histórico')
+def tarefa_reconstruir_snapshots(contexto):
+    dias = reconstruir_snapshots()
+    contexto.concluir(f'Snapshots reconstruídos: {dias} dia(s).')
+    return {'dias': dias}
+
+@tarefa('gerar_snapshots', 'Fechamento dos dias do histórico')
+def tarefa_gerar_snapshots(contexto):
+    dias = gerar_snapshots()
+    contexto.concluir(f'{dias} dia(s) fechado(s).')
+    return {'dias': dias}
+
+@tarefa('reindexar_busca', 'Reindexação da busca textual')
+def tarefa_reindexar_busca(contexto):
+    reindexar_busca()
+    contexto.concluir('Índice de busca reconstruído.')
+    return {}
+
+@tarefa('arquivar_movimentacoes', 'Arquivamento das movimentações antigas')
+def tarefa_arquivar_movimentacoes(contexto, meses_quentes=None):
+    # Cancelar entre um mês e outro é seguro: cada mês arquivado fica completo
+    meses = current_app.config['ARQUIVO_MESES_QUENTES'] if meses_quentes is None else meses_quentes
+    contexto.progresso(None, 'Procurando meses para arquivar...', forcar=True)
+    arquivados = arquivar_movimentacoes(meses, aviso=lambda periodo, linhas: contexto.progresso(
+        None, f'{periodo}: {linhas} movimentação(ões) arquivada(s).', forcar=True))
+    contexto.concluir(f'{len(arquivados)} mês(es) arquivado(s), '
+                      f'{sum(linhas for _, linhas in arquivados)} movimentação(ões).')
+    return {'meses': dict(arquivados)}
+
+# Manutenções que o administrador pode enfileirar pela página de tarefas
+MANUTENCOES = ('gerar_snapshots', 'reconstruir_resumo', 'reconstruir_alertas', 'reconstruir_snapshots', 'reindexar_busca',
+               'arquivar_movimentacoes')
+
+def descricao_tarefa(tipo):
+    return _registro[tipo]['descricao']
@@ -0,0 +1,195 @@
+"""Autenticação das APIs por token, para leitores de código de barras e integrações
+
+Cada cliente recebe um token aleatório de 256 bits, mostrado uma única vez;
+o banco guarda apenas o SHA-256 dele (digest), que também é a chave de
+busca. Por ter alta entropia, o token dispensa o hash lento usado nas senhas
+(pbkdf2): validar um request é calcular um SHA-256 e consultar um dicionário
+em memória, sem cookie de sessão nem CSRF. O cache tem TTL curto e é limpo
+no commit de qualquer alteração em tokens ou usuários.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from models.database import db, TokenApi, Usuario
+from services.sessao import UsuarioSessao
+
+PREFIXO_TOKEN = 'est_'
+ESCOPOS = {
+    'leitura': 'Leitura (consultas GET em /api)',
+    'movimentacoes': 'Registrar movimentações',
+    'metricas': 'Métricas de desempenho (/api/metricas)',
+    'tarefas': 'Acompanhar tarefas em segundo plano (/api/tarefas)',
+}
+# Consultas que exigem um escopo próprio em vez de `leitura`, por regra de URL
+ESCOPOS_RESTRITOS = {
+    '/api/metricas': 'metricas',
+    '/api/tarefas': 'tarefas',
+    '/api/tarefas/<int:id>': 'tarefas',
+}
+# Escopo exigido pelas APIs de escrita, por regra de URL; as demais escritas não aceitam token
+ESCOPOS_ESCRITA = {
+    '/api/movimentacoes/lote': 'movimentacoes',
+}
+METODOS_LEITURA = {'GET', 'HEAD', 'OPTIONS'}
+TTL_PADRAO = 60  # segundos
+MAX_ITENS = 1024
+
+_tokens = TokenApi.__table__
+_usuarios = Usuario.__table__
+
+class TokenError(ValueError):
+    """Dados inválidos para criar ou revogar um token"""
+
+class ClienteApi(UsuarioSessao):
+    """Identidade de um request autenticado por token: age como o usuário responsável, sem acesso de admin"""
+    __slots__ = ('token_id', 'cliente', 'escopos')
+
+    def __init__(self, token_id, cliente, escopos, *usuario):
+        super().__init__(*usuario)
+        self.token_id = token_id
+        self.cliente = cliente
+        self.escopos = frozenset(escopos.split(','))
+
+    def permite(self, escopo):
+        return escopo in self.escopos
+
+    def is_admin(self):
+        return False
+
+    def __repr__(self):
+        return f'<ClienteApi {self.cliente}>'
+
+def digest_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def token_da_requisicao(request):
+    """Token do cabeçalho `Authorization: Bearer ...` em rotas /api; None se não houver"""
+    if not request.path.startswith('/api/'):
+        return None
+    tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+    if tipo.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+def escopo_exigido(request):
+    regra = request.url_rule.rule if request.url_rule else None
+    if request.method in METODOS_LEITURA:
+        return ESCOPOS_RESTRITOS.get(regra, 'leitura')
+    return ESCOPOS_ESCRITA.get(regra)
+
+class CacheTokens:
+    """Clientes autenticados por digest do token, com expiração"""
+    def __init__(self, ttl=TTL_PADRAO, max_itens=MAX_ITENS):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = {}
+        self._trava = threading.Lock()
+
+    def obter(self, digest):
+        """Cliente do token ativo (de um usuário ativo) com esse digest, ou None"""
+        agora = time.monotonic()
+        with self._trava:
+            registro = self._itens.get(digest)
+            if registro and registro[1] > agora:
+                self.acertos += 1
+                return registro[0]
+            self.falhas += 1
+
+        linha = db.session.execute(
+            select(_tokens.c.id, _tokens.c.nome, _tokens.c.escopos, _usuarios.c.id, _usuarios.c.nome,
+                   _usuarios.c.email, _usuarios.c.tipo_usuario, _usuarios.c.ativo)
+            .join(_usuarios, _usuarios.c.id == _tokens.c.usuario_id)
+            .where(_tokens.c.digest == digest, _tokens.c.revogado_em.is_(None), _usuarios.c.ativo == True)
+        ).first()
+        if linha is None:
+            return None  # tokens inválidos não entram no cache
+
+        cliente = ClienteApi(*linha)
+        with self._trava:
+            if len(self._itens) >= self.max_itens:
+                self._itens.clear()
+            self._itens[digest] = (cliente, agora + self.ttl)
+        return cliente
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(self.acertos / total, 4) if total else None,
+            'ttl': self.ttl,
+        }
+
+tokens_cache = CacheTokens()
+
+# ==================== ADMINISTRAÇÃO ====================
+
+def criar_token(nome, usuario_id, escopos):
+    """Cria o token de um cliente; retorna (registro, token em claro — exibido só agora)"""
+    nome = (nome or '').strip()
+    if not nome or len(nome) > 100:
+        raise TokenError('Informe o nome do cliente (até 100 caracteres).')
+    escopos = [escopo for escopo in ESCOPOS if escopo in set(escopos or ())]
+    if not escopos:
+        raise TokenError('Selecione ao menos um escopo.')
+    usuario = db.session.get(Usuario, usuario_id) if usuario_id else None
+    if usuario is None or not usuario.ativo:
+        raise TokenError('Selecione um usuário ativo como responsável.')
+
+    token = PREFIXO_TOKEN + secrets.token_urlsafe(32)
+    registro = TokenApi(nome=nome, usuario_id=usuario.id, digest=digest_token(token),
+                        prefixo=token[:len(PREFIXO_TOKEN) + 6], escopos=','.join(escopos))
+    db.session.add(registro)
+    db.session.commit()
+    return registro, token
+
+def revogar_token(token_id):
+    revogados = db.session.execute(
+        update(_tokens).where(_tokens.c.id == token_id, _tokens.c.revogado_em.is_(None))
+        .values(revogado_em=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not revogados:
+        raise TokenError('Token não encontrado ou já revogado.')
+
+def listar_tokens():
+    return TokenApi.query.options(db.joinedload(TokenApi.usuario))\
+        .order_by(TokenApi.revogado_em.isnot(None), TokenApi.criado_em.desc()).all()
+
+# ==================== INVALIDAÇÃO ====================
+
+_TABELAS = {_tokens.name, _usuarios.name}
+
+@event.listens_for(Session, 'after_flush')
+def _apos_flush(session, contexto):
+    alterados = list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]
+    if any(isinstance(obj, (TokenApi, Usuario)) for obj in alterados):
+        session.info['tokens_alterados'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _apos_execucao_dml(estado):
+    if (estado.is_update or estado.is_delete) and \
+            getattr(getattr(estado.statement, 'table', None), 'name', None) in _TABELAS:
+        estado.session.info['tokens_alterados'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _apos_commit(session):
+    if session.info.pop('tokens_alterados', False):
+        tokens_cache.limpar()
+
+@event.listens_for(Session, 'after_rollback')
+def _apos_rollback(session):
+    session.info.pop('tokens_alterados', None)
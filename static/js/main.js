@@ -28,6 +28,12 @@ $(document).ready(function() {
     
     // Configurar navegação por teclado
     setupKeyboardNavigation();
+    
+    // Campos de produto com busca assíncrona
+    setupAutocompletarProdutos();
+    
+    // Receber alterações de estoque em tempo real
+    conectarEventos();
 });
 
 // ========== SISTEMA DE ALERTAS ==========
@@ -118,6 +124,34 @@ function renderizarAlertas(data) {
     }
 }
 
+// ========== EVENTOS EM TEMPO REAL (SSE) ==========
+// Cada evento do servidor é repassado como evento jQuery 'estoque:<tipo>' no
+// document, para que as páginas reajam (ex.: formulário de movimentação).
+function conectarEventos() {
+    if (!window.STREAM_URL || !window.EventSource) {
+        return;
+    }
+    
+    var fonte = new EventSource(window.STREAM_URL);
+    ['movimentacao', 'estoque', 'alerta'].forEach(function(tipo) {
+        fonte.addEventListener(tipo, function(e) {
+            $(document).trigger('estoque:' + tipo, [JSON.parse(e.data)]);
+        });
+    });
+}
+
+function atualizarBadgeAlertas(total) {
+    $('#alertas-badge, #alertas-badge-menu').text(total).toggle(total > 0);
+}
+
+$(document).on('estoque:alerta', function(e, dados) {
+    atualizarBadgeAlertas(dados.total_alertas);
+    // Lista de alertas aberta: recarrega para refletir a mudança
+    if ($('#alertasModal').hasClass('show')) {
+        carregarAlertas();
+    }
+});
+
 // ========== SISTEMA DE NOTIFICAÇÕES ==========
 function showNotification(title, message, type = 'info', duration = 4000) {
     type = type || 'info';
@@ -217,6 +251,107 @@ function setupConfirmActions() {
     });
 }
 
+// ========== AUTOCOMPLETAR DE PRODUTOS ==========
+// Cada [data-autocompletar-produto] tem um input de texto, um input hidden com o
+// id escolhido e um .dropdown-menu. As sugestões vêm de data-url (a API de
+// sugestões) enquanto o usuário digita; o hidden dispara 'change' ao mudar.
+function setupAutocompletarProdutos() {
+    $('[data-autocompletar-produto]').each(function() {
+        var $campo = $(this);
+        var $texto = $campo.find('input[type="text"]');
+        var $id = $campo.find('input[type="hidden"]');
+        var $menu = $campo.find('.dropdown-menu');
+        var espera = null;
+        var pedido = null;
+        var itens = [];
+        var ativo = -1;
+        
+        function definirId(valor) {
+            // Evento nativo: alcança tanto handlers do jQuery quanto addEventListener
+            $id.val(valor);
+            $id[0].dispatchEvent(new Event('change', { bubbles: true }));
+        }
+        
+        function fechar() {
+            $menu.removeClass('show').empty();
+            itens = [];
+            ativo = -1;
+        }
+        
+        function escolher(produto) {
+            $texto.val(produto.codigo + ' - ' + produto.nome).removeClass('is-invalid');
+            definirId(produto.id);
+            fechar();
+        }
+        
+        function buscar(termo, aoReceber) {
+            if (pedido) {
+                pedido.abort();
+            }
+            pedido = $.getJSON($campo.data('url'), { q: termo }).done(function(data) {
+                aoReceber(data.produtos);
+            });
+        }
+        
+        function mostrar(produtos) {
+            fechar();
+            itens = produtos;
+            if (!produtos.length) {
+                $menu.append($('<span class="dropdown-item-text text-muted small">').text('Nenhum produto encontrado'));
+            }
+            produtos.forEach(function(produto) {
+                $('<button type="button" class="dropdown-item">')
+                    .append($('<code class="me-2">').text(produto.codigo), document.createTextNode(produto.nome))
+                    .on('mousedown', function(e) {
+                        e.preventDefault();
+                        escolher(produto);
+                    })
+                    .appendTo($menu);
+            });
+            $menu.addClass('show');
+        }
+        
+        $texto.on('input', function() {
+            var termo = $.trim($texto.val());
+            if ($id.val()) {
+                definirId('');
+            }
+            clearTimeout(espera);
+            if (termo.length < 2) {
+                fechar();
+                return;
+            }
+            espera = setTimeout(function() { buscar(termo, mostrar); }, 200);
+        });
+        
+        $texto.on('keydown', function(e) {
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                if (!itens.length) {
+                    return;
+                }
+                e.preventDefault();
+                ativo = (ativo + (e.key === 'ArrowDown' ? 1 : -1) + itens.length) % itens.length;
+                $menu.children().removeClass('active').eq(ativo).addClass('active');
+            } else if (e.key === 'Enter' && !$id.val() && $.trim($texto.val()).length >= 2) {
+                // Leitor de código de barras digita o código e tecla Enter antes das sugestões
+                e.preventDefault();
+                clearTimeout(espera);
+                if (itens.length) {
+                    escolher(itens[Math.max(ativo, 0)]);
+                } else {
+                    buscar($.trim($texto.val()), function(produtos) {
+                        produtos.length ? escolher(produtos[0]) : mostrar(produtos);
+                    });
+                }
+            } else if (e.key === 'Escape') {
+                fechar();
+            }
+        });
+        
+        $texto.on('blur', fechar);
+    });
+}
+
 // ========== NAVEGAÇÃO POR TECLADO ==========
 function setupKeyboardNavigation() {
     $(document).on('keydown', function(e) {
@@ -343,10 +478,6 @@ window.addEventListener('error', function(e) {
 });
 
 // ========== ANIMAÇÃO DE SLIDE IN ==========
-.animate-slide-in {
-    animation: slideIn 0.5s ease-out;
-}
-
 // Adicionar CSS dinamicamente
 $('<style>').text(`
     @keyframes slideIn {
@@ -0,0 +1,20 @@
+import pytest
+
+from app import create_app
+from models.database import db
+from models.esquema import atualizar_esquema
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Aplicação sobre um banco SQLite temporário, com o esquema criado e sem dados"""
+    uri = f"sqlite:///{tmp_path / 'estoque.db'}"
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'DATABASE_URL_LEITURA': uri,
+                      'DB_ARQUIVO': str(tmp_path / 'arquivo.db'), 'WTF_CSRF_ENABLED': False})
+    app.instance_path = str(tmp_path)  # uploads das tarefas
+    with app.app_context():
+        atualizar_esquema()
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
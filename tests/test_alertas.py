@@ -0,0 +1,23 @@
+"""Testes da reconstrução dos alertas de estoque baixo"""
+from sqlalchemy import update
+
+from models.database import db, Produto
+from services import tarefas
+from services.alertas import contar_alertas
+from services.resumo import divergencias_resumo, reconstruir_resumo
+
+
+def test_tarefa_reconstruir_alertas_atualiza_o_resumo(app):
+    db.session.add_all([Produto(codigo=f'P{i}', nome=f'Produto {i}', estoque_minimo=10) for i in range(3)])
+    db.session.commit()
+    # Indicador divergente gravado por fora (ex.: edição manual no banco), com o resumo coerente com ele
+    db.session.execute(update(Produto).values(em_alerta=False, alerta_desde=None))
+    db.session.commit()
+    reconstruir_resumo()
+    assert contar_alertas() == 0
+
+    tarefas.enfileirar('reconstruir_alertas')
+    tarefas.executar_tarefa(app, tarefas._pegar_proxima('teste'))
+
+    assert contar_alertas() == 3
+    assert divergencias_resumo() == []
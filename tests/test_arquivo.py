@@ -0,0 +1,25 @@
+"""Testes do arquivamento das movimentações"""
+from datetime import datetime
+
+from sqlalchemy import update
+
+from models.database import db, MovimentacaoEstoque, Produto, Usuario
+from services.arquivo import arquivar_movimentacoes
+from services.movimentacoes import registrar_lote
+
+
+def test_lote_reenviado_depois_do_arquivamento_nao_duplica(app):
+    usuario = Usuario(nome='Coletor', email='coletor@teste.com', senha='coletor123')
+    produto = Produto(codigo='P1', nome='Produto 1')
+    db.session.add_all([usuario, produto])
+    db.session.commit()
+    lote = [{'produto_id': produto.id, 'tipo': 'entrada', 'quantidade': 5, 'id_cliente': 'a1'}]
+
+    assert registrar_lote(lote, usuario.id) == (1, [], [])
+    db.session.execute(update(MovimentacaoEstoque).values(data_movimentacao=datetime(2025, 1, 15)))
+    db.session.commit()
+    assert arquivar_movimentacoes(meses_quentes=6, agora=datetime(2026, 10, 1)) == [('2025-01', 1)]
+    assert MovimentacaoEstoque.query.count() == 0
+
+    assert registrar_lote(lote, usuario.id) == (0, [], [0])
+    assert db.session.get(Produto, produto.id).quantidade == 5
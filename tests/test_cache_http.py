@@ -0,0 +1,23 @@
+"""Testes das respostas condicionais das APIs"""
+from models.database import db, Usuario
+from services.tokens import criar_token
+
+
+def test_etag_da_api_varia_com_o_token(app):
+    usuario = Usuario(nome='Leitor', email='leitor@teste.com', senha='leitor123')
+    db.session.add(usuario)
+    db.session.commit()
+    _, token_a = criar_token('Coletor A', usuario.id, ['leitura'])
+    _, token_b = criar_token('Coletor B', usuario.id, ['leitura'])
+    cliente = app.test_client()
+
+    resposta_a = cliente.get('/api/produtos', headers={'Authorization': f'Bearer {token_a}'})
+    resposta_b = cliente.get('/api/produtos', headers={'Authorization': f'Bearer {token_b}',
+                                                       'If-None-Match': resposta_a.headers['ETag']})
+
+    assert resposta_a.status_code == 200
+    assert resposta_b.status_code == 200
+    assert resposta_b.headers['ETag'] != resposta_a.headers['ETag']
+    assert 'Authorization' in resposta_a.headers['Vary']
+    assert cliente.get('/api/produtos', headers={'Authorization': f'Bearer {token_a}',
+                                                 'If-None-Match': resposta_a.headers['ETag']}).status_code == 304
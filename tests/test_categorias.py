@@ -0,0 +1,37 @@
+"""Testes do filtro e da edição por categoria"""
+from models.database import db, Categoria, Produto, Usuario
+
+
+def _preparar(app):
+    informatica, papelaria = Categoria('Informática'), Categoria('Papelaria')
+    papelaria.ativo = False
+    usuario = Usuario(nome='Admin', email='admin@teste.com', senha='admin123', tipo_usuario='admin')
+    db.session.add_all([informatica, papelaria, usuario])
+    db.session.flush()
+    db.session.add_all([Produto(codigo='MOUSE', nome='Mouse', categoria_id=informatica.id),
+                        Produto(codigo='CANETA', nome='Caneta', categoria_id=papelaria.id)])
+    db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'email': 'admin@teste.com', 'senha': 'admin123'})
+    return cliente, informatica, papelaria
+
+
+def _codigos(resposta):
+    return [produto['codigo'] for produto in resposta.get_json()['produtos']]
+
+
+def test_filtro_aceita_nome_e_id_da_categoria(app):
+    cliente, informatica, _ = _preparar(app)
+
+    assert _codigos(cliente.get(f'/api/produtos?categoria={informatica.id}')) == ['MOUSE']
+    assert _codigos(cliente.get('/api/produtos?categoria=Informática')) == ['MOUSE']
+    assert _codigos(cliente.get('/api/produtos?categoria=Inexistente')) == []
+
+
+def test_editar_produto_de_categoria_desativada_mantem_a_categoria(app):
+    cliente, _, papelaria = _preparar(app)
+    produto = Produto.query.filter_by(codigo='CANETA').one()
+
+    pagina = cliente.get(f'/produto/{produto.id}/editar').get_data(as_text=True)
+
+    assert 'value="Papelaria"' in pagina
@@ -0,0 +1,34 @@
+"""Testes da importação do catálogo"""
+import io
+
+from models.database import Produto
+from services.importacao import importar_produtos
+
+
+def _importar(texto):
+    return importar_produtos(io.BytesIO(texto.encode()), 'catalogo.csv')
+
+
+def test_valores_nao_finitos_viram_erro_da_linha(app):
+    resultado = _importar('codigo,nome,estoque_minimo,preco\n'
+                          'A1,Produto A,inf,1\n'
+                          'A2,Produto B,1e400,1\n'
+                          'A3,Produto C,5,nan\n'
+                          'A4,Produto D,5,2.50\n')
+
+    assert resultado['total_erros'] == 3
+    assert [erro['linha'] for erro in resultado['erros']] == [2, 3, 4]
+    assert resultado['inseridos'] == 1
+    assert Produto.query.filter_by(codigo='A4').one().preco == 2.5
+
+
+def test_linha_csv_ilegivel_nao_interrompe_a_importacao(app):
+    resultado = _importar('codigo,nome\n'
+                          'B1,Produto A\n'
+                          f'B2,{"x" * 200000}\n'
+                          'B3,Produto C\n')
+
+    assert resultado['total_erros'] == 1
+    assert resultado['erros'][0]['linha'] == 3
+    assert 'ilegível' in resultado['erros'][0]['erro']
+    assert resultado['inseridos'] == 2
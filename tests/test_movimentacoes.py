@@ -0,0 +1,21 @@
+"""Testes de concorrência das movimentações de estoque"""
+from app import create_app
+from services.movimentacoes import verificar_concorrencia
+
+
+def test_escritores_concorrentes_nao_perdem_atualizacoes():
+    resultado = verificar_concorrencia(create_app, escritores=8, operacoes=40)
+
+    assert resultado['erros'] == []
+    assert resultado['quantidade_final'] == resultado['quantidade_esperada']
+    assert resultado['quantidade_final'] >= 0
+    assert resultado['entradas'] + resultado['saidas'] + resultado['recusadas'] == resultado['operacoes']
+    assert resultado['ok']
+
+
+def test_banco_configurado_nao_e_tocado(tmp_path, monkeypatch):
+    configurado = tmp_path / 'estoque.db'
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{configurado}')
+
+    assert verificar_concorrencia(create_app, escritores=2, operacoes=10)['ok']
+    assert not configurado.exists()
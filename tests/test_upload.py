@@ -0,0 +1,43 @@
+"""Testes do limite de tamanho dos uploads"""
+import io
+
+from models.database import db, Usuario
+
+
+def _login_admin(app):
+    usuario = Usuario(nome='Admin', email='admin@teste.com', senha='admin123', tipo_usuario='admin')
+    db.session.add(usuario)
+    db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'email': 'admin@teste.com', 'senha': 'admin123'})
+    return cliente
+
+
+def test_importacao_aceita_catalogo_acima_do_limite_geral(app):
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+    cliente = _login_admin(app)
+    catalogo = b'codigo,nome\n' + b''.join(b'C%06d,Produto %06d\n' % (i, i) for i in range(200))
+
+    resposta = cliente.post('/produtos/importar', data={'arquivo': (io.BytesIO(catalogo), 'catalogo.csv')})
+
+    assert resposta.status_code == 302
+    assert '/tarefas/' in resposta.headers['Location']
+
+
+def test_importacao_respeita_o_proprio_limite(app):
+    app.config['IMPORTACAO_MAX_BYTES'] = 1024
+    cliente = _login_admin(app)
+    catalogo = b'codigo,nome\n' + b'x' * 2048
+
+    resposta = cliente.post('/produtos/importar', data={'arquivo': (io.BytesIO(catalogo), 'catalogo.csv')})
+
+    assert resposta.status_code == 413
+
+
+def test_demais_rotas_mantem_o_limite_geral(app):
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+    cliente = _login_admin(app)
+
+    resposta = cliente.post('/produto/novo', data={'nome': 'x' * 2048})
+
+    assert resposta.status_code == 413